@@ -1,11 +1,23 @@
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, Header, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
+from typing import Optional
 from services.auth_service import AuthService
+from shared.auth import PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL, SERVICE_TOKEN, SERVICE_TOKEN_HEADER
+from shared.cache import TTLCache
 from utils.database import get_db
 from models.user import User
+import hmac
 
 security = HTTPBearer()
+# For endpoints where a service token can stand in for a user
+optional_security = HTTPBearer(auto_error=False)
+
+# Users resolved by this replica; evicted on user.updated / user.deactivated (see main.py)
+principal_cache = TTLCache(maxsize=PRINCIPAL_CACHE_SIZE, ttl=PRINCIPAL_CACHE_TTL)
+
+def invalidate_principal(user_id: int):
+    principal_cache.pop(user_id)
 
 def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
@@ -16,8 +28,22 @@ def get_current_user(
     token = credentials.credentials
     token_data = auth_service.verify_token(token)
     
-    user = db.query(User).filter(User.id == token_data.get("sub")).first()
+    user_id = int(token_data.get("sub"))
+    user = principal_cache.get(user_id)
     if user is None:
+        user = db.query(User).filter(User.id == user_id).first()
+        if user is not None:
+            # Detached copy so it can outlive this request's session
+            user = User(
+                id=user.id,
+                email=user.email,
+                name=user.name,
+                role=user.role,
+                is_active=user.is_active,
+                created_at=user.created_at
+            )
+            principal_cache.set(user_id, user)
+    if user is None or user.is_active is False:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Could not validate credentials",
@@ -35,3 +61,25 @@ def require_role(required_role: str):
             )
         return current_user
     return role_checker
+
+def require_admin_or_service(
+    service_token: Optional[str] = Header(None, alias=SERVICE_TOKEN_HEADER),
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security),
+    db: Session = Depends(get_db)
+) -> Optional[User]:
+    """Allow other services (by SERVICE_TOKEN) and admins; returns the admin, or None for a service"""
+    if SERVICE_TOKEN and service_token and hmac.compare_digest(service_token.encode(), SERVICE_TOKEN.encode()):
+        return None
+    if credentials is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    current_user = get_current_user(credentials, db)
+    if current_user.role != "ADMIN":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not enough permissions"
+        )
+    return current_user
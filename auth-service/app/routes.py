@@ -1,11 +1,24 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from datetime import timedelta
+from sqlalchemy import select
+from typing import Optional
 from services.auth_service import AuthService
 from utils.database import get_db
-from app.schemas import UserCreate, User as UserSchema, Token
-from app.dependencies import get_current_user, require_role
+from database import SessionLocal
+from app.schemas import UserCreate, UserUpdate, User as UserSchema, Token, RefreshRequest, UserBatchRequest
+from app.dependencies import get_current_user, require_role, require_admin_or_service, invalidate_principal
 from models.user import User
+from shared.pagination import keyset_query, split_page, NEXT_CURSOR_HEADER
+from shared.passwords import HasherBusyError
+from shared.codecs import json_dumps
+
+def hasher_busy() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Too many logins in progress, try again shortly",
+        headers={"Retry-After": "1"}
+    )
 
 router = APIRouter()
 
@@ -23,13 +36,16 @@ async def register(user: UserCreate, db: Session = Depends(get_db)):
             detail="Email already registered"
         )
     # Create new user
-    db_user = auth_service.create_user(
-        db=db,
-        email=user.email,
-        name=user.name,
-        password=user.password,
-        role=user.role
-    )
+    try:
+        db_user = await auth_service.create_user(
+            db=db,
+            email=user.email,
+            name=user.name,
+            password=user.password,
+            role=user.role
+        )
+    except HasherBusyError:
+        raise hasher_busy()
     
     return db_user
 
@@ -38,7 +54,10 @@ async def login(email: str, password: str, db: Session = Depends(get_db)):
     """Login user and return JWT token"""
     auth_service = AuthService()
     
-    user = auth_service.authenticate_user(db, email, password)
+    try:
+        user = await auth_service.authenticate_user(db, email, password)
+    except HasherBusyError:
+        raise hasher_busy()
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -46,19 +65,75 @@ async def login(email: str, password: str, db: Session = Depends(get_db)):
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    access_token_expires = timedelta(minutes=auth_service.access_token_expire_minutes)
-    access_token = auth_service.create_access_token(
-        data={"sub": str(user.id), "role": user.role}, 
-        expires_delta=access_token_expires
-    )
-    
-    return {"access_token": access_token, "token_type": "bearer"}
+    return auth_service.issue_tokens(db, user)
+
+@router.post("/token/refresh", response_model=Token)
+async def refresh_token(request: RefreshRequest, db: Session = Depends(get_db)):
+    """Exchange a refresh token for a new access token and refresh token, without the password"""
+    tokens = AuthService().refresh_tokens(db, request.refresh_token)
+    if tokens is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid or expired refresh token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return tokens
+
+@router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+async def logout(request: RefreshRequest, db: Session = Depends(get_db)):
+    """End the session the refresh token belongs to"""
+    AuthService().logout(db, request.refresh_token)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+@router.post("/users/{user_id}/sessions/revoke")
+async def revoke_user_sessions(
+    user_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Sign a user out everywhere (the user themselves, or an admin)"""
+    if current_user.id != user_id and current_user.role != "ADMIN":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not enough permissions")
+    return {"user_id": user_id, "revoked": AuthService().revoke_user_tokens(db, user_id)}
 
 @router.get("/me", response_model=UserSchema)
 async def read_users_me(current_user: User = Depends(get_current_user)):
     """Get current user information"""
     return current_user
 
+@router.post("/users/batch")
+async def get_users_batch(
+    request: UserBatchRequest,
+    format: str = Query("json", pattern="^(json|ndjson)$", description="ndjson streams one user per line"),
+    db: Session = Depends(get_db),
+    _: Optional[User] = Depends(require_admin_or_service)
+):
+    """
+    Look up many users at once (up to USER_BATCH_MAX_IDS ids), returning
+    only the requested fields. Ids that don't exist are listed in
+    ``missing`` (json) or simply left out (ndjson). For other services
+    (``X-Service-Token``) and admins only.
+    """
+    auth_service = AuthService()
+    try:
+        query = auth_service.users_batch_query(request.ids, request.fields, stream=format == "ndjson")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if format == "ndjson":
+        def stream_users():
+            # The request's session may be closed before the body is sent, so the stream has its own
+            if query is None:
+                return
+            with SessionLocal() as session:
+                for row in session.execute(query):
+                    yield json_dumps(row._asdict()) + "\n"
+        return StreamingResponse(stream_users(), media_type="application/x-ndjson")
+    
+    users = [row._asdict() for row in db.execute(query)] if query is not None else []
+    found = {user["id"] for user in users}
+    return {"users": users, "missing": [user_id for user_id in dict.fromkeys(request.ids) if user_id not in found]}
+
 @router.get("/users/{user_id}", response_model=UserSchema)
 async def get_user(user_id: int, db: Session = Depends(get_db)):
     """Get user by ID"""
@@ -67,10 +142,43 @@ async def get_user(user_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="User not found")
     return user
 
+@router.patch("/users/{user_id}", response_model=UserSchema)
+async def update_user(
+    user_id: int,
+    user_update: UserUpdate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_role("ADMIN"))
+):
+    """Change a user's name, role or active flag (admin only); services drop their cached copy"""
+    user = db.query(User).filter(User.id == user_id).first()
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    user = await AuthService().update_user(
+        db,
+        user,
+        name=user_update.name,
+        role=user_update.role.value if user_update.role else None,
+        is_active=user_update.is_active
+    )
+    invalidate_principal(user_id)
+    return user
+
 @router.get("/users", response_model=list[UserSchema])
-async def get_users(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    """Get all users (admin only)"""
-    users = db.query(User).offset(skip).limit(limit).all()
+async def get_users(
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """Get all users (admin only), newest first. Pass the X-Next-Cursor header back as `cursor` for the next page"""
+    try:
+        query = keyset_query(select(User), User.created_at, User.id, cursor, skip, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    users, next_cursor = split_page(db.execute(query).scalars().all(), limit)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
     return users
 
 @router.get("/")
@@ -24,6 +24,12 @@ class Settings:
     SECRET_KEY = os.getenv("SECRET_KEY", "your-super-secret-jwt-key-change-in-production")
     ALGORITHM = os.getenv("ALGORITHM", "HS256")
     ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
+    # Refresh tokens slide: each use gives a new one valid this long, up to the session maximum
+    REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "14"))
+    REFRESH_SESSION_MAX_DAYS = int(os.getenv("REFRESH_SESSION_MAX_DAYS", "90"))
+    
+    # Most ids one POST /users/batch may ask for
+    USER_BATCH_MAX_IDS = int(os.getenv("USER_BATCH_MAX_IDS", "1000"))
     
     # Service Configuration
     SERVICE_NAME = os.getenv("SERVICE_NAME", "auth-service")
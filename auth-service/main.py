@@ -1,7 +1,14 @@
 from fastapi import FastAPI
 from app.routes import router
+from app.dependencies import invalidate_principal
 from config.settings import settings
-from database import Base, engine
+from database import Base, engine, SessionLocal
+from services.auth_service import AuthService
+from shared.auth import start_principal_invalidation, user_change_listeners
+from shared.db_pool import get_pool_metrics
+from shared.migrations import run_migrations
+from shared.passwords import password_hasher
+import os
 
 app = FastAPI(
     title="Auth Service",
@@ -12,6 +19,9 @@ app = FastAPI(
 # Create database tables
 Base.metadata.create_all(bind=engine)
 
+# Apply index / schema migrations that create_all can't make on existing tables
+run_migrations(engine, "auth-service", os.path.join(os.path.dirname(__file__), "migrations"))
+
 # Include routes
 app.include_router(router)
 
@@ -20,6 +30,37 @@ app.include_router(router)
 async def health_check():
     return {"status": "healthy", "service": "auth-service"}
 
+
+@app.get("/health/db/pool")
+async def pool_metrics():
+    return {"service": "auth-service", "pools": get_pool_metrics()}
+
+
+@app.get("/health/passwords")
+async def password_metrics():
+    return {"service": "auth-service", "hasher": password_hasher.metrics()}
+
+
+@app.on_event("startup")
+async def startup_event():
+    db = SessionLocal()
+    try:
+        print(f"Purged {AuthService().purge_expired_refresh_tokens(db)} expired refresh tokens")
+    except Exception as e:
+        print(f"Refresh token cleanup error: {e}")
+    finally:
+        db.close()
+    
+    # Drop users cached by this replica when any replica changes them
+    user_change_listeners.append(invalidate_principal)
+    await start_principal_invalidation()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    password_hasher.shutdown()
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host=settings.SERVICE_HOST, port=settings.SERVICE_PORT)
@@ -0,0 +1,2 @@
+-- User list pages newest first by (created_at, id)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_users_created_at_id ON users (created_at, id);
@@ -1,26 +1,46 @@
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import List, Optional
 from jose import JWTError, jwt
+import hashlib
+import secrets
+import time
+import uuid
 from fastapi import HTTPException, status
+from sqlalchemy import select, update, delete
 from sqlalchemy.orm import Session
 from models.user import User
+from database import RefreshToken
 from config.settings import settings
+from shared.auth import TOKEN_CACHE_SIZE
+from shared.cache import TTLCache
+from shared.message_broker import get_message_broker
+from shared.passwords import password_hasher
+
+# Decoded tokens by token hash, kept until the token expires
+token_cache = TTLCache(maxsize=TOKEN_CACHE_SIZE, ttl=settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+
+# Columns other services may read through POST /users/batch
+USER_BATCH_FIELDS = ("id", "email", "name", "role", "is_active", "created_at")
+
+def hash_refresh_token(token: str) -> str:
+    """Refresh tokens are random, so a plain SHA-256 is enough to keep them out of the database"""
+    return hashlib.sha256(token.encode()).hexdigest()
 
 class AuthService:
     def __init__(self):
         self.secret_key = settings.SECRET_KEY
         self.algorithm = settings.ALGORITHM
         self.access_token_expire_minutes = settings.ACCESS_TOKEN_EXPIRE_MINUTES
+        self.refresh_token_expire_days = settings.REFRESH_TOKEN_EXPIRE_DAYS
+        self.refresh_session_max_days = settings.REFRESH_SESSION_MAX_DAYS
     
-    def verify_password(self, plain_password: str, hashed_password: str) -> bool:
-        """Verify a password against its hash"""
-        from passlib.hash import pbkdf2_sha256
-        return pbkdf2_sha256.verify(plain_password, hashed_password)
+    async def verify_password(self, plain_password: str, hashed_password: str) -> tuple:
+        """Verify a password against its hash in the hashing pool; returns (matches, rehashed or None)"""
+        return await password_hasher.verify(plain_password, hashed_password)
     
-    def get_password_hash(self, password: str) -> str:
-        """Hash a password"""
-        from passlib.hash import pbkdf2_sha256
-        return pbkdf2_sha256.hash(password)
+    async def get_password_hash(self, password: str) -> str:
+        """Hash a password in the hashing pool"""
+        return await password_hasher.hash(password)
     
     def create_access_token(self, data: dict, expires_delta: Optional[timedelta] = None) -> str:
         """Create a JWT access token"""
@@ -35,8 +55,15 @@ class AuthService:
     
     def verify_token(self, token: str) -> dict:
         """Verify and decode a JWT token"""
+        token_key = hashlib.sha256(token.encode()).hexdigest()
+        payload = token_cache.get(token_key)
+        if payload is not None:
+            return payload
         try:
             payload = jwt.decode(token, self.secret_key, algorithms=[self.algorithm])
+            expires_in = payload.get("exp", 0) - time.time()
+            if expires_in > 0:
+                token_cache.set(token_key, payload, ttl=expires_in)
             return payload
         except JWTError:
             raise HTTPException(
@@ -45,22 +72,27 @@ class AuthService:
                 headers={"WWW-Authenticate": "Bearer"},
             )
     
-    def authenticate_user(self, db: Session, email: str, password: str) -> Optional[User]:
+    async def authenticate_user(self, db: Session, email: str, password: str) -> Optional[User]:
         """Authenticate a user with email and password"""
         user = db.query(User).filter(User.email == email).first()
         if not user:
             return None
-        if not self.verify_password(password, user.hashed_password):
+        ok, new_hash = await self.verify_password(password, user.hashed_password)
+        if not ok:
             return None
+        if new_hash:
+            # Stored with other rounds than PASSWORD_HASH_ROUNDS - upgrade it now we know the password
+            user.hashed_password = new_hash
+            db.commit()
         return user
     
     def get_user_by_email(self, db: Session, email: str) -> Optional[User]:
         """Get user by email"""
         return db.query(User).filter(User.email == email).first()
     
-    def create_user(self, db: Session, email: str, name: str, password: str, role: str) -> User:
+    async def create_user(self, db: Session, email: str, name: str, password: str, role: str) -> User:
         """Create a new user"""
-        hashed_password = self.get_password_hash(password)
+        hashed_password = await self.get_password_hash(password)
         db_user = User(
             email=email,
             name=name,
@@ -71,3 +103,149 @@ class AuthService:
         db.commit()
         db.refresh(db_user)
         return db_user
+    
+    async def update_user(self, db: Session, user: User, name: Optional[str] = None, role: Optional[str] = None, is_active: Optional[bool] = None) -> User:
+        """Update a user and tell the other services to drop their cached copy"""
+        was_active = user.is_active is not False
+        if name is not None:
+            user.name = name
+        if role is not None:
+            user.role = role
+        if is_active is not None:
+            user.is_active = is_active
+        db.commit()
+        db.refresh(user)
+        
+        event_type = "user.deactivated" if was_active and user.is_active is False else "user.updated"
+        if event_type == "user.deactivated":
+            self.revoke_user_tokens(db, user.id)
+        try:
+            message_broker = await get_message_broker()
+            await message_broker.publish_event(event_type, {
+                "user_id": user.id,
+                "role": user.role,
+                "is_active": user.is_active
+            })
+        except Exception as e:
+            # Other services' caches still expire after AUTH_PRINCIPAL_CACHE_TTL
+            print(f"Could not publish {event_type} for user {user.id}: {e}")
+        return user
+    
+    def issue_tokens(self, db: Session, user: User, family_id: Optional[str] = None, session_started_at: Optional[datetime] = None) -> dict:
+        """Access token plus a new refresh token; a new family (session) unless one is given"""
+        now = datetime.utcnow()
+        session_started_at = session_started_at or now
+        refresh_token = secrets.token_urlsafe(32)
+        db.add(RefreshToken(
+            token_hash=hash_refresh_token(refresh_token),
+            user_id=user.id,
+            family_id=family_id or uuid.uuid4().hex,
+            session_started_at=session_started_at,
+            created_at=now,
+            expires_at=min(
+                now + timedelta(days=self.refresh_token_expire_days),
+                session_started_at + timedelta(days=self.refresh_session_max_days)
+            )
+        ))
+        db.commit()
+        
+        access_token = self.create_access_token(
+            data={"sub": str(user.id), "role": user.role},
+            expires_delta=timedelta(minutes=self.access_token_expire_minutes)
+        )
+        return {
+            "access_token": access_token,
+            "token_type": "bearer",
+            "refresh_token": refresh_token,
+            "expires_in": self.access_token_expire_minutes * 60
+        }
+    
+    def refresh_tokens(self, db: Session, refresh_token: str) -> Optional[dict]:
+        """
+        Swap a refresh token for a new access / refresh pair, without the
+        password. Returns None if the token is unknown, expired or revoked,
+        or its user is gone or deactivated; those are refused without being
+        rotated. A token that was already swapped is a replay: the whole
+        session is revoked.
+        """
+        stored = db.query(RefreshToken).filter(RefreshToken.token_hash == hash_refresh_token(refresh_token)).first()
+        if stored is None:
+            return None
+        
+        if stored.revoked_at is not None:
+            self._revoke_if_replayed(db, stored)
+            return None
+        now = datetime.utcnow()
+        if stored.expires_at <= now:
+            return None
+        user = db.query(User).filter(User.id == stored.user_id).first()
+        if user is None or user.is_active is False:
+            return None
+        
+        # Conditional update, so two concurrent refreshes can't both rotate the same token
+        rotated = db.execute(update(RefreshToken).where(
+            RefreshToken.id == stored.id, RefreshToken.revoked_at.is_(None)
+        ).values(revoked_at=now, replaced=True)).rowcount == 1
+        if not rotated:
+            db.rollback()
+            db.refresh(stored)
+            self._revoke_if_replayed(db, stored)
+            return None
+        return self.issue_tokens(db, user, stored.family_id, stored.session_started_at)
+    
+    def _revoke_if_replayed(self, db: Session, stored: RefreshToken):
+        """A token swapped for a successor is being used again: end its session"""
+        if stored.replaced:
+            revoked = self.revoke_family(db, stored.family_id)
+            print(f"Refresh token reuse for user {stored.user_id}; revoked {revoked} tokens of session {stored.family_id}")
+    
+    def revoke_family(self, db: Session, family_id: str) -> int:
+        """Revoke every live token of one session (logout)"""
+        result = db.execute(update(RefreshToken).where(
+            RefreshToken.family_id == family_id, RefreshToken.revoked_at.is_(None)
+        ).values(revoked_at=datetime.utcnow()))
+        db.commit()
+        return result.rowcount
+    
+    def revoke_user_tokens(self, db: Session, user_id: int) -> int:
+        """Revoke all of a user's sessions, e.g. after a password change or deactivation"""
+        result = db.execute(update(RefreshToken).where(
+            RefreshToken.user_id == user_id, RefreshToken.revoked_at.is_(None)
+        ).values(revoked_at=datetime.utcnow()))
+        db.commit()
+        return result.rowcount
+    
+    def logout(self, db: Session, refresh_token: str) -> bool:
+        stored = db.query(RefreshToken).filter(RefreshToken.token_hash == hash_refresh_token(refresh_token)).first()
+        if stored is None:
+            return False
+        self.revoke_family(db, stored.family_id)
+        return True
+    
+    def purge_expired_refresh_tokens(self, db: Session) -> int:
+        """Drop tokens past their expiry; a replayed one is then just unknown"""
+        result = db.execute(delete(RefreshToken).where(RefreshToken.expires_at < datetime.utcnow()))
+        db.commit()
+        return result.rowcount
+    
+    def users_batch_query(self, ids: List[int], fields: Optional[List[str]] = None, stream: bool = False):
+        """
+        Select of the requested fields (plus ``id``) of every user in ``ids``,
+        in one primary-key lookup; unknown ids just don't match. None if there
+        are no ids. With ``stream`` rows are fetched from the database in
+        chunks as they're consumed. Raises ValueError on bad input.
+        """
+        fields = list(dict.fromkeys(["id", *(fields or USER_BATCH_FIELDS)]))
+        unknown = [field for field in fields if field not in USER_BATCH_FIELDS]
+        if unknown:
+            raise ValueError(f"Unknown fields {unknown}; choose from {list(USER_BATCH_FIELDS)}")
+        ids = list(dict.fromkeys(ids))
+        if len(ids) > settings.USER_BATCH_MAX_IDS:
+            raise ValueError(f"At most {settings.USER_BATCH_MAX_IDS} ids per request, got {len(ids)}")
+        if not ids:
+            return None
+        
+        query = select(*[getattr(User, field) for field in fields]).where(User.id.in_(ids))
+        if stream:
+            query = query.execution_options(yield_per=500)
+        return query
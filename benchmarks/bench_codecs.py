@@ -0,0 +1,122 @@
+"""
+Event codec cost: encode/decode time and bytes per event
+
+Usage:
+    python benchmarks/bench_codecs.py --iterations 20000
+    python benchmarks/bench_codecs.py --compress-min-bytes 1024
+
+Every event shape the services publish is wrapped in the broker's event
+envelope (shared/events.py). Each shape is encoded and decoded
+with stdlib json (what publish_event used originally), orjson and msgpack,
+each both plain and zlib-compressed. Compression applies to bodies of at least
+--compress-min-bytes, as with RABBITMQ_COMPRESS_MIN_BYTES. Times are
+microseconds per event and include compression.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import zlib
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(ROOT)
+
+from shared.codecs import CODECS, JSON_CONTENT_TYPE, MSGPACK_CONTENT_TYPE, ZLIB_ENCODING, encode_event, decode_event
+from shared.events import make_envelope
+
+def order_created(items: int) -> dict:
+    return {
+        "order_id": 12345,
+        "customer_id": 42,
+        "restaurant_id": 7,
+        "total_amount": round(12.99 * items, 2),
+        "status": "PENDING_PAYMENT",
+        "delivery_address": "221B Baker Street, London",
+        "delivery_latitude": 51.5237,
+        "delivery_longitude": -0.1585,
+        "items": [
+            {"menu_item_id": i, "name": f"Menu item {i}", "quantity": 1 + i % 3, "price": 12.99}
+            for i in range(items)
+        ],
+        "created_at": "2024-01-15T12:30:45.123456"
+    }
+
+SHAPES = [
+    ("order.created/2", "order.created", order_created(2)),
+    ("order.created/20", "order.created", order_created(20)),
+    ("order.created/100", "order.created", order_created(100)),
+    ("order.confirmed", "order.confirmed", {
+        "order_id": 12345, "customer_id": 42, "restaurant_id": 7, "status": "CONFIRMED"
+    }),
+    ("payment.succeeded", "payment.succeeded", {
+        "payment_id": 981, "order_id": 12345, "amount": 25.98, "status": "SUCCEEDED",
+        "transaction_id": "txn_4f9c2a7d1e8b4c3a"
+    }),
+    ("delivery.status_changed", "delivery.status_changed", {
+        "delivery_id": 310, "order_id": 12345, "driver_id": 17, "status": "PICKED_UP",
+        "picked_up_at": "2024-01-15T12:52:10.000000"
+    }),
+]
+
+class StdlibJSONCodec:
+    content_type = JSON_CONTENT_TYPE
+
+    def encode(self, obj) -> bytes:
+        return json.dumps(obj, default=str).encode()
+
+    def decode(self, body: bytes):
+        return json.loads(body)
+
+def codecs():
+    yield "json", StdlibJSONCodec()
+    yield "orjson", CODECS[JSON_CONTENT_TYPE]
+    if MSGPACK_CONTENT_TYPE in CODECS:
+        yield "msgpack", CODECS[MSGPACK_CONTENT_TYPE]
+
+def measure(codec, body: dict, compress_min_bytes: int, iterations: int) -> tuple:
+    """Returns (encode us, decode us, bytes) per event"""
+    def encode():
+        encoded = codec.encode(body)
+        if compress_min_bytes and len(encoded) >= compress_min_bytes:
+            return zlib.compress(encoded, 1), ZLIB_ENCODING
+        return encoded, None
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        encoded, content_encoding = encode()
+    encode_us = (time.perf_counter() - start) / iterations * 1_000_000
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        payload = zlib.decompress(encoded) if content_encoding else encoded
+        codec.decode(payload)
+    decode_us = (time.perf_counter() - start) / iterations * 1_000_000
+
+    return encode_us, decode_us, len(encoded)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=10000)
+    parser.add_argument("--compress-min-bytes", type=int, default=1, help="smallest body compressed in the +zlib rows")
+    args = parser.parse_args()
+
+    if MSGPACK_CONTENT_TYPE not in CODECS:
+        print("msgpack is not installed; skipping it\n")
+
+    print(f"{'event':>24s} {'codec':>13s} {'encode us':>10s} {'decode us':>10s} {'bytes':>7s}")
+    for label, event_type, data in SHAPES:
+        body = make_envelope(event_type, data, "order-service", event_id="order-service:1042")
+        # The broker's own round trip must give the body back unchanged
+        for content_type in CODECS:
+            encoded, _, content_encoding = encode_event(body, content_type, args.compress_min_bytes)
+            assert decode_event(encoded, content_type, content_encoding) == body
+
+        for name, codec in codecs():
+            for compress_min_bytes, suffix in ((0, ""), (args.compress_min_bytes, "+zlib")):
+                encode_us, decode_us, size = measure(codec, body, compress_min_bytes, args.iterations)
+                print(f"{label:>24s} {name + suffix:>13s} {encode_us:>10.2f} {decode_us:>10.2f} {size:>7d}")
+        print()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Consumer throughput on the in-process broker
+
+Usage:
+    python benchmarks/bench_consume.py --events 20000
+    python benchmarks/bench_consume.py --events 5000 --handler-ms 2 --workers 1 8 32
+
+Events are published through MessageBroker to the in-memory backend
+(shared/memory_broker.py), so the numbers are the consumer path itself:
+decode, lane / batch scheduling, routing, lag bookkeeping and acks. No
+broker round trips are involved. Each handler sleeps --handler-ms to stand
+in for its database work.
+
+Two paths are compared:
+- subscribe: one event per handler call, on --workers keyed lanes
+- subscribe_batch: --batch events per handler call
+
+Dedupe is kept in-process (LRU only) so no database is needed.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(ROOT)
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from shared.message_broker import MessageBroker, EventRouter
+from shared.memory_broker import memory_broker
+from shared.events import EventDeduplicator
+
+class CacheOnlyDeduplicator(EventDeduplicator):
+    """The LRU half of the dedupe; the processed_events table is left out"""
+
+    async def claim_many(self, event_ids, reclaim=()):
+        claimed = {event_id for event_id in event_ids if event_id not in self._cache or event_id in reclaim}
+        for event_id in claimed:
+            self._cache.set(event_id, True)
+        return claimed
+
+    async def release_many(self, event_ids):
+        for event_id in event_ids:
+            self._cache.pop(event_id)
+
+def event(i: int) -> dict:
+    return {
+        "order_id": i,
+        "customer_id": i % 500,
+        "restaurant_id": i % 50,
+        "total_amount": 25.98,
+        "items": [{"menu_item_id": 1, "quantity": 2, "price": 12.99}]
+    }
+
+async def new_broker() -> MessageBroker:
+    memory_broker.reset()
+    broker = MessageBroker("memory://", "bench")
+    await broker.connect()
+    broker.deduplicator = CacheOnlyDeduplicator("bench")
+    return broker
+
+async def publish(broker: MessageBroker, events: int):
+    for start in range(0, events, 500):
+        await broker.publish_many([("order.created", event(i)) for i in range(start, min(start + 500, events))])
+
+async def run_subscribe(events: int, workers: int, handler_s: float) -> float:
+    broker = await new_broker()
+
+    async def handler(event_data):
+        await asyncio.sleep(handler_s)
+
+    await broker.subscribe(EventRouter({"order.created": handler}), prefetch=max(workers * 4, 32), workers=workers)
+    start = time.perf_counter()
+    await publish(broker, events)
+    await memory_broker.join(timeout=600)
+    rate = events / (time.perf_counter() - start)
+    await broker.disconnect()
+    return rate
+
+async def run_batch(events: int, batch: int, handler_s: float) -> float:
+    broker = await new_broker()
+
+    async def handler(batch_events):
+        await asyncio.sleep(handler_s)
+
+    await broker.subscribe_batch(["order.created"], handler, batch_size=batch, max_wait=0.01)
+    start = time.perf_counter()
+    await publish(broker, events)
+    await memory_broker.join(timeout=600)
+    rate = events / (time.perf_counter() - start)
+    await broker.disconnect()
+    return rate
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=10000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--batch", type=int, default=200)
+    parser.add_argument("--handler-ms", type=float, default=0.0, help="simulated work per handler call")
+    args = parser.parse_args()
+    handler_s = args.handler_ms / 1000
+
+    print(f"{'path':>16s} {'events/s':>10s}")
+    for workers in args.workers:
+        rate = await run_subscribe(args.events, workers, handler_s)
+        print(f"{f'lanes={workers}':>16s} {rate:>10.0f}")
+    rate = await run_batch(args.events, args.batch, handler_s)
+    print(f"{f'batch={args.batch}':>16s} {rate:>10.0f}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
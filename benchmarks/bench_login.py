@@ -0,0 +1,71 @@
+"""
+Login throughput and event-loop stalls for password hashing
+
+Usage:
+    python benchmarks/bench_login.py --logins 200
+    python benchmarks/bench_login.py --logins 400 --workers 1 2 4 8 --rounds 29000
+
+Each run verifies --logins passwords concurrently, the way a burst of
+POST /login requests would, while a ticker on the same event loop measures
+how late it wakes up (what /me and /health would see). "inline" is the
+original behaviour: pbkdf2 on the event loop. The other rows use
+shared.passwords.PasswordHasher with N processes (0 = a thread).
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(ROOT)
+
+from shared.passwords import PasswordHasher, hash_password, verify_password
+
+async def ticker(stop: asyncio.Event, interval: float = 0.005) -> float:
+    """Worst lateness of a timer that should fire every ``interval`` seconds"""
+    loop = asyncio.get_running_loop()
+    worst = 0.0
+    while not stop.is_set():
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        worst = max(worst, loop.time() - expected)
+    return worst
+
+async def run(logins: int, hashed: str, verify) -> tuple:
+    stop = asyncio.Event()
+    lag = asyncio.create_task(ticker(stop))
+    await asyncio.sleep(0.01)
+    start = time.perf_counter()
+    results = await asyncio.gather(*(verify("correct horse", hashed) for _ in range(logins)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    assert all(ok for ok, _ in results)
+    return logins / elapsed, await lag
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--workers", type=int, nargs="+", default=[0, 1, 2, 4])
+    parser.add_argument("--rounds", type=int, default=29000)
+    args = parser.parse_args()
+
+    hashed = hash_password("correct horse", args.rounds)
+
+    async def inline(password, stored):
+        return verify_password(password, stored, args.rounds)
+
+    print(f"{'hasher':>10s} {'logins/s':>10s} {'max loop lag ms':>16s}")
+    rate, lag = await run(args.logins, hashed, inline)
+    print(f"{'inline':>10s} {rate:>10.0f} {lag * 1000:>16.1f}")
+    for workers in args.workers:
+        hasher = PasswordHasher(workers=workers, max_pending=args.logins, rounds=args.rounds)
+        # Start the pool outside the measurement
+        await hasher.verify("correct horse", hashed)
+        rate, lag = await run(args.logins, hashed, hasher.verify)
+        hasher.shutdown()
+        label = f"pool={workers}" if workers else "thread"
+        print(f"{label:>10s} {rate:>10.0f} {lag * 1000:>16.1f}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,5 +1,5 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Header, Response, status, Query
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 import sys
 import os
@@ -7,22 +7,35 @@ import os
 # Add shared directory to path
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'shared'))
 
-from database import get_db
-from app.schemas import Restaurant, RestaurantCreate, MenuItem, MenuItemCreate
+from database import get_db, get_read_db
+from app.schemas import Restaurant, RestaurantCreate, MenuItem, MenuItemCreate, SearchResults, NearbyRestaurant
 from shared.auth import require_role, UserRole
 from services.catalog_service import CatalogService
+from services.search_service import SearchService, SEARCH_MAX_LIMIT
+from services.menu_cache import menu_cache, etag_matches, CachedBody
+from config.settings import settings
+from shared.pagination import NEXT_CURSOR_HEADER
 
 router = APIRouter()
 
+def cached_response(cached: CachedBody, if_none_match: Optional[str]) -> Response:
+    """The cached JSON body, or 304 if the client already has this version"""
+    # Clients may reuse their copy but must revalidate it every time
+    headers = {"ETag": cached.etag, "Cache-Control": "no-cache"}
+    if etag_matches(if_none_match, cached.etag):
+        menu_cache.stats["not_modified"] += 1
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=cached.body, media_type="application/json", headers=headers)
+
 @router.post("/restaurants", response_model=Restaurant)
 async def create_restaurant(
     restaurant: RestaurantCreate, 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user = Depends(require_role(UserRole.RESTAURANT))
 ):
     """Create a new restaurant"""
     catalog_service = CatalogService()
-    db_restaurant = catalog_service.create_restaurant(
+    db_restaurant = await catalog_service.create_restaurant(
         db=db,
         restaurant=restaurant,
         owner_id=current_user.id
@@ -31,26 +44,65 @@ async def create_restaurant(
 
 @router.get("/restaurants", response_model=List[Restaurant])
 async def get_restaurants(
+    response: Response,
     skip: int = 0, 
     limit: int = 100, 
     search: Optional[str] = None,
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_db)
 ):
-    """Get all active restaurants"""
+    """Get all active restaurants, newest first. Pass the X-Next-Cursor header back as `cursor` for the next page"""
     catalog_service = CatalogService()
-    restaurants = catalog_service.get_restaurants(
-        db=db,
-        skip=skip,
-        limit=limit,
-        search=search
-    )
+    try:
+        restaurants, next_cursor = await catalog_service.get_restaurants(
+            db=db,
+            skip=skip,
+            limit=limit,
+            search=search,
+            cursor=cursor
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return restaurants
+
+@router.get("/restaurants/nearby", response_model=List[NearbyRestaurant])
+async def get_nearby_restaurants(
+    response: Response,
+    latitude: float = Query(..., ge=-90, le=90),
+    longitude: float = Query(..., ge=-180, le=180),
+    radius_km: float = Query(5.0, gt=0, le=settings.NEARBY_MAX_RADIUS_KM),
+    limit: int = Query(20, ge=1, le=100),
+    search: Optional[str] = None,
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_db)
+):
+    """Active restaurants within radius_km of a point, nearest first. Pass the X-Next-Cursor header back as `cursor` for the next page"""
+    catalog_service = CatalogService()
+    try:
+        restaurants, next_cursor = await catalog_service.get_nearby_restaurants(
+            db=db,
+            latitude=latitude,
+            longitude=longitude,
+            radius_km=radius_km,
+            limit=limit,
+            search=search,
+            cursor=cursor
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
     return restaurants
 
 @router.get("/restaurants/{restaurant_id}", response_model=Restaurant)
-async def get_restaurant(restaurant_id: int, db: Session = Depends(get_db)):
+async def get_restaurant(restaurant_id: int, db: AsyncSession = Depends(get_read_db)):
     """Get restaurant by ID"""
     catalog_service = CatalogService()
-    restaurant = catalog_service.get_restaurant_by_id(db, restaurant_id)
+    restaurant = await catalog_service.get_restaurant_by_id(db, restaurant_id)
     if not restaurant:
         raise HTTPException(status_code=404, detail="Restaurant not found")
     return restaurant
@@ -59,21 +111,21 @@ async def get_restaurant(restaurant_id: int, db: Session = Depends(get_db)):
 async def update_restaurant(
     restaurant_id: int,
     restaurant: RestaurantCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user = Depends(require_role(UserRole.RESTAURANT))
 ):
     """Update restaurant"""
     catalog_service = CatalogService()
     
     # Verify ownership
-    db_restaurant = catalog_service.get_restaurant_by_id(db, restaurant_id)
+    db_restaurant = await catalog_service.get_restaurant_by_id(db, restaurant_id)
     if not db_restaurant:
         raise HTTPException(status_code=404, detail="Restaurant not found")
     
     if db_restaurant.owner_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized to update this restaurant")
     
-    updated_restaurant = catalog_service.update_restaurant(
+    updated_restaurant = await catalog_service.update_restaurant(
         db=db,
         restaurant_id=restaurant_id,
         restaurant=restaurant
@@ -83,42 +135,42 @@ async def update_restaurant(
 @router.delete("/restaurants/{restaurant_id}")
 async def delete_restaurant(
     restaurant_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user = Depends(require_role(UserRole.RESTAURANT))
 ):
     """Deactivate restaurant"""
     catalog_service = CatalogService()
     
     # Verify ownership
-    db_restaurant = catalog_service.get_restaurant_by_id(db, restaurant_id)
+    db_restaurant = await catalog_service.get_restaurant_by_id(db, restaurant_id)
     if not db_restaurant:
         raise HTTPException(status_code=404, detail="Restaurant not found")
     
     if db_restaurant.owner_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized to delete this restaurant")
     
-    catalog_service.delete_restaurant(db, restaurant_id)
+    await catalog_service.delete_restaurant(db, restaurant_id)
     return {"message": "Restaurant deactivated"}
 
 @router.post("/restaurants/{restaurant_id}/menu-items", response_model=MenuItem)
 async def create_menu_item(
     restaurant_id: int,
     menu_item: MenuItemCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user = Depends(require_role(UserRole.RESTAURANT))
 ):
     """Create a new menu item"""
     catalog_service = CatalogService()
     
     # Verify restaurant ownership
-    restaurant = catalog_service.get_restaurant_by_id(db, restaurant_id)
+    restaurant = await catalog_service.get_restaurant_by_id(db, restaurant_id)
     if not restaurant:
         raise HTTPException(status_code=404, detail="Restaurant not found")
     
     if restaurant.owner_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized to add menu items to this restaurant")
     
-    db_menu_item = catalog_service.create_menu_item(
+    db_menu_item = await catalog_service.create_menu_item(
         db=db,
         restaurant_id=restaurant_id,
         menu_item=menu_item
@@ -129,46 +181,52 @@ async def create_menu_item(
 async def get_menu_items(
     restaurant_id: int,
     category: Optional[str] = None,
-    db: Session = Depends(get_db)
+    if_none_match: Optional[str] = Header(None),
+    # Misses read the primary: a lagging replica could cache a menu from before a write
+    db: AsyncSession = Depends(get_db)
 ):
-    """Get menu items for a restaurant"""
+    """Get menu items for a restaurant. Send the ETag back in If-None-Match to get 304 if unchanged"""
     catalog_service = CatalogService()
-    menu_items = catalog_service.get_menu_items(
+    cached = await catalog_service.get_menu_items_cached(
         db=db,
         restaurant_id=restaurant_id,
         category=category
     )
-    return menu_items
+    return cached_response(cached, if_none_match)
 
 @router.get("/menu-items/{menu_item_id}", response_model=MenuItem)
-async def get_menu_item(menu_item_id: int, db: Session = Depends(get_db)):
-    """Get menu item by ID"""
+async def get_menu_item(
+    menu_item_id: int,
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db)
+):
+    """Get menu item by ID. Send the ETag back in If-None-Match to get 304 if unchanged"""
     catalog_service = CatalogService()
-    menu_item = catalog_service.get_menu_item_by_id(db, menu_item_id)
-    if not menu_item:
+    cached = await catalog_service.get_menu_item_cached(db, menu_item_id)
+    if not cached:
         raise HTTPException(status_code=404, detail="Menu item not found")
-    return menu_item
+    return cached_response(cached, if_none_match)
 
 @router.put("/menu-items/{menu_item_id}", response_model=MenuItem)
 async def update_menu_item(
     menu_item_id: int,
     menu_item: MenuItemCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user = Depends(require_role(UserRole.RESTAURANT))
 ):
     """Update menu item"""
     catalog_service = CatalogService()
     
-    db_menu_item = catalog_service.get_menu_item_by_id(db, menu_item_id)
+    db_menu_item = await catalog_service.get_menu_item_by_id(db, menu_item_id)
     if not db_menu_item:
         raise HTTPException(status_code=404, detail="Menu item not found")
     
     # Verify restaurant ownership
-    restaurant = catalog_service.get_restaurant_by_id(db, db_menu_item.restaurant_id)
+    restaurant = await catalog_service.get_restaurant_by_id(db, db_menu_item.restaurant_id)
     if restaurant.owner_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized to update this menu item")
     
-    updated_item = catalog_service.update_menu_item(
+    updated_item = await catalog_service.update_menu_item(
         db=db,
         menu_item_id=menu_item_id,
         menu_item=menu_item
@@ -178,24 +236,46 @@ async def update_menu_item(
 @router.delete("/menu-items/{menu_item_id}")
 async def delete_menu_item(
     menu_item_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user = Depends(require_role(UserRole.RESTAURANT))
 ):
     """Deactivate menu item"""
     catalog_service = CatalogService()
     
-    db_menu_item = catalog_service.get_menu_item_by_id(db, menu_item_id)
+    db_menu_item = await catalog_service.get_menu_item_by_id(db, menu_item_id)
     if not db_menu_item:
         raise HTTPException(status_code=404, detail="Menu item not found")
     
     # Verify restaurant ownership
-    restaurant = catalog_service.get_restaurant_by_id(db, db_menu_item.restaurant_id)
+    restaurant = await catalog_service.get_restaurant_by_id(db, db_menu_item.restaurant_id)
     if restaurant.owner_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized to delete this menu item")
     
-    catalog_service.delete_menu_item(db, menu_item_id)
+    await catalog_service.delete_menu_item(db, menu_item_id)
     return {"message": "Menu item deactivated"}
 
+@router.get("/search", response_model=SearchResults)
+async def search(
+    q: str = Query(..., min_length=1, max_length=200),
+    type: str = Query("all", description="all, restaurants or menu_items"),
+    limit: int = Query(20, ge=1, le=SEARCH_MAX_LIMIT),
+    restaurant_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_read_db)
+):
+    """Search restaurants and dishes by name, category and description, best matches first. Tolerates typos"""
+    search_service = SearchService()
+    try:
+        results = await search_service.search(
+            db=db,
+            q=q,
+            search_type=type,
+            limit=limit,
+            restaurant_id=restaurant_id
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"query": q, **results}
+
 @router.get("/health")
 async def health_check():
     return {"status": "healthy", "service": "catalog-service"}
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 
 class RestaurantBase(BaseModel):
@@ -22,6 +22,9 @@ class Restaurant(RestaurantBase):
     class Config:
         from_attributes = True
 
+class NearbyRestaurant(Restaurant):
+    distance_km: float
+
 class MenuItemBase(BaseModel):
     name: str
     description: Optional[str] = None
@@ -40,3 +43,27 @@ class MenuItem(MenuItemBase):
     class Config:
         from_attributes = True
 
+
+class RestaurantSearchResult(BaseModel):
+    id: int
+    name: str
+    description: Optional[str] = None
+    address: Optional[str] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    score: float
+
+class MenuItemSearchResult(BaseModel):
+    id: int
+    name: str
+    description: Optional[str] = None
+    category: Optional[str] = None
+    price: float
+    restaurant_id: int
+    restaurant_name: str
+    score: float
+
+class SearchResults(BaseModel):
+    query: str
+    restaurants: List[RestaurantSearchResult] = []
+    menu_items: List[MenuItemSearchResult] = []
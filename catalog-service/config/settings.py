@@ -18,6 +18,9 @@ class Settings:
     SERVICE_PORT = int(os.getenv("SERVICE_PORT", "8002"))
     SERVICE_HOST = os.getenv("SERVICE_HOST", "0.0.0.0")
     
+    # Largest radius GET /restaurants/nearby accepts
+    NEARBY_MAX_RADIUS_KM = float(os.getenv("NEARBY_MAX_RADIUS_KM", "50"))
+    
     # Logging
     LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
 
@@ -2,6 +2,11 @@ from fastapi import FastAPI
 from app.routes import router
 from config.settings import settings
 from database import Base, engine
+from shared.db_pool import get_pool_metrics
+from shared.migrations import run_migrations
+from shared.auth import start_principal_invalidation
+from services.menu_cache import menu_cache, start_menu_cache_invalidation
+import os
 
 app = FastAPI(
     title="Catalog Service",
@@ -12,6 +17,9 @@ app = FastAPI(
 # Create database tables
 Base.metadata.create_all(bind=engine)
 
+# Apply index / schema migrations that create_all can't make on existing tables
+run_migrations(engine, "catalog-service", os.path.join(os.path.dirname(__file__), "migrations"))
+
 # Include routes
 app.include_router(router)
 
@@ -19,6 +27,21 @@ app.include_router(router)
 async def health_check():
     return {"status": "healthy", "service": "catalog-service"}
 
+@app.get("/health/db/pool")
+async def pool_metrics():
+    return {"service": "catalog-service", "pools": get_pool_metrics()}
+
+@app.get("/health/menu-cache")
+async def menu_cache_metrics():
+    return {"service": "catalog-service", "menu_cache": menu_cache.metrics()}
+
+@app.on_event("startup")
+async def startup_event():
+    # Drop cached users when the auth service reports a change
+    await start_principal_invalidation()
+    # Drop cached menus when another replica changes them
+    await start_menu_cache_invalidation()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host=settings.SERVICE_HOST, port=settings.SERVICE_PORT)
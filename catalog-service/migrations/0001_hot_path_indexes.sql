@@ -0,0 +1,2 @@
+-- Menu listing by restaurant and category
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_menu_items_restaurant_id_category ON menu_items (restaurant_id, category);
@@ -0,0 +1,2 @@
+-- Active restaurant list pages newest first by (created_at, id)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_restaurants_is_active_created_at ON restaurants (is_active, created_at, id);
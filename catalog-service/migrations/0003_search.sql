@@ -0,0 +1,18 @@
+-- Full-text and fuzzy search (GET /search)
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+-- Weighted document per row: name ranks above category, category above description.
+-- Adding a stored generated column rewrites the table once, under an exclusive lock.
+ALTER TABLE restaurants ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+    setweight(to_tsvector('english', coalesce(name, '')), 'A') ||
+    setweight(to_tsvector('english', coalesce(description, '')), 'B')
+) STORED;
+ALTER TABLE menu_items ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+    setweight(to_tsvector('english', coalesce(name, '')), 'A') ||
+    setweight(to_tsvector('english', coalesce(category, '')), 'B') ||
+    setweight(to_tsvector('english', coalesce(description, '')), 'C')
+) STORED;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_restaurants_search_vector ON restaurants USING gin (search_vector);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_menu_items_search_vector ON menu_items USING gin (search_vector);
+-- Trigram indexes serve typo-tolerant name matches (name % query) and substring ILIKE
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_restaurants_name_trgm ON restaurants USING gin (name gin_trgm_ops);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_menu_items_name_trgm ON menu_items USING gin (name gin_trgm_ops);
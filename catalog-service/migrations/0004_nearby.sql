@@ -0,0 +1,12 @@
+-- Nearby restaurants: bounding-box prefilter on active restaurants' coordinates
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_restaurants_is_active_latitude_longitude ON restaurants (is_active, latitude, longitude);
+-- With PostGIS installed, a geography index answers ST_DWithin instead.
+-- Not CONCURRENTLY: that can't run inside a DO block.
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'postgis') THEN
+        EXECUTE 'CREATE INDEX IF NOT EXISTS ix_restaurants_geography ON restaurants '
+                'USING gist ((geography(ST_SetSRID(ST_MakePoint(longitude, latitude), 4326))))';
+    END IF;
+END
+$$;
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Float, Text, ForeignKey
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Float, Text, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import sys
@@ -11,6 +11,10 @@ from shared.database import Base
 
 class MenuItem(Base):
     __tablename__ = "menu_items"
+    __table_args__ = (
+        # Menu listing filters by restaurant and optionally by category
+        Index("ix_menu_items_restaurant_id_category", "restaurant_id", "category"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, index=True)
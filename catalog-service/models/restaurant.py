@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Float, Text, ForeignKey
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Float, Text, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import sys
@@ -11,6 +11,12 @@ from shared.database import Base
 
 class Restaurant(Base):
     __tablename__ = "restaurants"
+    __table_args__ = (
+        # Active restaurant list pages newest first by (created_at, id)
+        Index("ix_restaurants_is_active_created_at", "is_active", "created_at", "id"),
+        # Nearby search prefilters active restaurants on a latitude / longitude box
+        Index("ix_restaurants_is_active_latitude_longitude", "is_active", "latitude", "longitude"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, index=True)
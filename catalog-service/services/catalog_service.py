@@ -1,14 +1,47 @@
-from sqlalchemy.orm import Session
-from typing import Optional, List
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, or_, and_, func, literal_column, text, tuple_
+from typing import Optional, List, Tuple
 from database import Restaurant, MenuItem
-from app.schemas import RestaurantCreate, MenuItemCreate
+from pydantic import TypeAdapter
+from app.schemas import RestaurantCreate, MenuItemCreate, MenuItem as MenuItemSchema
+from shared.pagination import keyset_query, split_page, encode_distance_cursor, decode_distance_cursor
+from shared.geo import EARTH_RADIUS_KM, bounding_box, haversine_km
+from services.search_service import restaurant_match
+from services.menu_cache import menu_cache, publish_catalog_event, CachedBody
+
+# Must match the expression of ix_restaurants_geography (migrations/0004_nearby.sql)
+RESTAURANT_GEOGRAPHY = literal_column(
+    "geography(ST_SetSRID(ST_MakePoint(restaurants.longitude, restaurants.latitude), 4326))"
+)
+
+MENU_ITEMS_JSON = TypeAdapter(List[MenuItemSchema])
+MENU_ITEM_JSON = TypeAdapter(MenuItemSchema)
+
+# Whether this database has the PostGIS index; looked up once per process
+_postgis_index: Optional[bool] = None
+
+async def has_postgis_index(db: AsyncSession) -> bool:
+    global _postgis_index
+    if _postgis_index is None:
+        _postgis_index = bool(await db.scalar(text("SELECT to_regclass('ix_restaurants_geography') IS NOT NULL")))
+    return _postgis_index
+
+def haversine_sql(latitude: float, longitude: float):
+    """Great-circle distance in km from a point to each restaurant, as SQL"""
+    dlat = func.radians(Restaurant.latitude - latitude) * 0.5
+    dlon = func.radians(Restaurant.longitude - longitude) * 0.5
+    a = (
+        func.power(func.sin(dlat), 2)
+        + func.cos(func.radians(latitude)) * func.cos(func.radians(Restaurant.latitude)) * func.power(func.sin(dlon), 2)
+    )
+    return 2 * EARTH_RADIUS_KM * func.asin(func.sqrt(func.least(a, 1.0)))
 
 class CatalogService:
     """Service for managing restaurants and menu items"""
     
-    def create_restaurant(
+    async def create_restaurant(
         self, 
-        db: Session, 
+        db: AsyncSession, 
         restaurant: RestaurantCreate, 
         owner_id: int
     ) -> Restaurant:
@@ -23,66 +56,152 @@ class CatalogService:
             owner_id=owner_id
         )
         db.add(db_restaurant)
-        db.commit()
-        db.refresh(db_restaurant)
+        await db.commit()
+        await db.refresh(db_restaurant)
         return db_restaurant
     
-    def get_restaurants(
+    async def get_restaurants(
         self, 
-        db: Session, 
+        db: AsyncSession, 
         skip: int = 0, 
         limit: int = 100,
-        search: Optional[str] = None
-    ) -> List[Restaurant]:
-        """Get all active restaurants"""
-        query = db.query(Restaurant).filter(Restaurant.is_active == True)
+        search: Optional[str] = None,
+        cursor: Optional[str] = None
+    ) -> Tuple[List[Restaurant], Optional[str]]:
+        """Get a page of active restaurants (newest first) plus the next cursor"""
+        query = select(Restaurant).filter(Restaurant.is_active == True)
+        
+        if search:
+            query = query.filter(self._search_filter(db, search))
         
+        query = keyset_query(query, Restaurant.created_at, Restaurant.id, cursor, skip, limit)
+        result = await db.execute(query)
+        return split_page(result.scalars().all(), limit)
+    
+    def _search_filter(self, db: AsyncSession, search: str):
+        substring = Restaurant.name.ilike(f"%{search}%")
+        if db.get_bind().dialect.name == "postgresql":
+            # The trigram index serves the ILIKE too; words and typos match on top of it
+            return or_(substring, restaurant_match(search))
+        return substring
+    
+    async def get_nearby_restaurants(
+        self,
+        db: AsyncSession,
+        latitude: float,
+        longitude: float,
+        radius_km: float = 5.0,
+        limit: int = 20,
+        search: Optional[str] = None,
+        cursor: Optional[str] = None
+    ) -> Tuple[List[Restaurant], Optional[str]]:
+        """
+        Active restaurants within ``radius_km``, nearest first, plus the next
+        cursor. Each restaurant gets a ``distance_km`` attribute.
+        """
+        after = decode_distance_cursor(cursor) if cursor else None
+        query = select(Restaurant).filter(Restaurant.is_active == True)
         if search:
-            query = query.filter(Restaurant.name.ilike(f"%{search}%"))
+            query = query.filter(self._search_filter(db, search))
         
-        return query.offset(skip).limit(limit).all()
+        if db.get_bind().dialect.name != "postgresql":
+            return await self._nearby_in_python(db, query, latitude, longitude, radius_km, limit, after)
+        
+        if await has_postgis_index(db):
+            point = func.geography(func.ST_SetSRID(func.ST_MakePoint(longitude, latitude), 4326))
+            distance = func.ST_Distance(RESTAURANT_GEOGRAPHY, point) / 1000
+            query = query.filter(func.ST_DWithin(RESTAURANT_GEOGRAPHY, point, radius_km * 1000))
+        else:
+            distance = haversine_sql(latitude, longitude)
+            query = query.filter(self._box_filter(latitude, longitude, radius_km), distance <= radius_km)
+        
+        if after:
+            query = query.filter(tuple_(distance, Restaurant.id) > tuple_(*after))
+        result = await db.execute(
+            query.add_columns(distance.label("distance_km")).order_by(distance, Restaurant.id).limit(limit + 1)
+        )
+        rows = result.all()
+        for restaurant, distance_km in rows:
+            restaurant.distance_km = distance_km
+        return self._distance_page([restaurant for restaurant, _ in rows], limit)
     
-    def get_restaurant_by_id(self, db: Session, restaurant_id: int) -> Optional[Restaurant]:
+    def _box_filter(self, latitude: float, longitude: float, radius_km: float):
+        """Coordinate ranges around the point, served by ix_restaurants_is_active_latitude_longitude"""
+        min_lat, max_lat, lon_ranges = bounding_box(latitude, longitude, radius_km)
+        return and_(
+            Restaurant.latitude.between(min_lat, max_lat),
+            or_(*[Restaurant.longitude.between(min_lon, max_lon) for min_lon, max_lon in lon_ranges])
+        )
+    
+    async def _nearby_in_python(
+        self,
+        db: AsyncSession,
+        query,
+        latitude: float,
+        longitude: float,
+        radius_km: float,
+        limit: int,
+        after: Optional[Tuple[float, int]]
+    ) -> Tuple[List[Restaurant], Optional[str]]:
+        # Databases without trigonometric functions: prefilter on the box, measure here
+        result = await db.execute(query.filter(self._box_filter(latitude, longitude, radius_km)))
+        nearby = []
+        for restaurant in result.scalars():
+            restaurant.distance_km = haversine_km(latitude, longitude, restaurant.latitude, restaurant.longitude)
+            if restaurant.distance_km <= radius_km and (not after or (restaurant.distance_km, restaurant.id) > after):
+                nearby.append(restaurant)
+        nearby.sort(key=lambda restaurant: (restaurant.distance_km, restaurant.id))
+        return self._distance_page(nearby[:limit + 1], limit)
+    
+    def _distance_page(self, rows: List[Restaurant], limit: int) -> Tuple[List[Restaurant], Optional[str]]:
+        if len(rows) <= limit:
+            return rows, None
+        page = rows[:limit]
+        return page, encode_distance_cursor(page[-1].distance_km, page[-1].id)
+    
+    async def get_restaurant_by_id(self, db: AsyncSession, restaurant_id: int) -> Optional[Restaurant]:
         """Get restaurant by ID"""
-        return db.query(Restaurant).filter(Restaurant.id == restaurant_id).first()
+        return await db.get(Restaurant, restaurant_id)
     
-    def update_restaurant(
+    async def update_restaurant(
         self, 
-        db: Session, 
+        db: AsyncSession, 
         restaurant_id: int, 
         restaurant: RestaurantCreate
     ) -> Optional[Restaurant]:
         """Update restaurant"""
-        db_restaurant = db.query(Restaurant).filter(Restaurant.id == restaurant_id).first()
+        db_restaurant = await db.get(Restaurant, restaurant_id)
         if not db_restaurant:
             return None
         
         for field, value in restaurant.dict().items():
             setattr(db_restaurant, field, value)
         
-        db.commit()
-        db.refresh(db_restaurant)
+        await db.commit()
+        await db.refresh(db_restaurant)
+        await publish_catalog_event("catalog.restaurant_updated", {"restaurant_id": restaurant_id})
         return db_restaurant
     
-    def delete_restaurant(self, db: Session, restaurant_id: int) -> bool:
+    async def delete_restaurant(self, db: AsyncSession, restaurant_id: int) -> bool:
         """Deactivate restaurant"""
-        db_restaurant = db.query(Restaurant).filter(Restaurant.id == restaurant_id).first()
+        db_restaurant = await db.get(Restaurant, restaurant_id)
         if not db_restaurant:
             return False
         
         db_restaurant.is_active = False
-        db.commit()
+        await db.commit()
+        await publish_catalog_event("catalog.restaurant_deleted", {"restaurant_id": restaurant_id})
         return True
     
-    def create_menu_item(
+    async def create_menu_item(
         self, 
-        db: Session, 
+        db: AsyncSession, 
         restaurant_id: int, 
         menu_item: MenuItemCreate
     ) -> Optional[MenuItem]:
         """Create a new menu item"""
         # Verify restaurant exists
-        restaurant = db.query(Restaurant).filter(Restaurant.id == restaurant_id).first()
+        restaurant = await db.get(Restaurant, restaurant_id)
         if not restaurant:
             return None
         
@@ -95,53 +214,97 @@ class CatalogService:
             is_available=menu_item.is_available
         )
         db.add(db_menu_item)
-        db.commit()
-        db.refresh(db_menu_item)
+        await db.commit()
+        await db.refresh(db_menu_item)
+        await publish_catalog_event("catalog.menu_item_created", {
+            "restaurant_id": restaurant_id,
+            "menu_item_id": db_menu_item.id
+        })
         return db_menu_item
     
-    def get_menu_items(
+    async def get_menu_items(
         self, 
-        db: Session, 
+        db: AsyncSession, 
         restaurant_id: int, 
         category: Optional[str] = None
     ) -> List[MenuItem]:
         """Get menu items for a restaurant"""
-        query = db.query(MenuItem).filter(MenuItem.restaurant_id == restaurant_id)
+        query = select(MenuItem).filter(MenuItem.restaurant_id == restaurant_id)
         
         if category:
             query = query.filter(MenuItem.category == category)
         
-        return query.all()
+        result = await db.execute(query)
+        return result.scalars().all()
     
-    def get_menu_item_by_id(self, db: Session, menu_item_id: int) -> Optional[MenuItem]:
+    async def get_menu_item_by_id(self, db: AsyncSession, menu_item_id: int) -> Optional[MenuItem]:
         """Get menu item by ID"""
-        return db.query(MenuItem).filter(MenuItem.id == menu_item_id).first()
+        return await db.get(MenuItem, menu_item_id)
+    
+    async def get_menu_items_cached(
+        self, 
+        db: AsyncSession, 
+        restaurant_id: int, 
+        category: Optional[str] = None
+    ) -> CachedBody:
+        """Serialized menu for a restaurant, from the menu cache when possible"""
+        key = ("menu", restaurant_id, category)
+        cached = menu_cache.get(key)
+        if cached is not None:
+            return cached
+        
+        token = menu_cache.token()
+        menu_items = await self.get_menu_items(db, restaurant_id, category)
+        body = MENU_ITEMS_JSON.dump_json(MENU_ITEMS_JSON.validate_python(menu_items, from_attributes=True))
+        return menu_cache.set(key, body, restaurant_id, token)
+    
+    async def get_menu_item_cached(self, db: AsyncSession, menu_item_id: int) -> Optional[CachedBody]:
+        """Serialized menu item, from the menu cache when possible; None if it doesn't exist"""
+        key = ("item", menu_item_id)
+        cached = menu_cache.get(key)
+        if cached is not None:
+            return cached
+        
+        token = menu_cache.token()
+        menu_item = await self.get_menu_item_by_id(db, menu_item_id)
+        if not menu_item:
+            return None
+        body = MENU_ITEM_JSON.dump_json(MENU_ITEM_JSON.validate_python(menu_item, from_attributes=True))
+        return menu_cache.set(key, body, menu_item.restaurant_id, token)
     
-    def update_menu_item(
+    async def update_menu_item(
         self, 
-        db: Session, 
+        db: AsyncSession, 
         menu_item_id: int, 
         menu_item: MenuItemCreate
     ) -> Optional[MenuItem]:
         """Update menu item"""
-        db_menu_item = db.query(MenuItem).filter(MenuItem.id == menu_item_id).first()
+        db_menu_item = await db.get(MenuItem, menu_item_id)
         if not db_menu_item:
             return None
         
         for field, value in menu_item.dict().items():
             setattr(db_menu_item, field, value)
         
-        db.commit()
-        db.refresh(db_menu_item)
+        await db.commit()
+        await db.refresh(db_menu_item)
+        await publish_catalog_event("catalog.menu_item_updated", {
+            "restaurant_id": db_menu_item.restaurant_id,
+            "menu_item_id": menu_item_id
+        })
         return db_menu_item
     
-    def delete_menu_item(self, db: Session, menu_item_id: int) -> bool:
+    async def delete_menu_item(self, db: AsyncSession, menu_item_id: int) -> bool:
         """Deactivate menu item"""
-        db_menu_item = db.query(MenuItem).filter(MenuItem.id == menu_item_id).first()
+        db_menu_item = await db.get(MenuItem, menu_item_id)
         if not db_menu_item:
             return False
         
         db_menu_item.is_available = False
-        db.commit()
+        await db.commit()
+        await publish_catalog_event("catalog.menu_item_deleted", {
+            "restaurant_id": db_menu_item.restaurant_id,
+            "menu_item_id": menu_item_id
+        })
         return True
 
@@ -0,0 +1,128 @@
+"""
+Read-through cache for menus, with ETags
+
+``GET /restaurants/{id}/menu-items`` (per restaurant and category) and
+``GET /menu-items/{id}`` keep the serialized JSON body of each response in a
+per-process LRU with a TTL. A strong ETag (hash of the body) goes out with
+every response. A client that sends it back in ``If-None-Match`` gets a 304
+without a body, and on a cache hit the database isn't touched at all.
+
+Every cached body belongs to a restaurant. Invalidating a restaurant stamps
+it with the next value of a counter, and entries read before that stamp
+count as misses, so all of its menus and items drop at once. A miss takes
+the counter before reading the database, so a write that lands during the
+read can't leave the old menu cached.
+
+Writes (menu items created / updated / deactivated, restaurant updated /
+deactivated) invalidate this process's cache and publish a ``catalog.*``
+event. Every catalog replica listens on a broadcast queue and evicts the
+restaurant too. Without RabbitMQ, other replicas catch up after
+``MENU_CACHE_TTL``.
+"""
+from dataclasses import dataclass
+from typing import Any, Dict, Hashable, Optional
+from shared.cache import TTLCache
+from shared.message_broker import get_message_broker
+import hashlib
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+MENU_CACHE_SIZE = int(os.getenv("MENU_CACHE_SIZE", "10000"))
+# Upper bound on staleness when a replica misses an invalidation event
+MENU_CACHE_TTL = float(os.getenv("MENU_CACHE_TTL", "300"))
+
+CATALOG_EVENTS = [
+    "catalog.menu_item_created",
+    "catalog.menu_item_updated",
+    "catalog.menu_item_deleted",
+    "catalog.restaurant_updated",
+    "catalog.restaurant_deleted"
+]
+
+def make_etag(body: bytes) -> str:
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match comparison (RFC 9110: weak, so a W/ prefix is ignored)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+@dataclass(frozen=True)
+class CachedBody:
+    body: bytes
+    etag: str
+    restaurant_id: int
+    # Counter value when the database was read
+    token: int
+
+class MenuCache:
+    def __init__(self, maxsize: int = MENU_CACHE_SIZE, ttl: float = MENU_CACHE_TTL):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._clock = 0
+        # Only restaurants invalidated since startup have a stamp
+        self._invalidated_at: Dict[int, int] = {}
+        self.stats = {"hits": 0, "misses": 0, "not_modified": 0, "invalidations": 0}
+
+    def token(self) -> int:
+        """Take before reading the database for a miss; pass to ``set``"""
+        return self._clock
+
+    def _fresh(self, restaurant_id: int, token: int) -> bool:
+        return token >= self._invalidated_at.get(restaurant_id, 0)
+
+    def get(self, key: Hashable) -> Optional[CachedBody]:
+        entry = self._cache.get(key)
+        if entry is not None and not self._fresh(entry.restaurant_id, entry.token):
+            self._cache.pop(key)
+            entry = None
+        self.stats["hits" if entry is not None else "misses"] += 1
+        return entry
+
+    def set(self, key: Hashable, body: bytes, restaurant_id: int, token: int) -> CachedBody:
+        """Cache ``body`` unless the restaurant was invalidated after ``token`` was taken"""
+        entry = CachedBody(body=body, etag=make_etag(body), restaurant_id=restaurant_id, token=token)
+        if self._fresh(restaurant_id, token):
+            self._cache.set(key, entry)
+        return entry
+
+    def invalidate(self, restaurant_id: int):
+        self._clock += 1
+        self._invalidated_at[restaurant_id] = self._clock
+        self.stats["invalidations"] += 1
+
+    def clear(self):
+        self._cache.clear()
+
+    def metrics(self) -> dict:
+        return {"entries": len(self._cache), "maxsize": self._cache.maxsize, "ttl": self._cache.ttl, **self.stats}
+
+# Shared by the catalog routes
+menu_cache = MenuCache()
+
+async def publish_catalog_event(event_type: str, data: Dict[str, Any]):
+    """Evict locally, then tell the other replicas; the write has already committed"""
+    menu_cache.invalidate(data["restaurant_id"])
+    try:
+        message_broker = await get_message_broker()
+        await message_broker.publish_event(event_type, data)
+    except Exception as e:
+        logger.warning(f"Could not publish {event_type} for restaurant {data['restaurant_id']}, "
+                       f"other replicas' menus expire after {MENU_CACHE_TTL:g}s: {e}")
+
+async def handle_catalog_event(event_data: Dict[str, Any]):
+    restaurant_id = (event_data.get("data") or {}).get("restaurant_id")
+    if restaurant_id is not None:
+        menu_cache.invalidate(restaurant_id)
+
+async def start_menu_cache_invalidation():
+    """Listen for catalog changes made on other replicas; call once on startup"""
+    try:
+        message_broker = await get_message_broker()
+        await message_broker.subscribe_broadcast(CATALOG_EVENTS, handle_catalog_event)
+    except Exception as e:
+        logger.warning(f"Menu cache invalidation not started, entries expire after {MENU_CACHE_TTL:g}s: {e}")
@@ -0,0 +1,142 @@
+"""
+Restaurant and dish search
+
+On PostgreSQL both tables carry a generated ``search_vector`` (see
+migrations/0003_search.sql) with a GIN index, plus a trigram index on
+``name``. A row matches when any of these hold:
+
+- its vector matches the query words (``websearch_to_tsquery``: stemming,
+  quoted phrases, ``-excluded`` words)
+- its name is trigram-similar to the whole query, which catches typos like
+  "margherta" or "shusi"
+- the query is a substring of its name (typeahead: "marg")
+
+The trigram index serves the last two. Results are ranked by
+``ts_rank_cd`` (name hits weigh more than category or description hits)
+plus name similarity.
+
+Other databases (SQLite in development) fall back to a case-insensitive
+substring match on name and description, ordered by name.
+"""
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, text, or_
+from typing import Any, Dict, List, Optional
+from database import Restaurant, MenuItem
+import os
+
+# Minimum pg_trgm similarity (0-1) for a name to count as a fuzzy match
+SEARCH_SIMILARITY_THRESHOLD = float(os.getenv("SEARCH_SIMILARITY_THRESHOLD", "0.3"))
+SEARCH_MAX_LIMIT = 100
+
+SEARCH_TYPES = ("all", "restaurants", "menu_items")
+
+# Text search configuration; must match the one in the generated columns
+TS_CONFIG = "english"
+
+RESTAURANT_SEARCH_SQL = text(f"""
+    SELECT r.id, r.name, r.description, r.address, r.latitude, r.longitude,
+           ts_rank_cd(r.search_vector, q.query) + similarity(r.name, :q) AS score
+    FROM restaurants r, websearch_to_tsquery('{TS_CONFIG}', :q) AS q(query)
+    WHERE r.is_active
+      AND (r.search_vector @@ q.query OR r.name % :q OR r.name ILIKE :pattern)
+    ORDER BY score DESC, r.id
+    LIMIT :limit
+""")
+
+MENU_ITEM_SEARCH_SQL = text(f"""
+    SELECT m.id, m.name, m.description, m.category, m.price, m.restaurant_id,
+           r.name AS restaurant_name,
+           ts_rank_cd(m.search_vector, q.query) + similarity(m.name, :q) AS score
+    FROM menu_items m
+    JOIN restaurants r ON r.id = m.restaurant_id,
+         websearch_to_tsquery('{TS_CONFIG}', :q) AS q(query)
+    WHERE m.is_available AND r.is_active
+      AND (m.search_vector @@ q.query OR m.name % :q OR m.name ILIKE :pattern)
+      AND (CAST(:restaurant_id AS INTEGER) IS NULL OR m.restaurant_id = :restaurant_id)
+    ORDER BY score DESC, m.id
+    LIMIT :limit
+""")
+
+def restaurant_match(q: str):
+    """Filter clause for restaurants matching ``q`` on PostgreSQL (index-backed)"""
+    return text(
+        f"(restaurants.search_vector @@ websearch_to_tsquery('{TS_CONFIG}', :search_q)"
+        " OR restaurants.name % :search_q)"
+    ).bindparams(search_q=q)
+
+class SearchService:
+    """Ranked, typo-tolerant search over restaurants and menu items"""
+
+    async def search(
+        self,
+        db: AsyncSession,
+        q: str,
+        search_type: str = "all",
+        limit: int = 20,
+        restaurant_id: Optional[int] = None
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """Best matches for ``q``, per kind; raises ValueError on bad input"""
+        q = q.strip()
+        if not q:
+            raise ValueError("Search query must not be empty")
+        if search_type not in SEARCH_TYPES:
+            raise ValueError(f"Unknown search type {search_type!r}; expected one of {', '.join(SEARCH_TYPES)}")
+        limit = max(1, min(limit, SEARCH_MAX_LIMIT))
+
+        if db.get_bind().dialect.name != "postgresql":
+            return await self._search_substring(db, q, search_type, limit, restaurant_id)
+
+        # Applies to the % operator for this transaction only
+        await db.execute(
+            text("SELECT set_config('pg_trgm.similarity_threshold', :threshold, true)"),
+            {"threshold": str(SEARCH_SIMILARITY_THRESHOLD)}
+        )
+
+        pattern = "%" + q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        results = {"restaurants": [], "menu_items": []}
+        # Restaurant-scoped searches only look at that restaurant's dishes
+        if search_type in ("all", "restaurants") and restaurant_id is None:
+            rows = await db.execute(RESTAURANT_SEARCH_SQL, {"q": q, "pattern": pattern, "limit": limit})
+            results["restaurants"] = [dict(row._mapping) for row in rows]
+        if search_type in ("all", "menu_items"):
+            rows = await db.execute(MENU_ITEM_SEARCH_SQL, {
+                "q": q, "pattern": pattern, "limit": limit, "restaurant_id": restaurant_id
+            })
+            results["menu_items"] = [dict(row._mapping) for row in rows]
+        return results
+
+    async def _search_substring(
+        self,
+        db: AsyncSession,
+        q: str,
+        search_type: str,
+        limit: int,
+        restaurant_id: Optional[int]
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        pattern = f"%{q}%"
+        results = {"restaurants": [], "menu_items": []}
+
+        if search_type in ("all", "restaurants") and restaurant_id is None:
+            rows = await db.execute(select(
+                Restaurant.id, Restaurant.name, Restaurant.description, Restaurant.address,
+                Restaurant.latitude, Restaurant.longitude
+            ).filter(
+                Restaurant.is_active == True,
+                or_(Restaurant.name.ilike(pattern), Restaurant.description.ilike(pattern))
+            ).order_by(Restaurant.name, Restaurant.id).limit(limit))
+            results["restaurants"] = [{**row._mapping, "score": 0.0} for row in rows]
+
+        if search_type in ("all", "menu_items"):
+            query = select(
+                MenuItem.id, MenuItem.name, MenuItem.description, MenuItem.category, MenuItem.price,
+                MenuItem.restaurant_id, Restaurant.name.label("restaurant_name")
+            ).join(Restaurant, Restaurant.id == MenuItem.restaurant_id).filter(
+                MenuItem.is_available == True,
+                Restaurant.is_active == True,
+                or_(MenuItem.name.ilike(pattern), MenuItem.description.ilike(pattern), MenuItem.category.ilike(pattern))
+            )
+            if restaurant_id is not None:
+                query = query.filter(MenuItem.restaurant_id == restaurant_id)
+            rows = await db.execute(query.order_by(MenuItem.name, MenuItem.id).limit(limit))
+            results["menu_items"] = [{**row._mapping, "score": 0.0} for row in rows]
+        return results
@@ -1,5 +1,5 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Body
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Dict
 import sys
 import os
@@ -8,7 +8,7 @@ import asyncio
 # Add shared directory to path
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'shared'))
 
-from database import get_db
+from database import get_db, get_read_db
 from app.schemas import DriverSchema, DriverCreateRequest, DriverStatus
 from shared.auth import get_current_user, require_role, UserRole
 from services.dispatch_service import DispatchService
@@ -18,14 +18,14 @@ router = APIRouter()
 @router.post("/drivers", response_model=DriverSchema)
 async def create_driver(
     driver: DriverCreateRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user = Depends(require_role(UserRole.DRIVER))
 ):
     """Create a new driver profile"""
     dispatch_service = DispatchService()
     
     try:
-        db_driver = dispatch_service.create_driver(db, driver, current_user.id)
+        db_driver = await dispatch_service.create_driver(db, driver, current_user.id)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     
@@ -34,12 +34,12 @@ async def create_driver(
 @router.get("/drivers", response_model=List[DriverSchema])
 async def get_drivers(
     status: DriverStatus = None,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user = Depends(get_current_user)
 ):
     """Get all drivers"""
     dispatch_service = DispatchService()
-    drivers = dispatch_service.get_drivers(db, status)
+    drivers = await dispatch_service.get_drivers(db, status)
     return drivers
 
 @router.put("/drivers/{driver_id}/location")
@@ -47,14 +47,14 @@ async def update_driver_location(
     driver_id: int,
     latitude: float,
     longitude: float,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user = Depends(require_role(UserRole.DRIVER))
 ):
     """Update driver location"""
     dispatch_service = DispatchService()
     
     try:
-        driver = dispatch_service.update_driver_location(db, driver_id, latitude, longitude)
+        driver = await dispatch_service.update_driver_location(db, driver_id, latitude, longitude)
         
         # Verify ownership
         if driver.user_id != current_user.id:
@@ -68,14 +68,14 @@ async def update_driver_location(
 async def update_driver_status(
     driver_id: int,
     status: DriverStatus,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user = Depends(require_role(UserRole.DRIVER))
 ):
     """Update driver status"""
     dispatch_service = DispatchService()
     
     try:
-        driver = dispatch_service.update_driver_status(db, driver_id, status)
+        driver = await dispatch_service.update_driver_status(db, driver_id, status)
         
         # Verify ownership
         if driver.user_id != current_user.id:
@@ -90,45 +90,35 @@ async def get_available_drivers(
     latitude: float,
     longitude: float,
     radius: float = 10.0,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """Get available drivers within radius"""
     dispatch_service = DispatchService()
-    nearby_drivers = dispatch_service.get_available_drivers(db, latitude, longitude, radius)
+    nearby_drivers = await dispatch_service.get_available_drivers(db, latitude, longitude, radius)
     return nearby_drivers
 
 @router.post("/deliveries/{order_id}/assign")
 async def assign_driver(
     order_id: int,
     driver_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user = Depends(require_role(UserRole.ADMIN))
 ):
     """Assign a driver to an order"""
     dispatch_service = DispatchService()
     
     try:
-        delivery = dispatch_service.assign_driver(db, order_id, driver_id)
+        delivery = await dispatch_service.assign_driver(db, order_id, driver_id)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     
-    # Publish driver assigned event
-    await dispatch_service.publish_driver_event(
-        "driver.assigned",
-        {
-            "order_id": order_id,
-            "driver_id": driver_id,
-            "assigned_at": str(asyncio.get_event_loop().time())
-        }
-    )
-    
     return {"message": f"Driver {driver_id} assigned to order {order_id}"}
 
 @router.post("/orders/{order_id}/assign/internal")
 async def assign_driver_internal(
     order_id: int,
     request_data: Dict = Body(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Internal endpoint for saga orchestrator
@@ -143,17 +133,7 @@ async def assign_driver_internal(
         raise HTTPException(status_code=400, detail="driver_id is required in request body")
     
     try:
-        delivery = dispatch_service.assign_driver(db, order_id, driver_id)
-        
-        # Publish driver assigned event
-        await dispatch_service.publish_driver_event(
-            "driver.assigned",
-            {
-                "order_id": order_id,
-                "driver_id": driver_id,
-                "assigned_at": str(asyncio.get_event_loop().time())
-            }
-        )
+        delivery = await dispatch_service.assign_driver(db, order_id, driver_id)
         
         return {
             "message": f"Driver {driver_id} assigned to order {order_id}",
@@ -167,96 +147,64 @@ async def assign_driver_internal(
 @router.post("/orders/{order_id}/assign")
 async def self_assign_driver(
     order_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user = Depends(require_role(UserRole.DRIVER))
 ):
     """Driver self-assigns to an order"""
     dispatch_service = DispatchService()
     
     # Check if driver profile exists
-    driver = dispatch_service.get_driver_by_user_id(db, current_user.id)
+    driver = await dispatch_service.get_driver_by_user_id(db, current_user.id)
     if not driver:
         raise HTTPException(status_code=404, detail="Driver profile not found")
     
     try:
-        delivery = dispatch_service.assign_driver(db, order_id, driver.id)
+        delivery = await dispatch_service.assign_driver(db, order_id, driver.id)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     
-    # Publish driver assigned event
-    await dispatch_service.publish_driver_event(
-        "driver.assigned",
-        {
-            "order_id": order_id,
-            "driver_id": driver.id,
-            "assigned_at": str(asyncio.get_event_loop().time())
-        }
-    )
-    
     return {"message": f"Driver {driver.id} assigned to order {order_id}"}
 
 @router.post("/deliveries/{order_id}/pickup")
 async def mark_pickup(
     order_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user = Depends(require_role(UserRole.DRIVER))
 ):
     """Driver marks order as picked up"""
     dispatch_service = DispatchService()
     
     # Check if driver profile exists
-    driver = dispatch_service.get_driver_by_user_id(db, current_user.id)
+    driver = await dispatch_service.get_driver_by_user_id(db, current_user.id)
     if not driver:
         raise HTTPException(status_code=404, detail="Driver profile not found")
     
     try:
-        delivery = dispatch_service.mark_pickup(db, order_id, driver.id)
+        delivery = await dispatch_service.mark_pickup(db, order_id, driver.id)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     
-    # Publish delivery status changed event
-    await dispatch_service.publish_driver_event(
-        "delivery.status_changed",
-        {
-            "order_id": order_id,
-            "driver_id": driver.id,
-            "status": "PICKED_UP",
-            "updated_at": str(asyncio.get_event_loop().time())
-        }
-    )
-    
     return {"message": f"Order {order_id} marked as picked up"}
 
 @router.post("/deliveries/{order_id}/deliver")
 async def mark_delivered(
     order_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user = Depends(require_role(UserRole.DRIVER))
 ):
     """Driver marks order as delivered"""
     dispatch_service = DispatchService()
     
     # Check if driver profile exists
-    driver = dispatch_service.get_driver_by_user_id(db, current_user.id)
+    driver = await dispatch_service.get_driver_by_user_id(db, current_user.id)
     if not driver:
         raise HTTPException(status_code=404, detail="Driver profile not found")
     
     try:
-        delivery = dispatch_service.mark_delivered(db, order_id, driver.id)
+        delivery = await dispatch_service.mark_delivered(db, order_id, driver.id)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     
-    # Publish delivery status changed event
-    await dispatch_service.publish_driver_event(
-        "delivery.status_changed",
-        {
-            "order_id": order_id,
-            "driver_id": driver.id,
-            "status": "DELIVERED",
-            "updated_at": str(asyncio.get_event_loop().time())
-        }
-    )
-    
     return {"message": f"Order {order_id} marked as delivered"}
 
 @router.get("/health")
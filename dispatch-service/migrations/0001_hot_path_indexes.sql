@@ -0,0 +1,4 @@
+-- Available-driver lookup, driver-by-user lookup and driver delivery counts
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_drivers_status ON drivers (status);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_drivers_user_id ON drivers (user_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_deliveries_driver_id_status ON deliveries (driver_id, status);
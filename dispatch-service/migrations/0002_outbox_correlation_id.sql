@@ -0,0 +1,2 @@
+-- Envelope correlation id for outbox events (shared table; every producer applies it)
+ALTER TABLE outbox_events ADD COLUMN IF NOT EXISTS correlation_id VARCHAR;
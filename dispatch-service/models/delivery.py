@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, DateTime, Enum, ForeignKey
+from sqlalchemy import Column, Integer, DateTime, Enum, ForeignKey, Index
 from datetime import datetime
 import sys
 import os
@@ -10,6 +10,10 @@ from shared.database import Base
 
 class Delivery(Base):
     __tablename__ = "deliveries"
+    __table_args__ = (
+        # Driver delivery counts filter on driver and status together
+        Index("ix_deliveries_driver_id_status", "driver_id", "status"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     order_id = Column(Integer, index=True)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Float, Enum
+from sqlalchemy import Column, Integer, String, DateTime, Float, Enum, Index
 from datetime import datetime
 import sys
 import os
@@ -10,6 +10,10 @@ from shared.database import Base
 
 class Driver(Base):
     __tablename__ = "drivers"
+    __table_args__ = (
+        Index("ix_drivers_status", "status"),
+        Index("ix_drivers_user_id", "user_id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer)
@@ -1,11 +1,12 @@
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
 from typing import List, Optional
 import math
 import asyncio
 from models.driver import Driver
 from models.delivery import Delivery
 from shared.models import DriverCreateRequest, DriverStatus
-from shared.message_broker import get_message_broker
+from shared.outbox import add_event
 
 class DispatchService:
     """Service for driver and delivery management"""
@@ -22,15 +23,15 @@ class DispatchService:
         
         return R * c
     
-    def create_driver(
+    async def create_driver(
         self,
-        db: Session,
+        db: AsyncSession,
         driver: DriverCreateRequest,
         user_id: int
     ) -> Driver:
         """Create a new driver profile"""
         # Check if driver already exists
-        existing_driver = db.query(Driver).filter(Driver.user_id == user_id).first()
+        existing_driver = await self.get_driver_by_user_id(db, user_id)
         if existing_driver:
             raise ValueError("Driver profile already exists")
         
@@ -43,72 +44,74 @@ class DispatchService:
             current_longitude=driver.current_longitude
         )
         db.add(db_driver)
-        db.commit()
-        db.refresh(db_driver)
+        await db.commit()
+        await db.refresh(db_driver)
         return db_driver
     
-    def get_drivers(
+    async def get_drivers(
         self,
-        db: Session,
+        db: AsyncSession,
         status: Optional[DriverStatus] = None
     ) -> List[Driver]:
         """Get all drivers, optionally filtered by status"""
-        query = db.query(Driver)
+        query = select(Driver)
         if status:
             query = query.filter(Driver.status == status)
-        return query.all()
+        result = await db.execute(query)
+        return result.scalars().all()
     
-    def get_driver_by_id(self, db: Session, driver_id: int) -> Optional[Driver]:
+    async def get_driver_by_id(self, db: AsyncSession, driver_id: int) -> Optional[Driver]:
         """Get driver by ID"""
-        return db.query(Driver).filter(Driver.id == driver_id).first()
+        return await db.get(Driver, driver_id)
     
-    def get_driver_by_user_id(self, db: Session, user_id: int) -> Optional[Driver]:
+    async def get_driver_by_user_id(self, db: AsyncSession, user_id: int) -> Optional[Driver]:
         """Get driver by user ID"""
-        return db.query(Driver).filter(Driver.user_id == user_id).first()
+        result = await db.execute(select(Driver).filter(Driver.user_id == user_id))
+        return result.scalars().first()
     
-    def update_driver_location(
+    async def update_driver_location(
         self,
-        db: Session,
+        db: AsyncSession,
         driver_id: int,
         latitude: float,
         longitude: float
     ) -> Driver:
         """Update driver location"""
-        driver = db.query(Driver).filter(Driver.id == driver_id).first()
+        driver = await db.get(Driver, driver_id)
         if not driver:
             raise ValueError("Driver not found")
         
         driver.current_latitude = latitude
         driver.current_longitude = longitude
-        db.commit()
-        db.refresh(driver)
+        await db.commit()
+        await db.refresh(driver)
         return driver
     
-    def update_driver_status(
+    async def update_driver_status(
         self,
-        db: Session,
+        db: AsyncSession,
         driver_id: int,
         status: DriverStatus
     ) -> Driver:
         """Update driver status"""
-        driver = db.query(Driver).filter(Driver.id == driver_id).first()
+        driver = await db.get(Driver, driver_id)
         if not driver:
             raise ValueError("Driver not found")
         
         driver.status = status
-        db.commit()
-        db.refresh(driver)
+        await db.commit()
+        await db.refresh(driver)
         return driver
     
-    def get_available_drivers(
+    async def get_available_drivers(
         self,
-        db: Session,
+        db: AsyncSession,
         latitude: float,
         longitude: float,
         radius: float = 10.0
     ) -> List[dict]:
         """Get available drivers within radius"""
-        available_drivers = db.query(Driver).filter(Driver.status == DriverStatus.AVAILABLE).all()
+        available_drivers = await self.get_drivers(db, DriverStatus.AVAILABLE)
         
         nearby_drivers = []
         for driver in available_drivers:
@@ -127,14 +130,14 @@ class DispatchService:
         nearby_drivers.sort(key=lambda x: x["distance"])
         return nearby_drivers
     
-    def assign_driver(
+    async def assign_driver(
         self,
-        db: Session,
+        db: AsyncSession,
         order_id: int,
         driver_id: int
     ) -> Delivery:
         """Assign a driver to an order"""
-        driver = db.query(Driver).filter(Driver.id == driver_id).first()
+        driver = await db.get(Driver, driver_id)
         if not driver:
             raise ValueError("Driver not found")
         
@@ -142,7 +145,8 @@ class DispatchService:
             raise ValueError("Driver is not available")
         
         # Check if order is already assigned
-        existing_delivery = db.query(Delivery).filter(Delivery.order_id == order_id).first()
+        result = await db.execute(select(Delivery).filter(Delivery.order_id == order_id))
+        existing_delivery = result.scalars().first()
         if existing_delivery:
             raise ValueError("Order already assigned to a driver")
         
@@ -156,21 +160,27 @@ class DispatchService:
         
         # Update driver status
         driver.status = DriverStatus.BUSY
-        db.commit()
-        db.refresh(delivery)
+        add_event(db, "driver.assigned", {
+            "order_id": order_id,
+            "driver_id": driver_id,
+            "assigned_at": str(asyncio.get_event_loop().time())
+        })
+        await db.commit()
+        await db.refresh(delivery)
         return delivery
     
-    def mark_pickup(
+    async def mark_pickup(
         self,
-        db: Session,
+        db: AsyncSession,
         order_id: int,
         driver_id: int
     ) -> Delivery:
         """Mark order as picked up"""
-        delivery = db.query(Delivery).filter(
+        result = await db.execute(select(Delivery).filter(
             Delivery.order_id == order_id,
             Delivery.driver_id == driver_id
-        ).first()
+        ))
+        delivery = result.scalars().first()
         
         if not delivery:
             raise ValueError("Delivery not found or not assigned to this driver")
@@ -181,21 +191,23 @@ class DispatchService:
         from datetime import datetime
         delivery.status = "PICKED_UP"
         delivery.picked_up_at = datetime.utcnow()
-        db.commit()
-        db.refresh(delivery)
+        self._add_delivery_event(db, delivery)
+        await db.commit()
+        await db.refresh(delivery)
         return delivery
     
-    def mark_delivered(
+    async def mark_delivered(
         self,
-        db: Session,
+        db: AsyncSession,
         order_id: int,
         driver_id: int
     ) -> Delivery:
         """Mark order as delivered"""
-        delivery = db.query(Delivery).filter(
+        result = await db.execute(select(Delivery).filter(
             Delivery.order_id == order_id,
             Delivery.driver_id == driver_id
-        ).first()
+        ))
+        delivery = result.scalars().first()
         
         if not delivery:
             raise ValueError("Delivery not found or not assigned to this driver")
@@ -208,19 +220,25 @@ class DispatchService:
         delivery.delivered_at = datetime.utcnow()
         
         # Update driver status back to available
-        driver = db.query(Driver).filter(Driver.id == driver_id).first()
+        driver = await db.get(Driver, driver_id)
         if driver:
             driver.status = DriverStatus.AVAILABLE
         
-        db.commit()
-        db.refresh(delivery)
+        self._add_delivery_event(db, delivery)
+        await db.commit()
+        await db.refresh(delivery)
         return delivery
     
-    async def publish_driver_event(self, event_type: str, event_data: dict):
-        """Publish driver/delivery event"""
-        try:
-            message_broker = await get_message_broker()
-            await message_broker.publish_event(event_type, event_data)
-        except Exception as e:
-            print(f"Message broker error: {e}")
-
+    def _add_delivery_event(self, db: AsyncSession, delivery: Delivery):
+        """Record delivery.status_changed in the caller's transaction (published by the outbox relay)"""
+        add_event(db, "delivery.status_changed", {
+            "order_id": delivery.order_id,
+            "driver_id": delivery.driver_id,
+            "status": delivery.status,
+            "updated_at": str(asyncio.get_event_loop().time())
+        })
+    
+    async def publish_driver_event(self, db: AsyncSession, event_type: str, event_data: dict):
+        """Record a driver/delivery event that has no state change of its own"""
+        add_event(db, event_type, event_data)
+        await db.commit()
@@ -1,5 +1,4 @@
 """Event handlers for dispatch service"""
-from sqlalchemy.orm import Session
 from datetime import datetime
 import sys
 import os
@@ -7,12 +6,11 @@ import asyncio
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'shared'))
 
-from shared.database import SessionLocal
+from shared.database import AsyncSessionLocal
 from models.driver import Driver
 from models.delivery import Delivery
 from shared.models import DriverStatus
 from services.dispatch_service import DispatchService
-from shared.message_broker import get_message_broker
 
 async def handle_order_ready_for_delivery(event_data):
     """Handle order ready for delivery event - assign driver"""
@@ -25,17 +23,17 @@ async def handle_order_ready_for_delivery(event_data):
     restaurant_lat = 40.7128
     restaurant_lon = -74.0060
     
-    db = SessionLocal()
+    db = AsyncSessionLocal()
     try:
         dispatch_service = DispatchService()
         
         # Find available drivers near restaurant
-        available_drivers = db.query(Driver).filter(Driver.status == DriverStatus.AVAILABLE).all()
+        available_drivers = await dispatch_service.get_drivers(db, DriverStatus.AVAILABLE)
         
         if not available_drivers:
             # No drivers available - publish event
-            message_broker = await get_message_broker()
-            await message_broker.publish_event(
+            await dispatch_service.publish_driver_event(
+                db,
                 "no.driver.available",
                 {
                     "order_id": order_id,
@@ -59,21 +57,14 @@ async def handle_order_ready_for_delivery(event_data):
                     closest_driver = driver
         
         if closest_driver:
-            # Assign driver
-            dispatch_service.assign_driver(db, order_id, closest_driver.id)
-            
-            # Publish driver assigned event
-            message_broker = await get_message_broker()
-            await message_broker.publish_event(
-                "driver.assigned",
-                {
-                    "order_id": order_id,
-                    "driver_id": closest_driver.id,
-                    "assigned_at": str(asyncio.get_event_loop().time())
-                }
-            )
+            # Assign driver (records driver.assigned in the same transaction)
+            await dispatch_service.assign_driver(db, order_id, closest_driver.id)
+    except ValueError as e:
+        # Business rule (e.g. already assigned) - retrying won't change the outcome
+        print(f"Could not assign driver for order {order_id}: {e}")
     except Exception as e:
         print(f"Error handling order ready for delivery: {e}")
+        raise
     finally:
-        db.close()
+        await db.close()
 
@@ -1,15 +1,17 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
 import sys
 import os
 
 # Add shared directory to path
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'shared'))
 
-from database import get_db
+from database import get_db, get_read_db
 from app.schemas import NotificationResponse
 from shared.auth import get_current_user, require_role, UserRole
 from services.notification_service import NotificationService
+from shared.pagination import TotalMode
 
 router = APIRouter()
 
@@ -17,18 +19,27 @@ router = APIRouter()
 async def get_notifications(
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = None,
+    total: TotalMode = TotalMode.EXACT,
+    db: AsyncSession = Depends(get_read_db),
     current_user = Depends(get_current_user)
 ):
-    """Get notification history for user"""
+    """
+    Get notification history for user, newest first.
+    Pass `next_cursor` back as `cursor` for the next page; use `total=none` to skip the count.
+    """
     notification_service = NotificationService()
-    notifications, total_count = notification_service.get_notifications(
-        db, current_user.id, skip, limit
-    )
+    try:
+        notifications, next_cursor, total_count = await notification_service.get_notifications(
+            db, current_user.id, skip, limit, cursor, total
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
     return {
         "notifications": notifications,
         "total_count": total_count,
+        "next_cursor": next_cursor,
         "user_id": current_user.id
     }
 
@@ -38,7 +49,7 @@ async def send_notification(
     notification_type: str,
     title: str,
     message: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user = Depends(require_role(UserRole.ADMIN))
 ):
     """Send a notification to a specific user"""
@@ -30,6 +30,7 @@ class Notification(NotificationBase):
 
 class NotificationResponse(BaseModel):
     notifications: list[Notification]
-    total_count: int
+    total_count: Optional[int] = None
+    next_cursor: Optional[str] = None
     user_id: int
 
@@ -5,12 +5,13 @@ import os
 # Add shared directory to path
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'shared'))
 
-from shared.database import Base, engine, SessionLocal
+from shared.database import Base, engine, AsyncSessionLocal, ReadSessionLocal
 from models.notification import Notification
 
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+async def get_read_db():
+    async with ReadSessionLocal() as db:
         yield db
-    finally:
-        db.close()
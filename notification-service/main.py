@@ -1,10 +1,15 @@
 from fastapi import FastAPI
 from app.routes import router
+from shared.dead_letters import router as dead_letter_router
 from config.settings import settings
 from database import Base, engine
-from services.event_handlers import handle_all_notification_events
-from shared.message_broker import get_message_broker
+from shared.db_pool import get_pool_metrics
+from shared.migrations import run_migrations
+from services.event_handlers import event_router
+from shared.message_broker import get_message_broker, get_event_metrics
+from shared.auth import start_principal_invalidation
 import logging
+import os
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -18,13 +23,25 @@ app = FastAPI(
 # Create database tables
 Base.metadata.create_all(bind=engine)
 
+# Apply index / schema migrations that create_all can't make on existing tables
+run_migrations(engine, "notification-service", os.path.join(os.path.dirname(__file__), "migrations"))
+
 # Include routes
 app.include_router(router)
+app.include_router(dead_letter_router)
 
 @app.get("/health")
 async def health_check():
     return {"status": "healthy", "service": "notification-service"}
 
+@app.get("/health/db/pool")
+async def pool_metrics():
+    return {"service": "notification-service", "pools": get_pool_metrics()}
+
+@app.get("/health/events")
+async def event_metrics():
+    return {"service": "notification-service", "events": get_event_metrics()}
+
 # Start event listeners on startup
 @app.on_event("startup")
 async def startup_event():
@@ -33,24 +50,14 @@ async def startup_event():
     # Start message broker subscription
     try:
         message_broker = await get_message_broker()
-        await message_broker.subscribe_to_events(
-            [
-                "order.created",
-                "order.confirmed",
-                "payment.succeeded", 
-                "payment.failed",
-                "order.accepted",
-                "order.ready_for_delivery",
-                "driver.assigned",
-                "order.delivered",
-                "no.driver.available"
-            ],
-            handle_all_notification_events
-        )
+        await message_broker.subscribe(event_router)
         print("Notification Service connected to RabbitMQ successfully!")
     except Exception as e:
         print(f"Message broker startup error: {e}")
         print("Continuing without RabbitMQ - some features may not work")
+    
+    # Drop cached users when the auth service reports a change
+    await start_principal_invalidation()
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,2 @@
+-- A user's notifications, newest first
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_notifications_user_id_created_at ON notifications (user_id, created_at, id);
@@ -1,14 +1,14 @@
 """Event handlers for notification service"""
-from sqlalchemy.orm import Session
 from datetime import datetime
 import sys
 import os
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'shared'))
 
-from shared.database import SessionLocal
+from shared.database import AsyncSessionLocal
 from models.notification import Notification
 from services.notification_service import NotificationService
+from shared.message_broker import EventRouter
 import logging
 
 logger = logging.getLogger(__name__)
@@ -19,12 +19,12 @@ async def handle_order_created(event_data):
     order_id = order_data["order_id"]
     customer_id = order_data["customer_id"]
     
-    db = SessionLocal()
+    db = AsyncSessionLocal()
     try:
         notification_service = NotificationService()
         
         # Save notification to database
-        notification = notification_service.create_notification(
+        notification = await notification_service.create_notification(
             db,
             customer_id,
             "PUSH",
@@ -35,7 +35,7 @@ async def handle_order_created(event_data):
         # Update to sent status
         notification.status = "SENT"
         notification.sent_at = datetime.utcnow()
-        db.commit()
+        await db.commit()
         
         # Send order confirmation
         await notification_service.send_push_notification(
@@ -47,8 +47,9 @@ async def handle_order_created(event_data):
         logger.info(f"Order confirmation sent for order {order_id}")
     except Exception as e:
         logger.error(f"Failed to send notification: {e}")
+        raise
     finally:
-        db.close()
+        await db.close()
 
 async def handle_payment_succeeded(event_data):
     """Handle payment succeeded event - notify customer"""
@@ -169,12 +170,12 @@ async def handle_order_confirmed(event_data):
     order_id = order_data["order_id"]
     customer_id = order_data["customer_id"]
     
-    db = SessionLocal()
+    db = AsyncSessionLocal()
     try:
         notification_service = NotificationService()
         
         # Save notification to database
-        notification = notification_service.create_notification(
+        notification = await notification_service.create_notification(
             db,
             customer_id,
             "PUSH",
@@ -185,7 +186,7 @@ async def handle_order_confirmed(event_data):
         # Update to sent status
         notification.status = "SENT"
         notification.sent_at = datetime.utcnow()
-        db.commit()
+        await db.commit()
         
         # Send push notification
         await notification_service.send_push_notification(
@@ -197,29 +198,19 @@ async def handle_order_confirmed(event_data):
         logger.info(f"Order confirmation sent for order {order_id}")
     except Exception as e:
         logger.error(f"Failed to send notification: {e}")
+        raise
     finally:
-        db.close()
-
-async def handle_all_notification_events(event_data):
-    """Handle all notification events"""
-    event_type = event_data.get("event_type", "")
-    
-    if event_type == "order.created":
-        await handle_order_created(event_data)
-    elif event_type == "order.confirmed":
-        await handle_order_confirmed(event_data)
-    elif event_type == "payment.succeeded":
-        await handle_payment_succeeded(event_data)
-    elif event_type == "payment.failed":
-        await handle_payment_failed(event_data)
-    elif event_type == "order.accepted":
-        await handle_order_accepted(event_data)
-    elif event_type == "order.ready_for_delivery":
-        await handle_order_ready_for_delivery(event_data)
-    elif event_type == "driver.assigned":
-        await handle_driver_assigned(event_data)
-    elif event_type == "order.delivered":
-        await handle_order_delivered(event_data)
-    elif event_type == "no.driver.available":
-        await handle_no_driver_available(event_data)
+        await db.close()
 
+# Routing key -> handler for notification-service_queue
+event_router = EventRouter({
+    "order.created": handle_order_created,
+    "order.confirmed": handle_order_confirmed,
+    "payment.succeeded": handle_payment_succeeded,
+    "payment.failed": handle_payment_failed,
+    "order.accepted": handle_order_accepted,
+    "order.ready_for_delivery": handle_order_ready_for_delivery,
+    "driver.assigned": handle_driver_assigned,
+    "order.delivered": handle_order_delivered,
+    "no.driver.available": handle_no_driver_available
+})
@@ -1,9 +1,11 @@
-from sqlalchemy.orm import Session
-from typing import List
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from typing import List, Optional, Tuple
 from datetime import datetime
 import logging
 from models.notification import Notification
 from app.schemas import NotificationType, NotificationStatus
+from shared.pagination import keyset_query, split_page, count_rows, TotalMode
 
 logger = logging.getLogger(__name__)
 
@@ -31,9 +33,9 @@ class NotificationService:
         # In a real system, this would integrate with push notification services
         return {"status": "sent", "provider": "simulated"}
     
-    def create_notification(
+    async def create_notification(
         self,
-        db: Session,
+        db: AsyncSession,
         user_id: int,
         notification_type: str,
         title: str,
@@ -48,31 +50,32 @@ class NotificationService:
             status="PENDING"
         )
         db.add(notification)
-        db.commit()
-        db.refresh(notification)
+        await db.commit()
+        await db.refresh(notification)
         return notification
     
-    def get_notifications(
+    async def get_notifications(
         self,
-        db: Session,
+        db: AsyncSession,
         user_id: int,
         skip: int = 0,
-        limit: int = 100
-    ) -> tuple[List[Notification], int]:
-        """Get notifications for a user"""
-        notifications = db.query(Notification).filter(
-            Notification.user_id == user_id
-        ).order_by(Notification.created_at.desc()).offset(skip).limit(limit).all()
+        limit: int = 100,
+        cursor: Optional[str] = None,
+        total: TotalMode = TotalMode.EXACT
+    ) -> Tuple[List[Notification], Optional[str], Optional[int]]:
+        """Get a page of notifications for a user (newest first), the next cursor and the total"""
+        query = select(Notification).filter(Notification.user_id == user_id)
         
-        total_count = db.query(Notification).filter(
-            Notification.user_id == user_id
-        ).count()
+        result = await db.execute(keyset_query(query, Notification.created_at, Notification.id, cursor, skip, limit))
+        notifications, next_cursor = split_page(result.scalars().all(), limit)
         
-        return notifications, total_count
+        total_count = await count_rows(db, query, total)
+        
+        return notifications, next_cursor, total_count
     
     async def send_notification(
         self,
-        db: Session,
+        db: AsyncSession,
         user_id: int,
         notification_type: str,
         title: str,
@@ -80,7 +83,7 @@ class NotificationService:
     ) -> Notification:
         """Create and send a notification"""
         # Create notification record
-        notification = self.create_notification(db, user_id, notification_type, title, message)
+        notification = await self.create_notification(db, user_id, notification_type, title, message)
         
         try:
             # Send the actual notification
@@ -94,11 +97,11 @@ class NotificationService:
             # Update notification status to sent
             notification.status = "SENT"
             notification.sent_at = datetime.utcnow()
-            db.commit()
+            await db.commit()
         except Exception as e:
             # Update notification status to failed
             notification.status = "FAILED"
-            db.commit()
+            await db.commit()
             logger.error(f"Failed to send notification: {e}")
             raise
         
@@ -1,15 +1,17 @@
 from fastapi import FastAPI
 from app.routes import router
+from shared.dead_letters import router as dead_letter_router
 from config.settings import settings
 from database import Base, engine
-from services.event_handlers import (
-    handle_payment_succeeded,
-    handle_payment_failed,
-    handle_order_events,
-    handle_driver_assigned,
-    handle_delivery_status_changed
-)
-from shared.message_broker import get_message_broker
+from shared.db_pool import get_pool_metrics
+from shared.migrations import run_migrations
+from shared.idempotency import idempotency_store
+from services.event_handlers import event_router
+from shared.message_broker import get_message_broker, get_event_metrics, close_message_broker
+from shared.outbox import start_outbox_relay, stop_outbox_relay, get_outbox_metrics
+from shared.events import correlation_middleware
+from shared.auth import start_principal_invalidation
+import os
 
 app = FastAPI(
     title="Order Service",
@@ -20,49 +22,65 @@ app = FastAPI(
 # Create database tables
 Base.metadata.create_all(bind=engine)
 
+# Apply index / schema migrations that create_all can't make on existing tables
+run_migrations(engine, "order-service", os.path.join(os.path.dirname(__file__), "migrations"))
+
+# Events staged by a request carry the caller's X-Correlation-ID
+app.middleware("http")(correlation_middleware)
+
 # Include routes
 app.include_router(router)
+app.include_router(dead_letter_router)
 
 @app.get("/health")
 async def health_check():
     return {"status": "healthy", "service": "order-service"}
 
+@app.get("/health/db/pool")
+async def pool_metrics():
+    return {"service": "order-service", "pools": get_pool_metrics()}
+
+@app.get("/health/events")
+async def event_metrics():
+    return {"service": "order-service", "events": get_event_metrics()}
+
+@app.get("/health/outbox")
+async def outbox_metrics():
+    return {"service": "order-service", "outbox": await get_outbox_metrics()}
+
 # Create tables on startup
 @app.on_event("startup")
 async def startup_event():
     print("Order Service database tables created successfully!")
     
+    # Drop idempotency keys past their TTL
+    try:
+        await idempotency_store.purge_expired()
+    except Exception as e:
+        print(f"Idempotency key cleanup error: {e}")
+    
     # Start event listeners
     try:
         message_broker = await get_message_broker()
         
-        # Subscribe to payment events
-        await message_broker.subscribe_to_events(
-            ["payment.succeeded", "payment.failed"],
-            handle_payment_succeeded
-        )
-        
-        # Subscribe to order events
-        await message_broker.subscribe_to_events(
-            ["order.accepted", "order.preparing", "order.ready_for_delivery", "order.cancelled"],
-            handle_order_events
-        )
-        
-        # Subscribe to driver and delivery events
-        await message_broker.subscribe_to_events(
-            ["driver.assigned"],
-            handle_driver_assigned
-        )
-        
-        await message_broker.subscribe_to_events(
-            ["delivery.status_changed"],
-            handle_delivery_status_changed
-        )
+        # One consumer on order-service_queue, dispatched by routing key
+        await message_broker.subscribe(event_router)
         
         print("Order Service connected to RabbitMQ successfully!")
     except Exception as e:
         print(f"Message broker startup error: {e}")
         print("Continuing without RabbitMQ - some features may not work")
+    
+    # Drop cached users when the auth service reports a change
+    await start_principal_invalidation()
+    
+    # Relay events committed to the outbox on to RabbitMQ
+    start_outbox_relay()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await stop_outbox_relay()
+    await close_message_broker()
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,7 @@
+-- Indexes for order lists, customer history and order reports
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_orders_customer_id_created_at ON orders (customer_id, created_at, id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_orders_restaurant_id_created_at ON orders (restaurant_id, created_at, id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_orders_status_created_at ON orders (status, created_at);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_orders_created_at ON orders (created_at);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_order_items_order_id ON order_items (order_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_order_items_menu_item_id ON order_items (menu_item_id);
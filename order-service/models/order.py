@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Float, Enum
+from sqlalchemy import Column, Integer, String, DateTime, Float, Enum, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import sys
@@ -11,6 +11,15 @@ from shared.database import Base
 
 class Order(Base):
     __tablename__ = "orders"
+    __table_args__ = (
+        # Customer / restaurant order lists and customer history, newest first
+        Index("ix_orders_customer_id_created_at", "customer_id", "created_at", "id"),
+        Index("ix_orders_restaurant_id_created_at", "restaurant_id", "created_at", "id"),
+        # Status distribution and status-filtered reports
+        Index("ix_orders_status_created_at", "status", "created_at"),
+        # Peak-time reports scan a created_at range
+        Index("ix_orders_created_at", "created_at"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     customer_id = Column(Integer)
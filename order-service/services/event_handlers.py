@@ -1,28 +1,28 @@
 """Event handlers for order service"""
-from sqlalchemy.orm import Session
 import sys
 import os
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'shared'))
 
-from shared.database import SessionLocal
+from shared.database import AsyncSessionLocal
 from models.order import Order
 from shared.models import OrderStatus
 from services.order_service import OrderService
+from shared.message_broker import EventRouter
 
 async def handle_payment_succeeded(event_data):
     """Handle payment succeeded event"""
     order_id = event_data["data"]["order_id"]
     print(f"DEBUG: Processing payment.succeeded for order {order_id}")
     
-    db = SessionLocal()
+    db = AsyncSessionLocal()
     try:
         order_service = OrderService()
-        order = order_service.get_order_by_id(db, order_id)
+        order = await order_service.get_order_by_id(db, order_id)
         if order:
             # Only update if still in PENDING_PAYMENT status
             if order.status == OrderStatus.PENDING_PAYMENT:
-                order_service.update_order_status(db, order_id, OrderStatus.CONFIRMED)
+                await order_service.update_order_status(db, order_id, OrderStatus.CONFIRMED, publish=False)
                 print(f"DEBUG: Order {order_id} status updated to CONFIRMED")
             else:
                 print(f"DEBUG: Order {order_id} already processed (status: {order.status})")
@@ -30,98 +30,105 @@ async def handle_payment_succeeded(event_data):
             print(f"DEBUG: Order {order_id} not found")
     except Exception as e:
         print(f"DEBUG: Error updating order {order_id}: {e}")
+        raise
     finally:
-        db.close()
+        await db.close()
 
 async def handle_payment_failed(event_data):
     """Handle payment failed event"""
     order_id = event_data["data"]["order_id"]
     print(f"DEBUG: Processing payment.failed for order {order_id}")
     
-    db = SessionLocal()
+    db = AsyncSessionLocal()
     try:
         order_service = OrderService()
-        order_service.update_order_status(db, order_id, OrderStatus.CANCELLED)
+        await order_service.update_order_status(db, order_id, OrderStatus.CANCELLED, publish=False)
         print(f"DEBUG: Order {order_id} status updated to CANCELLED")
     except Exception as e:
         print(f"DEBUG: Error updating order {order_id}: {e}")
+        raise
     finally:
-        db.close()
+        await db.close()
 
 async def handle_order_accepted(event_data):
     """Handle order accepted event"""
     order_id = event_data["data"]["order_id"]
     print(f"DEBUG: Processing order.accepted for order {order_id}")
     
-    db = SessionLocal()
+    db = AsyncSessionLocal()
     try:
         order_service = OrderService()
-        order_service.update_order_status(db, order_id, OrderStatus.ACCEPTED)
+        await order_service.update_order_status(db, order_id, OrderStatus.ACCEPTED, publish=False)
         print(f"DEBUG: Order {order_id} status updated to ACCEPTED")
     except Exception as e:
         print(f"DEBUG: Error updating order {order_id}: {e}")
+        raise
     finally:
-        db.close()
+        await db.close()
 
 async def handle_order_preparing(event_data):
     """Handle order preparing event"""
     order_id = event_data["data"]["order_id"]
     print(f"DEBUG: Processing order.preparing for order {order_id}")
     
-    db = SessionLocal()
+    db = AsyncSessionLocal()
     try:
         order_service = OrderService()
-        order_service.update_order_status(db, order_id, OrderStatus.PREPARING)
+        await order_service.update_order_status(db, order_id, OrderStatus.PREPARING, publish=False)
         print(f"DEBUG: Order {order_id} status updated to PREPARING")
     except Exception as e:
         print(f"DEBUG: Error updating order {order_id}: {e}")
+        raise
     finally:
-        db.close()
+        await db.close()
 
 async def handle_order_ready_for_delivery(event_data):
     """Handle order ready for delivery event"""
     order_id = event_data["data"]["order_id"]
     print(f"DEBUG: Processing order.ready_for_delivery for order {order_id}")
     
-    db = SessionLocal()
+    db = AsyncSessionLocal()
     try:
         order_service = OrderService()
-        order_service.update_order_status(db, order_id, OrderStatus.READY_FOR_DELIVERY)
+        await order_service.update_order_status(db, order_id, OrderStatus.READY_FOR_DELIVERY, publish=False)
         print(f"DEBUG: Order {order_id} status updated to READY_FOR_DELIVERY")
     except Exception as e:
         print(f"DEBUG: Error updating order {order_id}: {e}")
+        raise
     finally:
-        db.close()
+        await db.close()
 
 async def handle_order_cancelled(event_data):
     """Handle order cancelled event"""
     order_id = event_data["data"]["order_id"]
     print(f"DEBUG: Processing order.cancelled for order {order_id}")
     
-    db = SessionLocal()
+    db = AsyncSessionLocal()
     try:
         order_service = OrderService()
-        order_service.update_order_status(db, order_id, OrderStatus.CANCELLED)
+        await order_service.update_order_status(db, order_id, OrderStatus.CANCELLED, publish=False)
         print(f"DEBUG: Order {order_id} status updated to CANCELLED")
     except Exception as e:
         print(f"DEBUG: Error updating order {order_id}: {e}")
+        raise
     finally:
-        db.close()
+        await db.close()
 
 async def handle_driver_assigned(event_data):
     """Handle driver assigned event"""
     order_id = event_data["data"]["order_id"]
     print(f"DEBUG: Processing driver.assigned for order {order_id}")
     
-    db = SessionLocal()
+    db = AsyncSessionLocal()
     try:
         order_service = OrderService()
-        order_service.update_order_status(db, order_id, OrderStatus.PICKED_UP)
+        await order_service.update_order_status(db, order_id, OrderStatus.PICKED_UP, publish=False)
         print(f"DEBUG: Order {order_id} status updated to PICKED_UP")
     except Exception as e:
         print(f"DEBUG: Error updating order {order_id}: {e}")
+        raise
     finally:
-        db.close()
+        await db.close()
 
 async def handle_delivery_status_changed(event_data):
     """Handle delivery status changed event"""
@@ -140,29 +147,25 @@ async def handle_delivery_status_changed(event_data):
         print(f"DEBUG: Unknown delivery status: {delivery_status}")
         return
     
-    db = SessionLocal()
+    db = AsyncSessionLocal()
     try:
         order_service = OrderService()
-        order_service.update_order_status(db, order_id, new_order_status)
+        await order_service.update_order_status(db, order_id, new_order_status, publish=False)
         print(f"DEBUG: Order {order_id} status updated to {new_order_status}")
     except Exception as e:
         print(f"DEBUG: Error updating order {order_id}: {e}")
+        raise
     finally:
-        db.close()
-
-async def handle_order_events(event_data):
-    """Generic handler for order events"""
-    event_type = event_data.get("event_type", "")
-    print(f"DEBUG: Processing {event_type} event")
-    
-    if event_type == "order.accepted":
-        await handle_order_accepted(event_data)
-    elif event_type == "order.preparing":
-        await handle_order_preparing(event_data)
-    elif event_type == "order.ready_for_delivery":
-        await handle_order_ready_for_delivery(event_data)
-    elif event_type == "order.cancelled":
-        await handle_order_cancelled(event_data)
-    else:
-        print(f"DEBUG: Unknown order event type: {event_type}")
+        await db.close()
 
+# Routing key -> handler for order-service_queue
+event_router = EventRouter({
+    "payment.succeeded": handle_payment_succeeded,
+    "payment.failed": handle_payment_failed,
+    "order.accepted": handle_order_accepted,
+    "order.preparing": handle_order_preparing,
+    "order.ready_for_delivery": handle_order_ready_for_delivery,
+    "order.cancelled": handle_order_cancelled,
+    "driver.assigned": handle_driver_assigned,
+    "delivery.status_changed": handle_delivery_status_changed
+})
@@ -1,31 +1,80 @@
-from sqlalchemy.orm import Session, selectinload
-from typing import List, Optional
-from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from typing import List, Optional, Tuple
+from sqlalchemy import text, select, delete, bindparam
 from models.order import Order
 from models.order_item import OrderItem
 from shared.models import OrderCreateRequest, OrderStatus
+from shared.pagination import keyset_query, split_page
+from shared.outbox import add_event
+
+# Allowed rounding difference between client-sent prices and menu prices
+PRICE_TOLERANCE = 0.01
+
+# Restaurant and every requested menu item in one round trip; the restaurant
+# row comes back (with NULL item columns) even if no item matches
+ORDER_MENU_QUERY = text("""
+    SELECT r.id AS restaurant_id, mi.id AS menu_item_id, mi.price, mi.is_available
+    FROM restaurants r
+    LEFT JOIN menu_items mi ON mi.restaurant_id = r.id AND mi.id IN :menu_item_ids
+    WHERE r.id = :restaurant_id
+""").bindparams(bindparam("menu_item_ids", expanding=True))
+
+def _status_value(status) -> str:
+    """Enum columns may hold the enum or its plain string value"""
+    return getattr(status, "value", status)
+
+class OrderValidationError(ValueError):
+    """Order items don't match the restaurant's current menu"""
+    pass
 
 class OrderService:
     """Service for managing orders"""
     
-    def create_order(
+    async def create_order(
         self,
-        db: Session,
+        db: AsyncSession,
         order: OrderCreateRequest,
         customer_id: int
     ) -> Order:
-        """Create a new order"""
-        # Validate restaurant exists
-        result = db.execute(
-            text("SELECT id FROM restaurants WHERE id = :restaurant_id"), 
-            {"restaurant_id": order.restaurant_id}
-        )
-        restaurant = result.fetchone()
+        """
+        Create a new order with its items in one transaction.
+        The restaurant, item ownership, availability and prices are checked
+        with a single query before anything is written.
+        """
+        if not order.items:
+            raise OrderValidationError("Order must contain at least one item")
+        
+        menu_item_ids = sorted({item.menu_item_id for item in order.items})
+        rows = (await db.execute(
+            ORDER_MENU_QUERY,
+            {"restaurant_id": order.restaurant_id, "menu_item_ids": menu_item_ids}
+        )).fetchall()
         
-        if not restaurant:
+        if not rows:
             raise ValueError(f"Restaurant with ID {order.restaurant_id} not found")
         
-        # Create order
+        menu = {row.menu_item_id: row for row in rows if row.menu_item_id is not None}
+        
+        subtotal = 0.0
+        for item in order.items:
+            menu_item = menu.get(item.menu_item_id)
+            if not menu_item:
+                raise OrderValidationError(f"Menu item with ID {item.menu_item_id} not found for restaurant {order.restaurant_id}")
+            if not menu_item.is_available:
+                raise OrderValidationError(f"Menu item with ID {item.menu_item_id} is not available")
+            if item.quantity <= 0:
+                raise OrderValidationError(f"Quantity for menu item {item.menu_item_id} must be positive")
+            if abs(item.price - float(menu_item.price)) > PRICE_TOLERANCE:
+                raise OrderValidationError(
+                    f"Price for menu item {item.menu_item_id} is {float(menu_item.price):.2f}, got {item.price:.2f}"
+                )
+            subtotal += float(menu_item.price) * item.quantity
+        
+        # total_amount may include fees on top of the items, but never less than them
+        if order.total_amount < subtotal - PRICE_TOLERANCE:
+            raise OrderValidationError(f"Total amount {order.total_amount:.2f} is less than item subtotal {subtotal:.2f}")
+        
         db_order = Order(
             customer_id=customer_id,
             restaurant_id=order.restaurant_id,
@@ -35,105 +84,136 @@ class OrderService:
             total_amount=order.total_amount,
             status=order.status
         )
-        db.add(db_order)
-        db.commit()
-        db.refresh(db_order)
-        
-        # Create order items
-        for item in order.items:
-            # Validate menu item exists and belongs to the restaurant
-            result = db.execute(
-                text("SELECT id FROM menu_items WHERE id = :menu_item_id AND restaurant_id = :restaurant_id"), 
-                {"menu_item_id": item.menu_item_id, "restaurant_id": order.restaurant_id}
-            )
-            menu_item = result.fetchone()
-            
-            if not menu_item:
-                raise ValueError(f"Menu item with ID {item.menu_item_id} not found for restaurant {order.restaurant_id}")
-            
-            db_item = OrderItem(
-                order_id=db_order.id,
+        db_order.items = [
+            OrderItem(
                 menu_item_id=item.menu_item_id,
                 quantity=item.quantity,
-                price=item.price
+                price=float(menu[item.menu_item_id].price)
             )
-            db.add(db_item)
+            for item in order.items
+        ]
+        db.add(db_order)
+        await db.flush()
+        
+        add_event(db, "order.created", {
+            "order_id": db_order.id,
+            "customer_id": db_order.customer_id,
+            "restaurant_id": db_order.restaurant_id,
+            "total_amount": float(db_order.total_amount),
+            "status": _status_value(db_order.status),
+            "items": [
+                {
+                    "menu_item_id": item.menu_item_id,
+                    "quantity": item.quantity,
+                    "price": float(item.price)
+                }
+                for item in db_order.items
+            ]
+        })
         
-        db.commit()
+        # Order, items and the order.created event are committed once
+        await db.commit()
         return db_order
     
-    def get_orders(
+    async def get_orders(
         self,
-        db: Session,
+        db: AsyncSession,
         skip: int = 0,
         limit: int = 100,
         customer_id: Optional[int] = None,
-        restaurant_id: Optional[int] = None
-    ) -> List[Order]:
-        """Get orders with optional filtering"""
-        query = db.query(Order).options(selectinload(Order.items))
+        restaurant_id: Optional[int] = None,
+        cursor: Optional[str] = None
+    ) -> Tuple[List[Order], Optional[str]]:
+        """Get a page of orders (newest first) with optional filtering, plus the next cursor"""
+        query = select(Order).options(selectinload(Order.items))
         
         if customer_id:
             query = query.filter(Order.customer_id == customer_id)
         if restaurant_id:
             query = query.filter(Order.restaurant_id == restaurant_id)
         
-        return query.offset(skip).limit(limit).all()
+        query = keyset_query(query, Order.created_at, Order.id, cursor, skip, limit)
+        result = await db.execute(query)
+        return split_page(result.scalars().all(), limit)
     
-    def get_order_by_id(self, db: Session, order_id: int) -> Optional[Order]:
+    async def get_order_by_id(self, db: AsyncSession, order_id: int) -> Optional[Order]:
         """Get order by ID with items"""
-        return db.query(Order).options(selectinload(Order.items)).filter(Order.id == order_id).first()
+        result = await db.execute(
+            select(Order).options(selectinload(Order.items)).filter(Order.id == order_id)
+        )
+        return result.scalars().first()
     
-    def update_order_status(
+    async def update_order_status(
         self,
-        db: Session,
+        db: AsyncSession,
         order_id: int,
-        status: OrderStatus
+        status: OrderStatus,
+        publish: bool = True
     ) -> Optional[Order]:
-        """Update order status"""
-        order = db.query(Order).filter(Order.id == order_id).first()
+        """
+        Update order status and record an order.<status> event in the same
+        transaction. Event handlers pass ``publish=False``: the status they
+        apply came from another service's event, which was published already.
+        """
+        order = await db.get(Order, order_id)
         if not order:
             return None
         
+        old_status = order.status
         order.status = status
-        db.commit()
-        db.refresh(order)
+        if publish and _status_value(old_status) != _status_value(status):
+            add_event(db, f"order.{_status_value(status).lower()}", {
+                "order_id": order.id,
+                "old_status": _status_value(old_status),
+                "new_status": _status_value(status),
+                "customer_id": order.customer_id,
+                "restaurant_id": order.restaurant_id
+            })
+        await db.commit()
+        await db.refresh(order)
         return order
     
-    def get_order_items(self, db: Session, order_id: int) -> List[OrderItem]:
+    async def get_order_items(self, db: AsyncSession, order_id: int) -> List[OrderItem]:
         """Get order items for an order"""
-        return db.query(OrderItem).filter(OrderItem.order_id == order_id).all()
+        result = await db.execute(select(OrderItem).filter(OrderItem.order_id == order_id))
+        return result.scalars().all()
     
-    def compensate_order(self, db: Session, order_id: int) -> Order:
+    async def compensate_order(self, db: AsyncSession, order_id: int) -> Order:
         """
         Compensation method for order creation
         Cancels/deletes the order and its items
         """
-        order = db.query(Order).filter(Order.id == order_id).first()
+        order = await db.get(Order, order_id)
         if not order:
             raise ValueError("Order not found")
         
         # Delete order items
-        db.query(OrderItem).filter(OrderItem.order_id == order_id).delete()
+        await db.execute(delete(OrderItem).filter(OrderItem.order_id == order_id))
         
         # Cancel order
         order.status = OrderStatus.CANCELLED
-        db.commit()
-        db.refresh(order)
+        await db.commit()
+        await db.refresh(order)
         return order
     
-    def confirm_order(self, db: Session, order_id: int) -> Order:
+    async def confirm_order(self, db: AsyncSession, order_id: int) -> Order:
         """
         Confirm order after payment is successful
         """
-        order = db.query(Order).filter(Order.id == order_id).first()
+        order = await db.get(Order, order_id)
         if not order:
             raise ValueError("Order not found")
         
         if order.status == OrderStatus.PENDING_PAYMENT:
             order.status = OrderStatus.CONFIRMED
-            db.commit()
-            db.refresh(order)
+            add_event(db, "order.confirmed", {
+                "order_id": order.id,
+                "customer_id": order.customer_id,
+                "restaurant_id": order.restaurant_id,
+                "total_amount": float(order.total_amount),
+                "status": OrderStatus.CONFIRMED.value
+            })
+            await db.commit()
+            await db.refresh(order)
         
         return order
-
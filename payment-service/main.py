@@ -1,9 +1,17 @@
 from fastapi import FastAPI
 from app.routes import router
+from shared.dead_letters import router as dead_letter_router
 from config.settings import settings
 from database import Base, engine
+from shared.db_pool import get_pool_metrics
+from shared.migrations import run_migrations
+from shared.idempotency import idempotency_store
 from services.event_handlers import handle_order_created
-from shared.message_broker import get_message_broker
+from shared.message_broker import get_message_broker, get_event_metrics
+from shared.outbox import start_outbox_relay, stop_outbox_relay, get_outbox_metrics
+from shared.events import correlation_middleware
+from shared.auth import start_principal_invalidation
+import os
 
 app = FastAPI(
     title="Payment Service",
@@ -14,18 +22,43 @@ app = FastAPI(
 # Create database tables
 Base.metadata.create_all(bind=engine)
 
+# Apply index / schema migrations that create_all can't make on existing tables
+run_migrations(engine, "payment-service", os.path.join(os.path.dirname(__file__), "migrations"))
+
+# Events staged by a request carry the caller's X-Correlation-ID
+app.middleware("http")(correlation_middleware)
+
 # Include routes
 app.include_router(router)
+app.include_router(dead_letter_router)
 
 @app.get("/health")
 async def health_check():
     return {"status": "healthy", "service": "payment-service"}
 
+@app.get("/health/db/pool")
+async def pool_metrics():
+    return {"service": "payment-service", "pools": get_pool_metrics()}
+
+@app.get("/health/events")
+async def event_metrics():
+    return {"service": "payment-service", "events": get_event_metrics()}
+
+@app.get("/health/outbox")
+async def outbox_metrics():
+    return {"service": "payment-service", "outbox": await get_outbox_metrics()}
+
 # Create tables on startup
 @app.on_event("startup")
 async def startup_event():
     print("Payment Service database tables created successfully!")
     
+    # Drop idempotency keys past their TTL
+    try:
+        await idempotency_store.purge_expired()
+    except Exception as e:
+        print(f"Idempotency key cleanup error: {e}")
+    
     # Start event listeners (optional)
     try:
         message_broker = await get_message_broker()
@@ -36,6 +69,16 @@ async def startup_event():
     except Exception as e:
         print(f"Message broker startup error: {e}")
         # Continue without message broker
+    
+    # Drop cached users when the auth service reports a change
+    await start_principal_invalidation()
+    
+    # Relay events committed to the outbox on to RabbitMQ
+    start_outbox_relay()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await stop_outbox_relay()
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,2 @@
+-- Payment list pages newest first by (created_at, id)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_payments_created_at_id ON payments (created_at, id);
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Float, Enum
+from sqlalchemy import Column, Integer, String, DateTime, Float, Enum, Index
 from datetime import datetime
 import sys
 import os
@@ -10,6 +10,10 @@ from shared.database import Base
 
 class Payment(Base):
     __tablename__ = "payments"
+    __table_args__ = (
+        # Payment list pages newest first by (created_at, id)
+        Index("ix_payments_created_at_id", "created_at", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     order_id = Column(Integer, index=True)
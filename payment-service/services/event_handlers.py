@@ -1,5 +1,4 @@
 """Event handlers for payment service"""
-from sqlalchemy.orm import Session
 from datetime import datetime
 import sys
 import os
@@ -7,7 +6,7 @@ import asyncio
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'shared'))
 
-from shared.database import SessionLocal
+from shared.database import AsyncSessionLocal
 from models.payment import Payment
 from shared.models import PaymentCreate, PaymentStatus
 from services.payment_service import PaymentService
@@ -18,10 +17,15 @@ async def handle_order_created(event_data):
     order_id = order_data["order_id"]
     amount = order_data["total_amount"]
     
-    db = SessionLocal()
+    db = AsyncSessionLocal()
     try:
         payment_service = PaymentService()
         
+        # A redelivered event must not charge the order twice
+        if await payment_service.get_payment_by_order_id(db, order_id):
+            print(f"Payment for order {order_id} already exists, skipping")
+            return
+        
         # Create and process payment automatically
         payment_create = PaymentCreate(
             order_id=order_id,
@@ -30,7 +34,7 @@ async def handle_order_created(event_data):
             status=PaymentStatus.PENDING
         )
         
-        db_payment = payment_service.create_payment(db, payment_create)
+        db_payment = await payment_service.create_payment(db, payment_create)
         
         # Process payment
         payment_result = await payment_service.process_payment({
@@ -41,37 +45,16 @@ async def handle_order_created(event_data):
         
         # Update payment status
         if payment_result["success"]:
-            payment_service.update_payment_status(
+            await payment_service.update_payment_status(
                 db, db_payment.id, PaymentStatus.SUCCEEDED, payment_result["transaction_id"]
             )
         else:
-            payment_service.update_payment_status(
+            await payment_service.update_payment_status(
                 db, db_payment.id, PaymentStatus.FAILED, payment_result["transaction_id"]
             )
-        
-        # Publish payment event
-        if payment_result["success"]:
-            await payment_service.publish_payment_event(
-                "payment.succeeded",
-                {
-                    "order_id": order_id,
-                    "payment_id": db_payment.id,
-                    "amount": amount,
-                    "transaction_id": payment_result["transaction_id"]
-                }
-            )
-        else:
-            await payment_service.publish_payment_event(
-                "payment.failed",
-                {
-                    "order_id": order_id,
-                    "payment_id": db_payment.id,
-                    "amount": amount,
-                    "transaction_id": payment_result["transaction_id"]
-                }
-            )
     except Exception as e:
         print(f"Error processing payment for order {order_id}: {e}")
+        raise
     finally:
-        db.close()
+        await db.close()
 
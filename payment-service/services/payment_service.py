@@ -1,12 +1,20 @@
-from sqlalchemy.orm import Session
-from typing import List, Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from typing import List, Optional, Tuple
 from datetime import datetime
 import uuid
 import random
 import asyncio
 from models.payment import Payment
+from shared.pagination import keyset_query, split_page
 from shared.models import PaymentCreate, PaymentStatus
-from shared.message_broker import get_message_broker
+from shared.outbox import add_event
+
+# Status changes that other services react to
+PAYMENT_EVENTS = {
+    PaymentStatus.SUCCEEDED: "payment.succeeded",
+    PaymentStatus.FAILED: "payment.failed"
+}
 
 class PaymentService:
     """Service for payment processing"""
@@ -27,9 +35,9 @@ class PaymentService:
             "message": "Payment processed successfully" if success else "Payment failed"
         }
     
-    def create_payment(
+    async def create_payment(
         self,
-        db: Session,
+        db: AsyncSession,
         payment: PaymentCreate
     ) -> Payment:
         """Create a payment record"""
@@ -40,19 +48,19 @@ class PaymentService:
             status=payment.status
         )
         db.add(db_payment)
-        db.commit()
-        db.refresh(db_payment)
+        await db.commit()
+        await db.refresh(db_payment)
         return db_payment
     
-    def update_payment_status(
+    async def update_payment_status(
         self,
-        db: Session,
+        db: AsyncSession,
         payment_id: int,
         status: PaymentStatus,
         transaction_id: Optional[str] = None
     ) -> Payment:
         """Update payment status"""
-        payment = db.query(Payment).filter(Payment.id == payment_id).first()
+        payment = await db.get(Payment, payment_id)
         if not payment:
             raise ValueError("Payment not found")
         
@@ -60,26 +68,38 @@ class PaymentService:
         if transaction_id:
             payment.transaction_id = transaction_id
         payment.processed_at = datetime.utcnow()
-        db.commit()
-        db.refresh(payment)
+        if status in PAYMENT_EVENTS:
+            self._add_payment_event(db, PAYMENT_EVENTS[status], payment)
+        await db.commit()
+        await db.refresh(payment)
         return payment
     
-    def get_payments(
+    async def get_payments(
         self,
-        db: Session,
+        db: AsyncSession,
         skip: int = 0,
-        limit: int = 100
-    ) -> List[Payment]:
-        """Get all payments"""
-        return db.query(Payment).offset(skip).limit(limit).all()
+        limit: int = 100,
+        cursor: Optional[str] = None
+    ) -> Tuple[List[Payment], Optional[str]]:
+        """Get a page of payments (newest first) plus the next cursor"""
+        query = keyset_query(select(Payment), Payment.created_at, Payment.id, cursor, skip, limit)
+        result = await db.execute(query)
+        return split_page(result.scalars().all(), limit)
     
-    def get_payment_by_id(self, db: Session, payment_id: int) -> Optional[Payment]:
+    async def get_payment_by_id(self, db: AsyncSession, payment_id: int) -> Optional[Payment]:
         """Get payment by ID"""
-        return db.query(Payment).filter(Payment.id == payment_id).first()
+        return await db.get(Payment, payment_id)
+    
+    async def get_payment_by_order_id(self, db: AsyncSession, order_id: int) -> Optional[Payment]:
+        """Get the most recent payment for an order"""
+        result = await db.execute(
+            select(Payment).filter(Payment.order_id == order_id).order_by(Payment.id.desc()).limit(1)
+        )
+        return result.scalars().first()
     
-    def refund_payment(self, db: Session, payment_id: int) -> Payment:
+    async def refund_payment(self, db: AsyncSession, payment_id: int) -> Payment:
         """Refund a payment"""
-        payment = db.query(Payment).filter(Payment.id == payment_id).first()
+        payment = await db.get(Payment, payment_id)
         if not payment:
             raise ValueError("Payment not found")
         
@@ -87,37 +107,39 @@ class PaymentService:
             raise ValueError("Can only refund successful payments")
         
         payment.status = PaymentStatus.REFUNDED
-        db.commit()
-        db.refresh(payment)
+        self._add_payment_event(db, "payment.refunded", payment)
+        await db.commit()
+        await db.refresh(payment)
         return payment
     
-    def compensate_payment(self, db: Session, payment_id: int) -> Payment:
+    async def compensate_payment(self, db: AsyncSession, payment_id: int) -> Payment:
         """
         Compensation method for payment processing
         Refunds the payment if it was successful
         """
-        payment = db.query(Payment).filter(Payment.id == payment_id).first()
+        payment = await db.get(Payment, payment_id)
         if not payment:
             raise ValueError("Payment not found")
         
         # If payment was successful, refund it
         if payment.status == PaymentStatus.SUCCEEDED:
             payment.status = PaymentStatus.REFUNDED
-            db.commit()
-            db.refresh(payment)
+            await db.commit()
+            await db.refresh(payment)
         elif payment.status == PaymentStatus.PENDING:
             # If payment is still pending, just mark as failed
             payment.status = PaymentStatus.FAILED
-            db.commit()
-            db.refresh(payment)
+            await db.commit()
+            await db.refresh(payment)
         
         return payment
     
-    async def publish_payment_event(self, event_type: str, payment_data: dict):
-        """Publish payment event"""
-        try:
-            message_broker = await get_message_broker()
-            await message_broker.publish_event(event_type, payment_data)
-        except Exception as e:
-            print(f"Message broker error: {e}")
+    def _add_payment_event(self, db: AsyncSession, event_type: str, payment: Payment):
+        """Record a payment event in the caller's transaction (published by the outbox relay)"""
+        add_event(db, event_type, {
+            "order_id": payment.order_id,
+            "payment_id": payment.id,
+            "amount": payment.amount,
+            "transaction_id": payment.transaction_id
+        })
 
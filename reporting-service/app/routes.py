@@ -1,14 +1,15 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional
 from datetime import datetime
 import sys
 import os
+import httpx
 
 # Add shared directory to path
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'shared'))
 
-from database import get_db
+from database import get_read_db
 from app.schemas import (
     ActiveCounts, CustomerHistory, TopCustomers, RestaurantOrders,
     RestaurantRevenue, PopularMenuItems, StatusDistribution,
@@ -16,14 +17,15 @@ from app.schemas import (
 )
 from shared.auth import get_current_user, require_role, UserRole
 from services.reporting_service import ReportingService
+from shared.pagination import TotalMode
 
 router = APIRouter()
 
 @router.get("/reports/active-counts", response_model=ActiveCounts)
-async def get_active_counts(db: Session = Depends(get_db)):
+async def get_active_counts(db: AsyncSession = Depends(get_read_db)):
     """Get total active customers, restaurants, and drivers"""
     reporting_service = ReportingService()
-    return reporting_service.get_active_counts(db)
+    return await reporting_service.get_active_counts(db)
 
 @router.get("/reports/customer-history/{customer_id}", response_model=CustomerHistory)
 async def get_customer_history(
@@ -31,7 +33,9 @@ async def get_customer_history(
     skip: int = 0,
     limit: int = 100,
     customer_name: Optional[str] = Query(None, description="Optional search by customer name (ILIKE)"),
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    total: TotalMode = Query(TotalMode.EXACT, description="exact, approximate or none"),
+    db: AsyncSession = Depends(get_read_db),
     current_user = Depends(get_current_user)
 ):
     """Get detailed history of all orders placed by a customer"""
@@ -39,24 +43,29 @@ async def get_customer_history(
         raise HTTPException(status_code=403, detail="Not authorized to view this customer's history")
     
     reporting_service = ReportingService()
-    return reporting_service.get_customer_history(db, customer_id, skip, limit, customer_name)
+    try:
+        return await reporting_service.get_customer_history(db, customer_id, skip, limit, customer_name, cursor, total)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=503, detail=f"User lookup unavailable: {e}")
 
 @router.get("/reports/top-customers", response_model=TopCustomers)
 async def get_top_customers(
     limit: int = 5,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user = Depends(require_role(UserRole.ADMIN))
 ):
     """Get top customers with highest order frequency"""
     reporting_service = ReportingService()
-    return reporting_service.get_top_customers(db, limit)
+    return await reporting_service.get_top_customers(db, limit)
 
 @router.get("/reports/restaurant-orders", response_model=RestaurantOrders)
 async def get_restaurant_orders(
     restaurant_id: int,
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user = Depends(get_current_user)
 ):
     """Get number of orders received and fulfilled by a restaurant"""
@@ -64,14 +73,14 @@ async def get_restaurant_orders(
         raise HTTPException(status_code=403, detail="Not authorized to view this restaurant's data")
     
     reporting_service = ReportingService()
-    return reporting_service.get_restaurant_orders(db, restaurant_id, start_date, end_date)
+    return await reporting_service.get_restaurant_orders(db, restaurant_id, start_date, end_date)
 
 @router.get("/reports/restaurant-revenue", response_model=RestaurantRevenue)
 async def get_restaurant_revenue(
     restaurant_id: int,
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user = Depends(get_current_user)
 ):
     """Get breakdown of total revenue generated by a restaurant"""
@@ -79,27 +88,27 @@ async def get_restaurant_revenue(
         raise HTTPException(status_code=403, detail="Not authorized to view this restaurant's data")
     
     reporting_service = ReportingService()
-    return reporting_service.get_restaurant_revenue(db, restaurant_id, start_date, end_date)
+    return await reporting_service.get_restaurant_revenue(db, restaurant_id, start_date, end_date)
 
 @router.get("/reports/popular-menu-items", response_model=PopularMenuItems)
 async def get_popular_menu_items(
     limit: int = 10,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """Get most ordered menu items across all restaurants"""
     reporting_service = ReportingService()
-    return reporting_service.get_popular_menu_items(db, limit)
+    return await reporting_service.get_popular_menu_items(db, limit)
 
 @router.get("/reports/order-status-distribution", response_model=StatusDistribution)
-async def get_order_status_distribution(db: Session = Depends(get_db)):
+async def get_order_status_distribution(db: AsyncSession = Depends(get_read_db)):
     """Get distribution of order statuses"""
     reporting_service = ReportingService()
-    return reporting_service.get_order_status_distribution(db)
+    return await reporting_service.get_order_status_distribution(db)
 
 @router.get("/reports/driver-deliveries", response_model=DriverDeliveries)
 async def get_driver_deliveries(
     driver_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user = Depends(get_current_user)
 ):
     """Get number of deliveries completed by a driver"""
@@ -107,18 +116,18 @@ async def get_driver_deliveries(
         raise HTTPException(status_code=403, detail="Not authorized to view this driver's data")
     
     reporting_service = ReportingService()
-    return reporting_service.get_driver_deliveries(db, driver_id)
+    return await reporting_service.get_driver_deliveries(db, driver_id)
 
 @router.get("/reports/cancelled-orders", response_model=CancelledOrders)
 async def get_cancelled_orders(
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user = Depends(require_role(UserRole.ADMIN))
 ):
     """Get details of cancelled orders and total amount"""
     reporting_service = ReportingService()
-    return reporting_service.get_cancelled_orders(db, start_date, end_date)
+    return await reporting_service.get_cancelled_orders(db, start_date, end_date)
 
 @router.get("/reports/average-order-value", response_model=AverageOrderValue)
 async def get_average_order_value(
@@ -126,20 +135,20 @@ async def get_average_order_value(
     restaurant_id: Optional[int] = None,
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """Calculate average order value"""
     reporting_service = ReportingService()
-    return reporting_service.get_average_order_value(db, customer_id, restaurant_id, start_date, end_date)
+    return await reporting_service.get_average_order_value(db, customer_id, restaurant_id, start_date, end_date)
 
 @router.get("/reports/peak-times", response_model=PeakTimes)
 async def get_peak_times(
     granularity: str = "day",
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """Get peak times for orders"""
     reporting_service = ReportingService()
-    return reporting_service.get_peak_times(db, granularity)
+    return await reporting_service.get_peak_times(db, granularity)
 
 @router.get("/health")
 async def health_check():
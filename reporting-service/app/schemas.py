@@ -19,7 +19,8 @@ class OrderHistoryItem(BaseModel):
 class CustomerHistory(BaseModel):
     customer_id: int
     orders: List[OrderHistoryItem]
-    total_orders: int
+    total_orders: Optional[int] = None
+    next_cursor: Optional[str] = None
 
 class TopCustomer(BaseModel):
     customer_id: int
@@ -5,16 +5,17 @@ import os
 # Add shared directory to path
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'shared'))
 
-from shared.database import Base, engine, SessionLocal
+from shared.database import Base, engine, AsyncSessionLocal, ReadSessionLocal
 from models.event_log import EventLog
 from models.order_analytics import OrderAnalytics
 from models.customer_analytics import CustomerAnalytics
 from models.restaurant_analytics import RestaurantAnalytics
 from models.driver_analytics import DriverAnalytics
 
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+async def get_read_db():
+    async with ReadSessionLocal() as db:
         yield db
-    finally:
-        db.close()
@@ -1,9 +1,14 @@
 from fastapi import FastAPI
 from app.routes import router
+from shared.dead_letters import router as dead_letter_router
 from config.settings import settings
 from database import Base, engine
-from services.event_handlers import handle_all_events
-from shared.message_broker import get_message_broker
+from shared.db_pool import get_pool_metrics
+from shared.migrations import run_migrations
+from services.event_handlers import ANALYTICS_EVENTS, handle_event_batch
+from shared.message_broker import get_message_broker, get_event_metrics
+from shared.auth import start_principal_invalidation
+import os
 
 app = FastAPI(
     title="Reporting Service",
@@ -14,13 +19,25 @@ app = FastAPI(
 # Create database tables
 Base.metadata.create_all(bind=engine)
 
+# Apply index / schema migrations that create_all can't make on existing tables
+run_migrations(engine, "reporting-service", os.path.join(os.path.dirname(__file__), "migrations"))
+
 # Include routes
 app.include_router(router)
+app.include_router(dead_letter_router)
 
 @app.get("/health")
 async def health_check():
     return {"status": "healthy", "service": "reporting-service"}
 
+@app.get("/health/db/pool")
+async def pool_metrics():
+    return {"service": "reporting-service", "pools": get_pool_metrics()}
+
+@app.get("/health/events")
+async def event_metrics():
+    return {"service": "reporting-service", "events": get_event_metrics()}
+
 # Start event listeners on startup
 @app.on_event("startup")
 async def startup_event():
@@ -29,25 +46,15 @@ async def startup_event():
     # Start message broker subscription
     try:
         message_broker = await get_message_broker()
-        await message_broker.subscribe_to_events(
-            [
-                "order.created",
-                "order.confirmed",
-                "order.accepted",
-                "order.preparing",
-                "order.ready_for_delivery",
-                "order.delivered",
-                "order.cancelled",
-                "payment.succeeded",
-                "payment.failed",
-                "driver.assigned"
-            ],
-            handle_all_events
-        )
+        # High-volume consumer: events are logged and aggregated a batch at a time
+        await message_broker.subscribe_batch(ANALYTICS_EVENTS, handle_event_batch)
         print("Reporting Service connected to RabbitMQ successfully!")
     except Exception as e:
         print(f"Message broker startup error: {e}")
         print("Continuing without RabbitMQ - some features may not work")
+    
+    # Drop cached users when the auth service reports a change
+    await start_principal_invalidation()
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,2 @@
+-- Status / date-range analytics reports
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_order_analytics_status_created_at ON order_analytics (status, created_at);
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, DateTime, Float, String
+from sqlalchemy import Column, Integer, DateTime, Float, String, Index
 from datetime import datetime
 import sys
 import os
@@ -10,6 +10,10 @@ from shared.database import Base
 
 class OrderAnalytics(Base):
     __tablename__ = "order_analytics"
+    __table_args__ = (
+        # Cancelled-order and revenue reports filter on status within a date range
+        Index("ix_order_analytics_status_created_at", "status", "created_at"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     order_id = Column(Integer, index=True)
@@ -4,7 +4,7 @@ import sys
 import os
 
 # Add shared directory to path
-sys.path.append(os.path.dirname(__file__), '..', '..', 'shared'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'shared'))
 
 from shared.database import Base
 
@@ -1,31 +1,31 @@
 """Event handlers for reporting service"""
-from sqlalchemy.orm import Session
-from datetime import datetime
 import sys
 import os
-import json
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'shared'))
 
-from shared.database import SessionLocal
+from shared.database import AsyncSessionLocal
 from services.reporting_service import ReportingService
 
-async def handle_all_events(event_data):
-    """Handle all events for analytics"""
-    event_type = event_data["event_type"]
-    data = event_data["data"]
-    
-    db = SessionLocal()
-    try:
-        reporting_service = ReportingService()
-        
-        # Log the event
-        reporting_service.log_event(db, event_type, data)
-        
-        # Update analytics
-        reporting_service.update_analytics(db, event_type, data)
-    except Exception as e:
-        print(f"Error processing analytics event: {e}")
-    finally:
-        db.close()
+# Every event here is logged; record_events aggregates the ones it knows
+ANALYTICS_EVENTS = [
+    "order.created",
+    "order.confirmed",
+    "order.accepted",
+    "order.preparing",
+    "order.ready_for_delivery",
+    "order.delivered",
+    "order.cancelled",
+    "payment.succeeded",
+    "payment.failed",
+    "driver.assigned"
+]
 
+async def handle_event_batch(events):
+    """Log and aggregate a batch of events in one transaction"""
+    async with AsyncSessionLocal() as db:
+        try:
+            await ReportingService().record_events(db, events)
+        except Exception as e:
+            print(f"Error processing analytics batch of {len(events)} events: {e}")
+            raise
@@ -1,5 +1,5 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import text, select, insert, update
 from typing import Optional, List, Dict
 from datetime import datetime
 from models.event_log import EventLog
@@ -7,24 +7,26 @@ from models.order_analytics import OrderAnalytics
 from models.customer_analytics import CustomerAnalytics
 from models.restaurant_analytics import RestaurantAnalytics
 from models.driver_analytics import DriverAnalytics
-import json
+from shared.pagination import decode_cursor, split_page, TotalMode
+from shared.codecs import json_dumps
+from shared.user_directory import user_directory
 
 class ReportingService:
     """Service for analytics and reporting"""
     
-    def get_active_counts(self, db: Session) -> Dict[str, int]:
+    async def get_active_counts(self, db: AsyncSession) -> Dict[str, int]:
         """Get total active customers, restaurants, and drivers"""
-        customers = db.execute(
+        customers = (await db.execute(
             text("SELECT COUNT(*) FROM users WHERE role = 'CUSTOMER' AND is_active = true")
-        ).scalar() or 0
+        )).scalar() or 0
         
-        restaurants = db.execute(
+        restaurants = (await db.execute(
             text("SELECT COUNT(*) FROM restaurants")
-        ).scalar() or 0
+        )).scalar() or 0
         
-        drivers = db.execute(
+        drivers = (await db.execute(
             text("SELECT COUNT(*) FROM drivers")
-        ).scalar() or 0
+        )).scalar() or 0
         
         return {
             "active_customers": int(customers),
@@ -32,34 +34,52 @@ class ReportingService:
             "active_drivers": int(drivers)
         }
     
-    def get_customer_history(
+    async def get_customer_history(
         self,
-        db: Session,
+        db: AsyncSession,
         customer_id: int,
         skip: int = 0,
         limit: int = 100,
-        customer_name: Optional[str] = None
+        customer_name: Optional[str] = None,
+        cursor: Optional[str] = None,
+        total: TotalMode = TotalMode.EXACT
     ) -> Dict:
-        """Get detailed history of all orders placed by a customer"""
+        """Get detailed history of all orders placed by a customer, newest first"""
         if customer_name:
-            user_row = db.execute(
-                text("SELECT id FROM users WHERE id = :cid AND name ILIKE :name"),
-                {"cid": customer_id, "name": f"%{customer_name}%"}
-            ).fetchone()
-            if not user_row:
-                return {"customer_id": customer_id, "orders": [], "total_orders": 0}
-        
-        orders_rows = db.execute(text("""
+            # Users belong to the auth service; ask it (cached) rather than reading its table
+            customer = await user_directory.get_user(customer_id)
+            if not customer or customer_name.lower() not in (customer.get("name") or "").lower():
+                return {"customer_id": customer_id, "orders": [], "total_orders": 0, "next_cursor": None}
+        
+        params = {"customer_id": customer_id, "limit": limit + 1}
+        if cursor:
+            # Keyset page: rows strictly after the last one the client saw
+            params["cursor_created_at"], params["cursor_id"] = decode_cursor(cursor)
+            page_filter = "AND (created_at, id) < (:cursor_created_at, :cursor_id)"
+            params["skip"] = 0
+        else:
+            page_filter = ""
+            params["skip"] = skip
+        
+        orders_rows = (await db.execute(text(f"""
             SELECT id, restaurant_id, total_amount, status, created_at, delivery_address
             FROM orders 
-            WHERE customer_id = :customer_id 
-            ORDER BY created_at DESC 
+            WHERE customer_id = :customer_id {page_filter}
+            ORDER BY created_at DESC, id DESC 
             OFFSET :skip LIMIT :limit
-        """), {"customer_id": customer_id, "skip": skip, "limit": limit}).fetchall()
+        """), params)).fetchall()
+        orders_rows, next_cursor = split_page(orders_rows, limit)
         
-        total_count = db.execute(text("""
-            SELECT COUNT(*) FROM orders WHERE customer_id = :customer_id
-        """), {"customer_id": customer_id}).scalar()
+        total_count = None
+        if total == TotalMode.APPROXIMATE:
+            # customer_analytics keeps a running (eventually consistent) order count per customer
+            total_count = (await db.execute(text(
+                "SELECT total_orders FROM customer_analytics WHERE customer_id = :customer_id"
+            ), {"customer_id": customer_id})).scalar()
+        elif total != TotalMode.NONE:
+            total_count = (await db.execute(text("""
+                SELECT COUNT(*) FROM orders WHERE customer_id = :customer_id
+            """), {"customer_id": customer_id})).scalar()
         
         orders = [
             {
@@ -76,12 +96,13 @@ class ReportingService:
         return {
             "customer_id": customer_id,
             "orders": orders,
-            "total_orders": int(total_count) if total_count else 0
+            "total_orders": int(total_count or 0) if total != TotalMode.NONE else None,
+            "next_cursor": next_cursor
         }
     
-    def get_top_customers(self, db: Session, limit: int = 5) -> Dict:
+    async def get_top_customers(self, db: AsyncSession, limit: int = 5) -> Dict:
         """Get top customers with highest order frequency"""
-        rows = db.execute(text("""
+        rows = (await db.execute(text("""
             SELECT customer_id, 
                    COUNT(*) as total_orders,
                    SUM(total_amount) as total_spent,
@@ -90,7 +111,7 @@ class ReportingService:
             GROUP BY customer_id 
             ORDER BY COUNT(*) DESC 
             LIMIT :limit
-        """), {"limit": limit}).fetchall()
+        """), {"limit": limit})).fetchall()
         
         top_customers = [
             {
@@ -104,22 +125,22 @@ class ReportingService:
         
         return {"top_customers": top_customers, "limit": limit}
     
-    def get_restaurant_orders(
+    async def get_restaurant_orders(
         self,
-        db: Session,
+        db: AsyncSession,
         restaurant_id: int,
         start_date: Optional[datetime] = None,
         end_date: Optional[datetime] = None
     ) -> Dict:
         """Get number of orders received and fulfilled by a restaurant"""
-        query = db.query(OrderAnalytics).filter(OrderAnalytics.restaurant_id == restaurant_id)
+        query = select(OrderAnalytics).filter(OrderAnalytics.restaurant_id == restaurant_id)
         
         if start_date:
             query = query.filter(OrderAnalytics.created_at >= start_date)
         if end_date:
             query = query.filter(OrderAnalytics.created_at <= end_date)
         
-        orders = query.all()
+        orders = (await db.execute(query)).scalars().all()
         
         total_orders = len(orders)
         fulfilled_orders = len([o for o in orders if o.status == "DELIVERED"])
@@ -132,15 +153,15 @@ class ReportingService:
             "fulfillment_rate": (fulfilled_orders / total_orders * 100) if total_orders > 0 else 0
         }
     
-    def get_restaurant_revenue(
+    async def get_restaurant_revenue(
         self,
-        db: Session,
+        db: AsyncSession,
         restaurant_id: int,
         start_date: Optional[datetime] = None,
         end_date: Optional[datetime] = None
     ) -> Dict:
         """Get breakdown of total revenue generated by a restaurant"""
-        query = db.query(OrderAnalytics).filter(
+        query = select(OrderAnalytics).filter(
             OrderAnalytics.restaurant_id == restaurant_id,
             OrderAnalytics.status == "DELIVERED"
         )
@@ -150,7 +171,7 @@ class ReportingService:
         if end_date:
             query = query.filter(OrderAnalytics.created_at <= end_date)
         
-        orders = query.all()
+        orders = (await db.execute(query)).scalars().all()
         total_revenue = sum(order.total_amount for order in orders)
         
         return {
@@ -160,9 +181,9 @@ class ReportingService:
             "order_count": len(orders)
         }
     
-    def get_popular_menu_items(self, db: Session, limit: int = 10) -> Dict:
+    async def get_popular_menu_items(self, db: AsyncSession, limit: int = 10) -> Dict:
         """Get most ordered menu items across all restaurants"""
-        rows = db.execute(text("""
+        rows = (await db.execute(text("""
             SELECT mi.name AS item_name,
                    COUNT(oi.id) AS order_count,
                    r.name AS restaurant
@@ -172,7 +193,7 @@ class ReportingService:
             GROUP BY mi.name, r.name
             ORDER BY COUNT(oi.id) DESC
             LIMIT :limit
-        """), {"limit": limit}).fetchall()
+        """), {"limit": limit})).fetchall()
         
         popular = [
             {"item_name": row.item_name, "order_count": int(row.order_count), "restaurant": row.restaurant}
@@ -180,35 +201,35 @@ class ReportingService:
         ]
         return {"popular_items": popular, "limit": limit}
     
-    def get_order_status_distribution(self, db: Session) -> Dict:
+    async def get_order_status_distribution(self, db: AsyncSession) -> Dict:
         """Get distribution of order statuses"""
-        rows = db.execute(text("SELECT status, COUNT(*) AS c FROM orders GROUP BY status")).fetchall()
+        rows = (await db.execute(text("SELECT status, COUNT(*) AS c FROM orders GROUP BY status"))).fetchall()
         return {"status_distribution": {row.status: int(row.c) for row in rows}}
     
-    def get_driver_deliveries(self, db: Session, driver_id: int) -> Dict:
+    async def get_driver_deliveries(self, db: AsyncSession, driver_id: int) -> Dict:
         """Get number of deliveries completed by a driver"""
-        row = db.execute(text(
+        row = (await db.execute(text(
             "SELECT COUNT(*) AS deliveries FROM deliveries WHERE driver_id = :did AND status = 'DELIVERED'"
-        ), {"did": driver_id}).fetchone()
+        ), {"did": driver_id})).fetchone()
         
         deliveries = int(row.deliveries) if row and row.deliveries is not None else 0
         return {"driver_id": driver_id, "total_deliveries": deliveries}
     
-    def get_cancelled_orders(
+    async def get_cancelled_orders(
         self,
-        db: Session,
+        db: AsyncSession,
         start_date: Optional[datetime] = None,
         end_date: Optional[datetime] = None
     ) -> Dict:
         """Get details of cancelled orders and total amount"""
-        query = db.query(OrderAnalytics).filter(OrderAnalytics.status == "CANCELLED")
+        query = select(OrderAnalytics).filter(OrderAnalytics.status == "CANCELLED")
         
         if start_date:
             query = query.filter(OrderAnalytics.created_at >= start_date)
         if end_date:
             query = query.filter(OrderAnalytics.created_at <= end_date)
         
-        cancelled_orders = query.all()
+        cancelled_orders = (await db.execute(query)).scalars().all()
         total_cancelled_amount = sum(order.total_amount for order in cancelled_orders)
         
         return {
@@ -217,16 +238,16 @@ class ReportingService:
             "order_count": len(cancelled_orders)
         }
     
-    def get_average_order_value(
+    async def get_average_order_value(
         self,
-        db: Session,
+        db: AsyncSession,
         customer_id: Optional[int] = None,
         restaurant_id: Optional[int] = None,
         start_date: Optional[datetime] = None,
         end_date: Optional[datetime] = None
     ) -> Dict:
         """Calculate average order value"""
-        query = db.query(OrderAnalytics).filter(OrderAnalytics.status == "DELIVERED")
+        query = select(OrderAnalytics).filter(OrderAnalytics.status == "DELIVERED")
         
         if customer_id:
             query = query.filter(OrderAnalytics.customer_id == customer_id)
@@ -237,7 +258,7 @@ class ReportingService:
         if end_date:
             query = query.filter(OrderAnalytics.created_at <= end_date)
         
-        orders = query.all()
+        orders = (await db.execute(query)).scalars().all()
         
         if not orders:
             return {"average_order_value": 0.0, "order_count": 0}
@@ -251,7 +272,7 @@ class ReportingService:
             "total_amount": total_amount
         }
     
-    def get_peak_times(self, db: Session, granularity: str = "day") -> Dict:
+    async def get_peak_times(self, db: AsyncSession, granularity: str = "day") -> Dict:
         """
         Get peak times for orders based on granularity
         
@@ -264,7 +285,7 @@ class ReportingService:
         """
         if granularity == "day":
             # Show hourly peaks for a day (most popular time ranges during the day)
-            rows = db.execute(text("""
+            rows = (await db.execute(text("""
                 SELECT 
                     to_char(date_trunc('hour', created_at), 'HH24:00') AS time_range,
                     COUNT(*) AS order_count
@@ -273,7 +294,7 @@ class ReportingService:
                 GROUP BY date_trunc('hour', created_at)
                 ORDER BY order_count DESC
                 LIMIT 10
-            """)).fetchall()
+            """))).fetchall()
             
             peak_times = []
             for row in rows:
@@ -294,7 +315,7 @@ class ReportingService:
             
         elif granularity == "week":
             # Show daily peaks for a week (most popular days)
-            rows = db.execute(text("""
+            rows = (await db.execute(text("""
                 SELECT 
                     to_char(created_at, 'Day') AS day_name,
                     to_char(created_at, 'D') AS day_number,
@@ -303,7 +324,7 @@ class ReportingService:
                 WHERE created_at >= date_trunc('week', CURRENT_DATE)
                 GROUP BY to_char(created_at, 'Day'), to_char(created_at, 'D')
                 ORDER BY to_char(created_at, 'D')::int
-            """)).fetchall()
+            """))).fetchall()
             
             # Sort by order count for peaks, but also include all days
             all_days = [
@@ -328,7 +349,7 @@ class ReportingService:
             
         elif granularity == "month":
             # Show weekly peaks for a month (weeks with most orders)
-            rows = db.execute(text("""
+            rows = (await db.execute(text("""
                 SELECT 
                     to_char(date_trunc('week', created_at), 'YYYY-MM-DD') AS week_start,
                     to_char(date_trunc('week', created_at) + INTERVAL '6 days', 'YYYY-MM-DD') AS week_end,
@@ -338,7 +359,7 @@ class ReportingService:
                 GROUP BY date_trunc('week', created_at)
                 ORDER BY order_count DESC
                 LIMIT 5
-            """)).fetchall()
+            """))).fetchall()
             
             peak_weeks = [
                 {
@@ -359,7 +380,7 @@ class ReportingService:
             
         elif granularity == "year":
             # Show monthly peaks for a year (months with highest order counts)
-            rows = db.execute(text("""
+            rows = (await db.execute(text("""
                 SELECT 
                     to_char(created_at, 'Month') AS month_name,
                     to_char(created_at, 'MM') AS month_number,
@@ -369,7 +390,7 @@ class ReportingService:
                 WHERE created_at >= date_trunc('year', CURRENT_DATE)
                 GROUP BY to_char(created_at, 'Month'), to_char(created_at, 'MM'), to_char(created_at, 'YYYY')
                 ORDER BY to_char(created_at, 'MM')::int
-            """)).fetchall()
+            """))).fetchall()
             
             all_months = [
                 {
@@ -398,93 +419,110 @@ class ReportingService:
             "data": []
         }
     
-    def log_event(
-        self,
-        db: Session,
-        event_type: str,
-        data: dict
-    ):
-        """Log an event"""
-        event_log = EventLog(
-            event_type=event_type,
-            order_id=data.get("order_id"),
-            user_id=data.get("customer_id"),
-            restaurant_id=data.get("restaurant_id"),
-            driver_id=data.get("driver_id"),
-            data=json.dumps(data)
+    async def record_events(self, db: AsyncSession, events: List[dict]):
+        """
+        Log a batch of events and fold them into the analytics tables in one
+        transaction: one multi-row insert per table and one read/update per
+        set of counters, however many events the batch holds.
+        """
+        await db.execute(insert(EventLog), [
+            {
+                "event_type": event["event_type"],
+                "order_id": event["data"].get("order_id"),
+                "user_id": event["data"].get("customer_id"),
+                "restaurant_id": event["data"].get("restaurant_id"),
+                "driver_id": event["data"].get("driver_id"),
+                "data": json_dumps(event["data"])
+            }
+            for event in events
+        ])
+        
+        by_type: Dict[str, List[dict]] = {}
+        for event in events:
+            by_type.setdefault(event["event_type"], []).append(event["data"])
+        
+        # Created before delivered, so an order created and delivered in one batch is marked delivered
+        now = datetime.utcnow()
+        if by_type.get("order.created"):
+            await self._record_orders_created(db, by_type["order.created"], now)
+        if by_type.get("order.delivered"):
+            await self._record_orders_delivered(db, by_type["order.delivered"], now)
+        await db.commit()
+    
+    async def _record_orders_created(self, db: AsyncSession, orders: List[dict], now: datetime):
+        """Add the orders and bump customer/restaurant totals"""
+        await db.execute(insert(OrderAnalytics), [
+            {
+                "order_id": data["order_id"],
+                "customer_id": data["customer_id"],
+                "restaurant_id": data["restaurant_id"],
+                "total_amount": data["total_amount"],
+                "status": "PENDING_PAYMENT"
+            }
+            for data in orders
+        ])
+        
+        customers: Dict[int, list] = {}
+        restaurants: Dict[int, list] = {}
+        for data in orders:
+            for totals, key in ((customers, data["customer_id"]), (restaurants, data["restaurant_id"])):
+                entry = totals.setdefault(key, [0, 0.0])
+                entry[0] += 1
+                entry[1] += data.get("total_amount", 0)
+        
+        await self._add_to_totals(
+            db, CustomerAnalytics, CustomerAnalytics.customer_id, customers,
+            "total_orders", "total_spent", "last_order_date", now
+        )
+        await self._add_to_totals(
+            db, RestaurantAnalytics, RestaurantAnalytics.restaurant_id, restaurants,
+            "total_orders", "total_revenue", "last_order_date", now
         )
-        db.add(event_log)
-        db.commit()
     
-    def update_analytics(
+    async def _record_orders_delivered(self, db: AsyncSession, orders: List[dict], now: datetime):
+        """Mark the orders delivered and bump driver totals"""
+        await db.execute(
+            update(OrderAnalytics)
+            .where(OrderAnalytics.order_id.in_([data["order_id"] for data in orders]))
+            .values(status="DELIVERED", completed_at=now)
+        )
+        
+        drivers: Dict[int, list] = {}
+        for data in orders:
+            if "driver_id" in data:
+                entry = drivers.setdefault(data["driver_id"], [0, 0.0])
+                entry[0] += 1
+                entry[1] += data.get("delivery_fee", 0)
+        
+        await self._add_to_totals(
+            db, DriverAnalytics, DriverAnalytics.driver_id, drivers,
+            "total_deliveries", "total_earnings", "last_delivery_date", now
+        )
+    
+    async def _add_to_totals(
         self,
-        db: Session,
-        event_type: str,
-        data: dict
+        db: AsyncSession,
+        model,
+        key_column,
+        totals: Dict[int, list],
+        count_field: str,
+        amount_field: str,
+        date_field: str,
+        now: datetime
     ):
-        """Update analytics based on event type"""
-        if event_type == "order.created":
-            # Update order analytics
-            order_analytics = OrderAnalytics(
-                order_id=data["order_id"],
-                customer_id=data["customer_id"],
-                restaurant_id=data["restaurant_id"],
-                total_amount=data["total_amount"],
-                status="PENDING_PAYMENT"
-            )
-            db.add(order_analytics)
-            db.commit()
-            
-            # Update customer analytics
-            customer_analytics = db.query(CustomerAnalytics).filter(
-                CustomerAnalytics.customer_id == data["customer_id"]
-            ).first()
-            
-            if not customer_analytics:
-                customer_analytics = CustomerAnalytics(customer_id=data["customer_id"])
-                db.add(customer_analytics)
-            
-            customer_analytics.total_orders += 1
-            customer_analytics.total_spent += data.get("total_amount", 0)
-            customer_analytics.last_order_date = datetime.utcnow()
-            db.commit()
-            
-            # Update restaurant analytics
-            restaurant_analytics = db.query(RestaurantAnalytics).filter(
-                RestaurantAnalytics.restaurant_id == data["restaurant_id"]
-            ).first()
-            
-            if not restaurant_analytics:
-                restaurant_analytics = RestaurantAnalytics(restaurant_id=data["restaurant_id"])
-                db.add(restaurant_analytics)
-            
-            restaurant_analytics.total_orders += 1
-            restaurant_analytics.total_revenue += data.get("total_amount", 0)
-            restaurant_analytics.last_order_date = datetime.utcnow()
-            db.commit()
-        
-        elif event_type == "order.delivered":
-            # Update completed order analytics
-            order_analytics = db.query(OrderAnalytics).filter(
-                OrderAnalytics.order_id == data["order_id"]
-            ).first()
-            if order_analytics:
-                order_analytics.status = "DELIVERED"
-                order_analytics.completed_at = datetime.utcnow()
-                db.commit()
-            
-            # Update driver analytics
-            if "driver_id" in data:
-                driver_analytics = db.query(DriverAnalytics).filter(
-                    DriverAnalytics.driver_id == data["driver_id"]
-                ).first()
-                
-                if not driver_analytics:
-                    driver_analytics = DriverAnalytics(driver_id=data["driver_id"])
-                    db.add(driver_analytics)
-                
-                driver_analytics.total_deliveries += 1
-                driver_analytics.total_earnings += data.get("delivery_fee", 0)
-                driver_analytics.last_delivery_date = datetime.utcnow()
-                db.commit()
-
+        """Add (count, amount) per key to an analytics table, creating missing rows at zero"""
+        if not totals:
+            return
+        rows = {}
+        for row in (await db.execute(select(model).filter(key_column.in_(list(totals))))).scalars():
+            rows.setdefault(getattr(row, key_column.key), row)
+        
+        for key, (count, amount) in totals.items():
+            row = rows.get(key)
+            if row is None:
+                # Column defaults only apply on insert, so start new rows at zero explicitly
+                row = model(**{key_column.key: key, count_field: 0, amount_field: 0.0})
+                db.add(row)
+            setattr(row, count_field, (getattr(row, count_field) or 0) + count)
+            setattr(row, amount_field, (getattr(row, amount_field) or 0.0) + amount)
+            setattr(row, date_field, now)
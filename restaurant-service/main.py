@@ -1,8 +1,11 @@
 from fastapi import FastAPI
 from app.routes import router
+from shared.dead_letters import router as dead_letter_router
 from config.settings import settings
 from services.event_handlers import handle_order_confirmed
-from shared.message_broker import get_message_broker
+from shared.message_broker import get_message_broker, get_event_metrics
+from shared.db_pool import get_pool_metrics
+from shared.auth import start_principal_invalidation
 
 app = FastAPI(
     title="Restaurant Service",
@@ -12,11 +15,20 @@ app = FastAPI(
 
 # Include routes
 app.include_router(router)
+app.include_router(dead_letter_router)
 
 @app.get("/health")
 async def health_check():
     return {"status": "healthy", "service": "restaurant-service"}
 
+@app.get("/health/db/pool")
+async def pool_metrics():
+    return {"service": "restaurant-service", "pools": get_pool_metrics()}
+
+@app.get("/health/events")
+async def event_metrics():
+    return {"service": "restaurant-service", "events": get_event_metrics()}
+
 # Start event listeners on startup
 @app.on_event("startup")
 async def startup_event():
@@ -28,6 +40,9 @@ async def startup_event():
         )
     except Exception as e:
         print(f"Message broker subscription error: {e}")
+    
+    # Drop cached users when the auth service reports a change
+    await start_principal_invalidation()
 
 if __name__ == "__main__":
     import uvicorn
@@ -1,5 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
 from typing import Dict
 import sys
 import os
@@ -25,7 +26,7 @@ SAGA_WORKFLOWS = {
 @router.post("/sagas/start", response_model=SagaResponse)
 async def start_saga(
     request: SagaStartRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Start a new saga transaction
@@ -58,7 +59,7 @@ async def start_saga(
         
         # Create saga instance
         orchestrator = SagaOrchestrator(db)
-        saga_instance = orchestrator.create_saga_instance(
+        saga_instance = await orchestrator.create_saga_instance(
             saga_type=request.saga_type,
             entity_id=request.entity_id,
             steps=steps
@@ -86,20 +87,22 @@ async def start_saga(
 @router.get("/sagas/{saga_id}/status", response_model=SagaStatusResponse)
 async def get_saga_status(
     saga_id: str,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Get the status of a saga instance"""
-    saga_instance = db.query(SagaInstance).filter(
+    result = await db.execute(select(SagaInstance).filter(
         SagaInstance.saga_id == saga_id
-    ).first()
+    ))
+    saga_instance = result.scalars().first()
     
     if not saga_instance:
         raise HTTPException(status_code=404, detail="Saga not found")
     
     # Get steps
-    steps = db.query(SagaStep).filter(
+    result = await db.execute(select(SagaStep).filter(
         SagaStep.saga_instance_id == saga_instance.id
-    ).order_by(SagaStep.step_index).all()
+    ).order_by(SagaStep.step_index))
+    steps = result.scalars().all()
     
     steps_data = [
         {
@@ -131,12 +134,13 @@ async def get_saga_status(
 @router.post("/sagas/{saga_id}/compensate")
 async def compensate_saga(
     saga_id: str,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Manually trigger compensation for a saga"""
-    saga_instance = db.query(SagaInstance).filter(
+    result = await db.execute(select(SagaInstance).filter(
         SagaInstance.saga_id == saga_id
-    ).first()
+    ))
+    saga_instance = result.scalars().first()
     
     if not saga_instance:
         raise HTTPException(status_code=404, detail="Saga not found")
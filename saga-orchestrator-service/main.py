@@ -2,6 +2,7 @@ from fastapi import FastAPI
 from app.routes import router
 from config.settings import settings
 from database import Base, engine
+from shared.db_pool import get_pool_metrics
 import logging
 
 # Configure logging
@@ -26,6 +27,10 @@ app.include_router(router, prefix="", tags=["saga"])
 async def health_check():
     return {"status": "healthy", "service": "saga-orchestrator-service"}
 
+@app.get("/health/db/pool")
+async def pool_metrics():
+    return {"service": "saga-orchestrator-service", "pools": get_pool_metrics()}
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host=settings.SERVICE_HOST, port=settings.SERVICE_PORT)
@@ -2,7 +2,8 @@
 Saga Orchestrator Service
 Implements the Orchestration-based Saga pattern for distributed transactions
 """
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
 from typing import Dict, List, Optional, Callable
 from datetime import datetime
 import json
@@ -16,6 +17,7 @@ sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'shared'))
 
 from models.saga_instance import SagaInstance
 from models.saga_step import SagaStep
+from shared.events import CORRELATION_HEADER
 import logging
 
 logger = logging.getLogger(__name__)
@@ -43,11 +45,11 @@ class SagaStepDefinition:
 class SagaOrchestrator:
     """Orchestrates distributed transactions using Saga pattern"""
     
-    def __init__(self, db: Session):
+    def __init__(self, db: AsyncSession):
         self.db = db
         self.timeout = 30  # seconds
         
-    def create_saga_instance(
+    async def create_saga_instance(
         self,
         saga_type: str,
         entity_id: int,
@@ -64,7 +66,7 @@ class SagaOrchestrator:
             current_step=0
         )
         self.db.add(saga_instance)
-        self.db.flush()
+        await self.db.flush()
         
         # Create saga steps
         for idx, step_def in enumerate(steps):
@@ -77,8 +79,8 @@ class SagaOrchestrator:
             )
             self.db.add(saga_step)
         
-        self.db.commit()
-        self.db.refresh(saga_instance)
+        await self.db.commit()
+        await self.db.refresh(saga_instance)
         return saga_instance
     
     async def execute_saga(
@@ -94,16 +96,13 @@ class SagaOrchestrator:
         try:
             # Update saga status
             saga_instance.status = "IN_PROGRESS"
-            self.db.commit()
+            await self.db.commit()
             
             compensation_data = []
             
             # Execute each step sequentially
             for idx, (step_def, data) in enumerate(zip(steps, step_data)):
-                saga_step = self.db.query(SagaStep).filter(
-                    SagaStep.saga_instance_id == saga_instance.id,
-                    SagaStep.step_index == idx
-                ).first()
+                saga_step = await self._get_step(saga_instance, idx)
                 
                 if not saga_step:
                     raise Exception(f"Step {idx} not found for saga {saga_instance.saga_id}")
@@ -114,10 +113,15 @@ class SagaOrchestrator:
                     saga_step.started_at = datetime.utcnow()
                     saga_step.request_data = json.dumps(data)
                     saga_instance.current_step = idx
-                    self.db.commit()
+                    await self.db.commit()
                     
                     # Execute step
-                    result = await self._execute_step(step_def, data)
+                    # Same key on every attempt of this step, so a retried POST
+                    # returns the first result instead of creating a duplicate
+                    result = await self._execute_step(
+                        step_def, data, idempotency_key=f"{saga_instance.saga_id}:{idx}",
+                        correlation_id=saga_instance.saga_id
+                    )
                     
                     # Update step status
                     saga_step.status = "COMPLETED"
@@ -155,7 +159,7 @@ class SagaOrchestrator:
                                 if "order_id" in data:
                                     next_step_data["order_id"] = data["order_id"]
                     
-                    self.db.commit()
+                    await self.db.commit()
                     
                     logger.info(f"Saga {saga_instance.saga_id}: Step {step_def.step_name} completed")
                     
@@ -165,14 +169,14 @@ class SagaOrchestrator:
                     saga_step.status = "FAILED"
                     saga_step.error_message = str(e)
                     saga_step.completed_at = datetime.utcnow()
-                    self.db.commit()
+                    await self.db.commit()
                     
                     # Compensate all previous steps
                     await self._compensate_saga(saga_instance, compensation_data)
                     
                     saga_instance.status = "FAILED"
                     saga_instance.error_message = f"Step {step_def.step_name} failed: {str(e)}"
-                    self.db.commit()
+                    await self.db.commit()
                     
                     return {
                         "success": False,
@@ -185,7 +189,7 @@ class SagaOrchestrator:
             saga_instance.status = "COMPLETED"
             saga_instance.completed_at = datetime.utcnow()
             saga_instance.compensation_data = json.dumps(compensation_data)
-            self.db.commit()
+            await self.db.commit()
             
             logger.info(f"Saga {saga_instance.saga_id} completed successfully")
             
@@ -213,7 +217,7 @@ class SagaOrchestrator:
             logger.error(f"Saga {saga_instance.saga_id} execution error: {e}")
             saga_instance.status = "FAILED"
             saga_instance.error_message = str(e)
-            self.db.commit()
+            await self.db.commit()
             
             return {
                 "success": False,
@@ -221,7 +225,21 @@ class SagaOrchestrator:
                 "error": str(e)
             }
     
-    async def _execute_step(self, step_def: SagaStepDefinition, data: Dict) -> Dict:
+    async def _get_step(self, saga_instance: SagaInstance, step_index: int) -> Optional[SagaStep]:
+        """Load a single step of a saga instance"""
+        result = await self.db.execute(select(SagaStep).filter(
+            SagaStep.saga_instance_id == saga_instance.id,
+            SagaStep.step_index == step_index
+        ))
+        return result.scalars().first()
+    
+    async def _execute_step(
+        self,
+        step_def: SagaStepDefinition,
+        data: Dict,
+        idempotency_key: Optional[str] = None,
+        correlation_id: Optional[str] = None
+    ) -> Dict:
         """Execute a single saga step"""
         # Replace placeholders in request path
         request_path = step_def.request_path
@@ -234,6 +252,10 @@ class SagaOrchestrator:
         
         # Prepare request data
         request_data = data.copy()
+        headers = {"Idempotency-Key": idempotency_key} if idempotency_key else {}
+        # Events the step causes are tagged with the saga id
+        if correlation_id:
+            headers[CORRELATION_HEADER] = correlation_id
         
         async with httpx.AsyncClient(timeout=self.timeout) as client:
             try:
@@ -243,20 +265,20 @@ class SagaOrchestrator:
                         customer_id = request_data.pop("customer_id", None)
                         logger.info(f"Calling {url} with customer_id={customer_id} as query param")
                         if customer_id:
-                            response = await client.post(url, json=request_data, params={"customer_id": customer_id})
+                            response = await client.post(url, json=request_data, params={"customer_id": customer_id}, headers=headers)
                         else:
                             logger.warning(f"No customer_id found in data for order creation")
-                            response = await client.post(url, json=request_data)
+                            response = await client.post(url, json=request_data, headers=headers)
                     else:
                         logger.info(f"Calling {url} with POST")
-                        response = await client.post(url, json=request_data)
+                        response = await client.post(url, json=request_data, headers=headers)
                 elif step_def.request_method == "PUT":
                     logger.info(f"Calling {url} with PUT")
                     # For PUT requests, send empty body or minimal data
                     if request_data and len(request_data) > 0:
-                        response = await client.put(url, json=request_data)
+                        response = await client.put(url, json=request_data, headers=headers)
                     else:
-                        response = await client.put(url)
+                        response = await client.put(url, headers=headers)
                 elif step_def.request_method == "DELETE":
                     logger.info(f"Calling {url} with DELETE")
                     response = await client.delete(url)
@@ -302,29 +324,26 @@ class SagaOrchestrator:
         logger.info(f"Starting compensation for saga {saga_instance.saga_id}")
         
         saga_instance.status = "COMPENSATING"
-        self.db.commit()
+        await self.db.commit()
         
         # Compensate in reverse order
         for comp_info in reversed(compensation_data):
             step_name = comp_info["step_name"]
             step_index = comp_info["step_index"]
             
-            saga_step = self.db.query(SagaStep).filter(
-                SagaStep.saga_instance_id == saga_instance.id,
-                SagaStep.step_index == step_index
-            ).first()
+            saga_step = await self._get_step(saga_instance, step_index)
             
             if saga_step and saga_step.status == "COMPLETED":
                 try:
                     await self._compensate_step(comp_info)
                     saga_step.status = "COMPENSATED"
                     saga_step.compensated_at = datetime.utcnow()
-                    self.db.commit()
+                    await self.db.commit()
                     logger.info(f"Compensated step {step_name} for saga {saga_instance.saga_id}")
                 except Exception as e:
                     logger.error(f"Failed to compensate step {step_name}: {e}")
                     saga_step.error_message = f"Compensation failed: {str(e)}"
-                    self.db.commit()
+                    await self.db.commit()
                     # Continue with other compensations even if one fails
     
     async def _compensate_step(self, comp_info: Dict):
@@ -1,19 +1,48 @@
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Any, Callable, Dict, List, Optional
 from jose import JWTError, jwt
 from fastapi import HTTPException, status, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from shared.cache import TTLCache
 from shared.database import get_db
 from shared.database import User
+from shared.message_broker import get_message_broker
 from shared.models import TokenData, UserRole
+import hashlib
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
 
 SECRET_KEY = "your-super-secret-jwt-key-change-in-production"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+# Resolved users per process, by id; user.updated / user.deactivated evict them early
+PRINCIPAL_CACHE_SIZE = int(os.getenv("AUTH_PRINCIPAL_CACHE_SIZE", "10000"))
+PRINCIPAL_CACHE_TTL = float(os.getenv("AUTH_PRINCIPAL_CACHE_TTL", "60"))
+# Decoded tokens, by token hash, kept until the token expires
+TOKEN_CACHE_SIZE = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "10000"))
+# Role checks use the token's signed claims and skip the users table entirely
+TRUST_TOKEN_CLAIMS = os.getenv("AUTH_TRUST_TOKEN_CLAIMS", "false").lower() == "true"
+
+# Shared secret other services send in SERVICE_TOKEN_HEADER for internal
+# lookups (POST /users/batch); unset, only admins can make them
+SERVICE_TOKEN = os.getenv("SERVICE_TOKEN", "")
+SERVICE_TOKEN_HEADER = "X-Service-Token"
+
+# Published by the auth service; every replica of every service evicts the user
+USER_EVENTS = ["user.updated", "user.deactivated"]
+
 security = HTTPBearer()
 
+principal_cache = TTLCache(maxsize=PRINCIPAL_CACHE_SIZE, ttl=PRINCIPAL_CACHE_TTL)
+token_cache = TTLCache(maxsize=TOKEN_CACHE_SIZE, ttl=ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+# Deactivated users whose tokens may still be unexpired; checked when claims are trusted
+deactivated_users = TTLCache(maxsize=PRINCIPAL_CACHE_SIZE, ttl=ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+
 def verify_password(plain_password, hashed_password):
     from passlib.hash import pbkdf2_sha256
     return pbkdf2_sha256.verify(plain_password, hashed_password)
@@ -33,6 +62,11 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 def verify_token(token: str, credentials_exception):
+    """Decode a token, or return the cached result for it until it expires"""
+    token_key = hashlib.sha256(token.encode()).hexdigest()
+    token_data = token_cache.get(token_key)
+    if token_data is not None:
+        return token_data
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         user_id: str = payload.get("sub")
@@ -41,23 +75,85 @@ def verify_token(token: str, credentials_exception):
         token_data = TokenData(user_id=int(user_id), role=payload.get("role"))
     except JWTError:
         raise credentials_exception
+    expires_in = payload.get("exp", 0) - time.time()
+    if expires_in > 0:
+        token_cache.set(token_key, token_data, ttl=expires_in)
     return token_data
 
-def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security), db: Session = Depends(get_db)):
-    credentials_exception = HTTPException(
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+def _principal(user: User) -> User:
+    """A detached copy of the user without the password hash, safe to share between requests"""
+    return User(
+        id=user.id,
+        email=user.email,
+        name=user.name,
+        role=user.role,
+        is_active=user.is_active,
+        created_at=user.created_at
+    )
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security), db: AsyncSession = Depends(get_db)):
+    credentials_exception = _credentials_exception()
     token = credentials.credentials
     token_data = verify_token(token, credentials_exception)
-    user = db.query(User).filter(User.id == token_data.user_id).first()
-    if user is None:
+    principal = principal_cache.get(token_data.user_id)
+    if principal is None:
+        user = await db.get(User, token_data.user_id)
+        if user is None:
+            raise credentials_exception
+        principal = _principal(user)
+        principal_cache.set(token_data.user_id, principal)
+    if principal.is_active is False:
         raise credentials_exception
-    return user
+    return principal
+
+async def get_token_principal(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    """
+    The caller as the token describes it (id and role), without a database
+    lookup. Used for role checks when AUTH_TRUST_TOKEN_CLAIMS is on; a
+    role change then takes effect when the user's current token expires.
+    """
+    credentials_exception = _credentials_exception()
+    token_data = verify_token(credentials.credentials, credentials_exception)
+    if token_data.role is None or token_data.user_id in deactivated_users:
+        raise credentials_exception
+    return User(id=token_data.user_id, role=token_data.role.value, is_active=True)
+
+def invalidate_principal(user_id: int):
+    principal_cache.pop(user_id)
+
+# Other per-process caches of user data (shared.user_directory) register here to be evicted too
+user_change_listeners: List[Callable[[int], None]] = [invalidate_principal]
+
+async def handle_user_event(event_data: Dict[str, Any]):
+    """Evict a changed user; a deactivated one is also refused on trusted claims"""
+    user_id = (event_data.get("data") or {}).get("user_id")
+    if user_id is None:
+        return
+    for listener in user_change_listeners:
+        listener(user_id)
+    if event_data.get("event_type") == "user.deactivated":
+        deactivated_users.set(user_id, True)
+    else:
+        deactivated_users.pop(user_id)
+
+async def start_principal_invalidation():
+    """Listen for user changes on this replica; call once on startup"""
+    try:
+        message_broker = await get_message_broker()
+        await message_broker.subscribe_broadcast(USER_EVENTS, handle_user_event)
+    except Exception as e:
+        logger.warning(f"User cache invalidation not started, entries expire after {PRINCIPAL_CACHE_TTL:g}s: {e}")
 
 def require_role(required_role: UserRole):
-    def role_checker(current_user: User = Depends(get_current_user)):
+    current_user_dependency = get_token_principal if TRUST_TOKEN_CLAIMS else get_current_user
+    def role_checker(current_user: User = Depends(current_user_dependency)):
         if current_user.role != required_role and current_user.role != UserRole.ADMIN:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
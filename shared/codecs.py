@@ -0,0 +1,106 @@
+"""
+Event body codecs
+
+A message's AMQP ``content_type`` names the codec its body was encoded with,
+and ``content_encoding`` names the compression, if any. Consumers decode
+whatever they receive. That lets producers switch from JSON to msgpack, or
+turn on compression, once every consumer runs this code; consumers that
+predate it only understand plain JSON.
+
+JSON uses orjson when it's installed. msgpack needs the ``msgpack`` package.
+"""
+from typing import Any, Dict, Optional, Tuple
+import json
+import os
+import zlib
+
+try:
+    import orjson
+except ImportError:  # stdlib json fallback
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON_CONTENT_TYPE = "application/json"
+MSGPACK_CONTENT_TYPE = "application/msgpack"
+ZLIB_ENCODING = "zlib"
+
+# Codec producers use: "json" or "msgpack"
+EVENT_CODEC = os.getenv("RABBITMQ_EVENT_CODEC", "json")
+# Compress bodies at least this large; 0 turns compression off
+COMPRESS_MIN_BYTES = int(os.getenv("RABBITMQ_COMPRESS_MIN_BYTES", "0"))
+COMPRESS_LEVEL = int(os.getenv("RABBITMQ_COMPRESS_LEVEL", "1"))
+
+class JSONCodec:
+    content_type = JSON_CONTENT_TYPE
+
+    def encode(self, obj: Any) -> bytes:
+        if orjson is not None:
+            return orjson.dumps(obj, default=str, option=orjson.OPT_NON_STR_KEYS)
+        return json.dumps(obj, default=str).encode()
+
+    def decode(self, body: bytes) -> Any:
+        if orjson is not None:
+            return orjson.loads(body)
+        return json.loads(body)
+
+class MsgpackCodec:
+    content_type = MSGPACK_CONTENT_TYPE
+
+    def encode(self, obj: Any) -> bytes:
+        return msgpack.packb(obj, default=str, use_bin_type=True)
+
+    def decode(self, body: bytes) -> Any:
+        return msgpack.unpackb(body, raw=False, strict_map_key=False)
+
+CODECS: Dict[str, Any] = {JSON_CONTENT_TYPE: JSONCodec()}
+if msgpack is not None:
+    CODECS[MSGPACK_CONTENT_TYPE] = MsgpackCodec()
+
+_ALIASES = {"json": JSON_CONTENT_TYPE, "msgpack": MSGPACK_CONTENT_TYPE}
+
+def get_codec(name: Optional[str] = None):
+    """Codec by short name or content type; raises ValueError if it isn't available"""
+    content_type = _ALIASES.get(name or EVENT_CODEC, name or EVENT_CODEC)
+    codec = CODECS.get(content_type)
+    if codec is None:
+        raise ValueError(f"Event codec {name or EVENT_CODEC!r} is not available")
+    return codec
+
+def json_dumps(obj: Any) -> str:
+    """JSON text for storing event payloads"""
+    return CODECS[JSON_CONTENT_TYPE].encode(obj).decode()
+
+def encode_event(
+    obj: Any,
+    codec: Optional[str] = None,
+    compress_min_bytes: Optional[int] = None
+) -> Tuple[bytes, str, Optional[str]]:
+    """Returns (body, content_type, content_encoding) for an event body"""
+    encoder = get_codec(codec)
+    body = encoder.encode(obj)
+
+    threshold = COMPRESS_MIN_BYTES if compress_min_bytes is None else compress_min_bytes
+    if threshold and len(body) >= threshold:
+        return zlib.compress(body, COMPRESS_LEVEL), encoder.content_type, ZLIB_ENCODING
+    return body, encoder.content_type, None
+
+def decode_event(body: bytes, content_type: Optional[str] = None, content_encoding: Optional[str] = None) -> Any:
+    """
+    Decode a message body. Messages without a content type are plain JSON
+    from older producers. Raises ValueError for anything undecodable.
+    """
+    try:
+        if content_encoding == ZLIB_ENCODING:
+            body = zlib.decompress(body)
+        elif content_encoding:
+            raise ValueError(f"Unsupported content encoding {content_encoding!r}")
+        return get_codec(content_type or JSON_CONTENT_TYPE).decode(body)
+    except ValueError:
+        raise
+    except Exception as e:
+        # zlib.error, msgpack's own exceptions, ...
+        raise ValueError(f"Could not decode {content_type} event: {e}") from e
@@ -0,0 +1,159 @@
+"""
+Connection pool settings and instrumentation shared by every service
+
+Pool sizing comes from the environment so each service can be tuned from
+docker-compose without code changes:
+
+    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE,
+    DB_POOL_PRE_PING, DB_PGBOUNCER
+
+Engines are created lazily through get_engine / get_async_engine and cached
+by name, so every module in a process shares one pool per database.
+"""
+from sqlalchemy import create_engine, exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+from typing import Dict
+from uuid import uuid4
+import threading
+import time
+import os
+
+def _env_bool(name: str, default: str) -> bool:
+    return os.getenv(name, default).strip().lower() in ("1", "true", "yes", "on")
+
+class PoolSettings:
+    POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+    MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+    POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+    POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+    POOL_PRE_PING = _env_bool("DB_POOL_PRE_PING", "true")
+
+    # PgBouncer in transaction mode can't keep server-side prepared statements
+    PGBOUNCER = _env_bool("DB_PGBOUNCER", "false")
+
+pool_settings = PoolSettings()
+
+class PoolStats:
+    """Checkout counters for one pool; wait time covers queueing and connecting"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+    def record(self, waited: float, timed_out: bool = False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.wait_time_total += waited
+            self.wait_time_max = max(self.wait_time_max, waited)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            attempts = self.checkouts + self.timeouts
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "wait_time_avg_ms": (self.wait_time_total / attempts * 1000) if attempts else 0.0,
+                "wait_time_max_ms": self.wait_time_max * 1000
+            }
+
+class _TimedCheckoutMixin:
+    stats: PoolStats = None
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            connection = super().connect()
+        except exc.TimeoutError:
+            self.stats.record(time.perf_counter() - start, timed_out=True)
+            raise
+        self.stats.record(time.perf_counter() - start)
+        return connection
+
+def instrumented_pool_class(is_async: bool, stats: PoolStats) -> type:
+    """
+    Pool class that records checkout wait times into ``stats``.
+    A class (rather than an instance attribute) survives pool.recreate() on dispose().
+    """
+    base = AsyncAdaptedQueuePool if is_async else QueuePool
+    return type(f"Instrumented{base.__name__}", (_TimedCheckoutMixin, base), {"stats": stats})
+
+def engine_options(url: str, is_async: bool, stats: PoolStats) -> Dict:
+    """Keyword arguments for create_engine / create_async_engine"""
+    if url.startswith("sqlite"):
+        # SQLite picks its own pool; sizing options don't apply
+        return {}
+
+    options = {
+        "poolclass": instrumented_pool_class(is_async, stats),
+        "pool_size": pool_settings.POOL_SIZE,
+        "max_overflow": pool_settings.MAX_OVERFLOW,
+        "pool_timeout": pool_settings.POOL_TIMEOUT,
+        "pool_recycle": pool_settings.POOL_RECYCLE,
+        "pool_pre_ping": pool_settings.POOL_PRE_PING
+    }
+
+    if pool_settings.PGBOUNCER and is_async:
+        # asyncpg prepares every statement by default; disable both caches and
+        # use unique names so statements never collide across pooled backends
+        options["connect_args"] = {
+            "statement_cache_size": 0,
+            "prepared_statement_cache_size": 0,
+            "prepared_statement_name_func": lambda: f"__asyncpg_{uuid4()}__"
+        }
+    # psycopg2 never uses server-side prepared statements, so sync engines need nothing extra
+
+    return options
+
+def pool_status(pool, stats: PoolStats) -> Dict:
+    """Current occupancy of a pool plus its checkout counters"""
+    status = {"pool_class": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        status.update({
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": max(pool.overflow(), 0),
+            "max_overflow": pool._max_overflow
+        })
+    status.update(stats.snapshot())
+    return status
+
+# Engine registry - one engine (and pool) per name per process
+_engines: Dict[str, Engine] = {}
+_async_engines: Dict[str, AsyncEngine] = {}
+_stats: Dict[str, PoolStats] = {}
+_registry_lock = threading.Lock()
+
+def get_engine(url: str, name: str = "primary") -> Engine:
+    """Get (or create) the sync engine registered under ``name``"""
+    with _registry_lock:
+        if name not in _engines:
+            stats = _stats.setdefault(name, PoolStats())
+            _engines[name] = create_engine(url, **engine_options(url, False, stats))
+        return _engines[name]
+
+def get_async_engine(url: str, name: str = "primary") -> AsyncEngine:
+    """Get (or create) the async engine registered under ``name``"""
+    key = f"{name}_async"
+    with _registry_lock:
+        if name not in _async_engines:
+            stats = _stats.setdefault(key, PoolStats())
+            _async_engines[name] = create_async_engine(url, **engine_options(url, True, stats))
+        return _async_engines[name]
+
+def get_pool_metrics() -> Dict:
+    """Pool metrics for every engine created in this process"""
+    metrics = {}
+    for name, engine in list(_engines.items()):
+        metrics[name] = pool_status(engine.pool, _stats[name])
+    for name, engine in list(_async_engines.items()):
+        metrics[f"{name}_async"] = pool_status(engine.sync_engine.pool, _stats[f"{name}_async"])
+    return metrics
@@ -0,0 +1,39 @@
+"""
+Admin endpoints for the service's dead-letter queue
+
+Events whose handlers kept failing after every retry tier end up in
+``<service>_queue.dead``. These routes let an admin look at them and, once
+the cause is fixed, push them back through the normal consumer.
+"""
+from fastapi import APIRouter, Depends, HTTPException, Query
+from shared.auth import require_role
+from shared.models import UserRole
+from shared.message_broker import get_message_broker
+
+router = APIRouter()
+
+@router.get("/dead-letters")
+async def list_dead_letters(
+    limit: int = Query(20, ge=1, le=100),
+    current_user = Depends(require_role(UserRole.ADMIN))
+):
+    """Peek at dead-lettered events (they stay in the queue)"""
+    message_broker = await get_message_broker()
+    try:
+        events = await message_broker.peek_dead_letters(limit)
+    except ConnectionError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return {"queue": message_broker.queue_name, "events": events}
+
+@router.post("/dead-letters/replay")
+async def replay_dead_letters(
+    limit: int = Query(100, ge=1, le=1000),
+    current_user = Depends(require_role(UserRole.ADMIN))
+):
+    """Republish dead-lettered events under their original routing key with a fresh retry budget"""
+    message_broker = await get_message_broker()
+    try:
+        replayed = await message_broker.replay_dead_letters(limit)
+    except ConnectionError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return {"queue": message_broker.queue_name, "replayed": replayed}
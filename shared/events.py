@@ -0,0 +1,237 @@
+"""
+Event envelope and consumer-side deduplication
+
+Every published event is wrapped in a versioned envelope:
+
+    {
+        "event_id": "order-service:1042",
+        "event_type": "order.created",
+        "schema_version": 1,
+        "producer": "order-service",
+        "occurred_at": "2024-01-15T12:30:45.123456+00:00",
+        "published_at": "2024-01-15T12:30:45.131002+00:00",
+        "correlation_id": "order_saga_17_3f9a1c2b",
+        "data": {...}
+    }
+
+``occurred_at`` is when the state change was committed (the outbox row's
+creation time) and ``published_at`` when it went to RabbitMQ. Both are UTC
+wall-clock times, so consumers in other processes can measure lag from
+them. ``event_type`` and ``data`` are where they always were, so handlers
+that predate the envelope keep working.
+
+``correlation_id`` ties together everything one saga or request caused.
+Handlers run with the incoming event's correlation id set, and events staged
+while handling it inherit that id. HTTP callers (the saga orchestrator) pass
+it in the ``X-Correlation-ID`` header.
+
+Redelivered events are skipped by ``EventDeduplicator``: a consumer claims
+each event id in the ``processed_events`` table before handling it, so a
+restart or another replica doesn't handle it again. Ids claimed recently
+also sit in a bounded in-process LRU, which skips most duplicates without a
+query.
+"""
+from sqlalchemy import Column, String, DateTime, delete
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from contextvars import ContextVar
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Set, Union
+from shared.database import Base, AsyncSessionLocal
+from shared.cache import TTLCache
+import asyncio
+import logging
+import os
+import uuid
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_VERSION = 1
+CORRELATION_HEADER = "X-Correlation-ID"
+
+# Event ids remembered in-process per consumer; the table catches the rest
+DEDUPE_CACHE_SIZE = int(os.getenv("EVENT_DEDUPE_CACHE_SIZE", "10000"))
+DEDUPE_RETENTION_HOURS = int(os.getenv("EVENT_DEDUPE_RETENTION_HOURS", "72"))
+DEDUPE_PURGE_EVERY = 600
+
+# Correlation id of the event or request being handled right now
+current_correlation_id: ContextVar[Optional[str]] = ContextVar("current_correlation_id", default=None)
+
+def new_event_id() -> str:
+    return uuid.uuid4().hex
+
+def utc_isoformat(value: Optional[datetime] = None) -> str:
+    """ISO 8601 UTC timestamp; naive datetimes are taken to be UTC (datetime.utcnow)"""
+    if value is None:
+        value = datetime.now(timezone.utc)
+    elif value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.isoformat()
+
+def make_envelope(
+    event_type: str,
+    data: Dict[str, Any],
+    producer: str,
+    event_id: Optional[str] = None,
+    occurred_at: Union[datetime, str, None] = None,
+    correlation_id: Optional[str] = None
+) -> Dict[str, Any]:
+    """Wrap an event for publishing; ids and times default to a new event happening now"""
+    published_at = utc_isoformat()
+    event_id = event_id or new_event_id()
+    if isinstance(occurred_at, datetime):
+        occurred_at = utc_isoformat(occurred_at)
+    return {
+        "event_id": event_id,
+        "event_type": event_type,
+        "schema_version": SCHEMA_VERSION,
+        "producer": producer,
+        "occurred_at": occurred_at or published_at,
+        "published_at": published_at,
+        # A new chain of events starts with its first event's id
+        "correlation_id": correlation_id or current_correlation_id.get() or event_id,
+        "data": data
+    }
+
+def seconds_since(timestamp: Optional[str]) -> Optional[float]:
+    """Wall-clock seconds since an envelope timestamp, or None if it's missing or malformed"""
+    if not isinstance(timestamp, str):
+        return None
+    try:
+        moment = datetime.fromisoformat(timestamp)
+    except ValueError:
+        return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return (datetime.now(timezone.utc) - moment).total_seconds()
+
+async def correlation_middleware(request, call_next):
+    """Run the request with the caller's X-Correlation-ID, so events it stages carry it"""
+    token = current_correlation_id.set(request.headers.get(CORRELATION_HEADER))
+    try:
+        return await call_next(request)
+    finally:
+        current_correlation_id.reset(token)
+
+class ProcessedEvent(Base):
+    __tablename__ = "processed_events"
+
+    consumer = Column(String, primary_key=True)
+    event_id = Column(String, primary_key=True)
+    processed_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+class EventDeduplicator:
+    """
+    Claims event ids for a consumer, so each event is handled once. A claim
+    is a single ``INSERT ... ON CONFLICT DO NOTHING RETURNING``: a returned
+    row means the event is new, no row means it was handled already. A
+    handler that fails releases its claim, so the event is still retried.
+
+    RabbitMQ marks a message redelivered when its consumer went away before
+    acking it, which can happen after the claim was taken. Those re-claim
+    (the existing row is refreshed and returned) and are handled again.
+
+    Database errors count as claimed: handlers are expected to tolerate the
+    occasional duplicate, and a database outage shouldn't stop consumption
+    on its own.
+    """
+
+    def __init__(self, consumer: str, maxsize: int = DEDUPE_CACHE_SIZE, retention_hours: int = DEDUPE_RETENTION_HOURS):
+        self.consumer = consumer
+        self.retention_hours = retention_hours
+        self._cache = TTLCache(maxsize=maxsize, ttl=retention_hours * 3600)
+        self._last_purge = 0.0
+        self.stats = {"duplicates": 0, "cache_hits": 0}
+
+    async def claim(self, event_id: str, reclaim: bool = False) -> bool:
+        """True if this consumer should handle ``event_id``, False for a duplicate"""
+        return event_id in await self.claim_many([event_id], [event_id] if reclaim else ())
+
+    async def claim_many(self, event_ids: List[str], reclaim: Iterable[str] = ()) -> Set[str]:
+        """
+        The subset of ``event_ids`` claimed for handling, with one insert for
+        the cache misses. Ids in ``reclaim`` are claimed even if they were
+        claimed before.
+        """
+        reclaim = set(reclaim)
+        cached = {event_id for event_id in event_ids if event_id in self._cache and event_id not in reclaim}
+        misses = list(dict.fromkeys(event_id for event_id in event_ids if event_id not in cached))
+        claimed = set()
+        if misses:
+            try:
+                claimed = await self._insert_claims(misses, reclaim)
+            except Exception as e:
+                logger.warning(f"Processed-event claim failed: {e}")
+                claimed = set(misses)
+            for event_id in misses:
+                self._cache.set(event_id, True)
+        self.stats["duplicates"] += len(event_ids) - len(claimed)
+        self.stats["cache_hits"] += len(cached)
+        if claimed:
+            await self._maybe_purge()
+        return claimed
+
+    async def _insert_claims(self, event_ids: List[str], reclaim: Set[str]) -> Set[str]:
+        now = datetime.utcnow()
+        claimed = set()
+        async with AsyncSessionLocal() as db:
+            insert = postgresql_insert if db.get_bind().dialect.name == "postgresql" else sqlite_insert
+            for ids, redelivered in ((
+                [event_id for event_id in event_ids if event_id not in reclaim], False
+            ), (
+                [event_id for event_id in event_ids if event_id in reclaim], True
+            )):
+                if not ids:
+                    continue
+                statement = insert(ProcessedEvent).values([
+                    {"consumer": self.consumer, "event_id": event_id, "processed_at": now} for event_id in ids
+                ])
+                if redelivered:
+                    statement = statement.on_conflict_do_update(
+                        index_elements=[ProcessedEvent.consumer, ProcessedEvent.event_id],
+                        set_={"processed_at": now}
+                    )
+                else:
+                    statement = statement.on_conflict_do_nothing()
+                result = await db.execute(statement.returning(ProcessedEvent.event_id))
+                claimed.update(result.scalars().all())
+            await db.commit()
+        return claimed
+
+    async def release(self, event_id: str):
+        await self.release_many([event_id])
+
+    async def release_many(self, event_ids: List[str]):
+        """Give up claims whose handler failed, so a retry of the event is handled"""
+        if not event_ids:
+            return
+        for event_id in event_ids:
+            self._cache.pop(event_id)
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(delete(ProcessedEvent).filter(
+                    ProcessedEvent.consumer == self.consumer, ProcessedEvent.event_id.in_(event_ids)
+                ))
+                await db.commit()
+        except Exception as e:
+            logger.warning(f"Could not release {len(event_ids)} processed-event claims: {e}")
+
+    async def _maybe_purge(self):
+        loop = asyncio.get_running_loop()
+        if loop.time() - self._last_purge >= DEDUPE_PURGE_EVERY:
+            self._last_purge = loop.time()
+            try:
+                await self.purge_expired()
+            except Exception as e:
+                logger.warning(f"Processed-event cleanup error: {e}")
+
+    async def purge_expired(self) -> int:
+        """Forget ids older than the retention window; returns the number removed"""
+        cutoff = datetime.utcnow() - timedelta(hours=self.retention_hours)
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(delete(ProcessedEvent).filter(
+                ProcessedEvent.consumer == self.consumer,
+                ProcessedEvent.processed_at < cutoff
+            ))
+            await db.commit()
+            return result.rowcount
@@ -0,0 +1,41 @@
+"""
+Great-circle distances and search boxes for location queries
+
+``bounding_box`` gives the latitude / longitude ranges that contain every
+point within a radius. Those ranges can use plain btree indexes on the
+coordinate columns, so a nearby query reads only the candidates inside the
+box. The exact ``haversine_km`` distance then sorts them and drops the
+corners of the box that lie outside the circle.
+"""
+from typing import List, Tuple
+import math
+
+EARTH_RADIUS_KM = 6371.0
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance between two points in kilometers"""
+    dlat = math.radians(lat2 - lat1)
+    dlon = math.radians(lon2 - lon1)
+    a = math.sin(dlat / 2) ** 2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(a, 1.0)))
+
+def bounding_box(latitude: float, longitude: float, radius_km: float) -> Tuple[float, float, List[Tuple[float, float]]]:
+    """
+    (min_lat, max_lat, [(min_lon, max_lon), ...]) covering every point within
+    ``radius_km``. A box crossing the antimeridian is split in two longitude
+    ranges; one reaching a pole spans all longitudes.
+    """
+    angle = radius_km / EARTH_RADIUS_KM
+    min_lat = latitude - math.degrees(angle)
+    max_lat = latitude + math.degrees(angle)
+    if min_lat <= -90 or max_lat >= 90:
+        return max(min_lat, -90.0), min(max_lat, 90.0), [(-180.0, 180.0)]
+
+    dlon = math.degrees(math.asin(min(math.sin(angle) / math.cos(math.radians(latitude)), 1.0)))
+    min_lon = longitude - dlon
+    max_lon = longitude + dlon
+    if min_lon < -180:
+        return min_lat, max_lat, [(min_lon + 360, 180.0), (-180.0, max_lon)]
+    if max_lon > 180:
+        return min_lat, max_lat, [(min_lon, 180.0), (-180.0, max_lon - 360)]
+    return min_lat, max_lat, [(min_lon, max_lon)]
@@ -0,0 +1,207 @@
+"""
+Idempotency-Key support for create endpoints
+
+The first request with a given key does the work and its response is stored
+in the ``idempotency_keys`` table and an in-process LRU. Retries with the same
+key get the stored response back instead of creating a second order/payment.
+Concurrent duplicates in the same process wait on the in-flight call; in other
+processes they poll the table until the first one finishes.
+
+A pending key is only held for ``IDEMPOTENCY_LEASE_SECONDS``. If the request
+that claimed it crashed, a retry after that takes the key over and does the
+work; the full TTL starts once a response is stored.
+"""
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import Column, String, Text, DateTime, select, delete, update
+from sqlalchemy.exc import IntegrityError
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from shared.database import Base, AsyncSessionLocal
+from shared.cache import TTLCache
+import asyncio
+import hashlib
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+# How long a duplicate waits for another process to finish the first request
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "10"))
+IDEMPOTENCY_POLL_SECONDS = 0.1
+# How long a claimed key stays pending before a retry may take it over;
+# a few request timeouts, so only requests that died lose it
+IDEMPOTENCY_LEASE_SECONDS = int(os.getenv("IDEMPOTENCY_LEASE_SECONDS", "120"))
+
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+
+    scope = Column(String, primary_key=True)
+    key = Column(String, primary_key=True)
+    request_hash = Column(String, nullable=False)
+    # NULL until the first request completes
+    response_body = Column(Text)
+    # Identifies the claim, so a request that lost its lease can't overwrite the new owner
+    created_at = Column(DateTime, default=datetime.utcnow)
+    # End of the lease while pending, of the TTL once completed
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+def fingerprint(payload: Any) -> str:
+    """Stable hash of a request body, so a reused key with a different body is rejected"""
+    encoded = json.dumps(jsonable_encoder(payload), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+class IdempotencyStore:
+    """Stores first responses per (scope, key) in the database and an in-process LRU"""
+
+    def __init__(self, maxsize: int = 10000, ttl: int = IDEMPOTENCY_TTL_SECONDS):
+        self.ttl = ttl
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._in_flight: Dict[Tuple[str, str], asyncio.Future] = {}
+
+    async def run(
+        self,
+        scope: str,
+        key: Optional[str],
+        request_hash: str,
+        work: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        """
+        Run ``work`` once per (scope, key) and return its JSON-encoded response.
+        Without a key the work just runs.
+        """
+        if not key:
+            return await work()
+
+        cache_key = (scope, key)
+        cached = self._cache.get(cache_key)
+        if cached is not None:
+            return self._replay(cached, request_hash)
+
+        in_flight = self._in_flight.get(cache_key)
+        if in_flight is not None:
+            return self._replay(await asyncio.shield(in_flight), request_hash)
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[cache_key] = future
+        try:
+            claimed_at = datetime.utcnow()
+            entry = await self._claim_or_wait(scope, key, request_hash, claimed_at)
+            if entry is None:
+                # We hold the claim - do the work and store the response
+                try:
+                    body = jsonable_encoder(await work())
+                except BaseException:
+                    await self._release(scope, key, claimed_at)
+                    raise
+                entry = {"request_hash": request_hash, "body": body}
+                await self._complete(scope, key, claimed_at, body)
+
+            self._cache.set(cache_key, entry)
+            future.set_result(entry)
+            return self._replay(entry, request_hash)
+        except BaseException as e:
+            if not future.done():
+                future.set_exception(e)
+                # Mark retrieved so an unawaited future doesn't log a warning
+                future.exception()
+            raise
+        finally:
+            self._in_flight.pop(cache_key, None)
+
+    def _replay(self, entry: Dict, request_hash: str) -> Any:
+        if entry["request_hash"] != request_hash:
+            raise HTTPException(
+                status_code=422,
+                detail=f"{IDEMPOTENCY_HEADER} was already used with a different request body"
+            )
+        return entry["body"]
+
+    async def _claim_or_wait(self, scope: str, key: str, request_hash: str, claimed_at: datetime) -> Optional[Dict]:
+        """
+        Insert a pending row for the key, leased for IDEMPOTENCY_LEASE_SECONDS.
+        Returns None if this caller owns the key now, or the stored entry if
+        another request already completed it.
+        """
+        deadline = asyncio.get_running_loop().time() + IDEMPOTENCY_WAIT_SECONDS
+        while True:
+            async with AsyncSessionLocal() as db:
+                now = datetime.utcnow()
+                db.add(IdempotencyKey(
+                    scope=scope,
+                    key=key,
+                    request_hash=request_hash,
+                    created_at=claimed_at,
+                    expires_at=now + timedelta(seconds=IDEMPOTENCY_LEASE_SECONDS)
+                ))
+                try:
+                    await db.commit()
+                    return None
+                except IntegrityError:
+                    await db.rollback()
+
+                row = (await db.execute(select(IdempotencyKey).filter(
+                    IdempotencyKey.scope == scope, IdempotencyKey.key == key
+                ))).scalars().first()
+
+                if row is not None and row.expires_at <= now:
+                    # Expired response or abandoned claim - drop it and claim again.
+                    # The expiry check keeps a racing request's fresh claim.
+                    await db.execute(delete(IdempotencyKey).filter(
+                        IdempotencyKey.scope == scope,
+                        IdempotencyKey.key == key,
+                        IdempotencyKey.expires_at <= now
+                    ))
+                    await db.commit()
+                    continue
+                if row is not None and row.response_body is not None:
+                    return {"request_hash": row.request_hash, "body": json.loads(row.response_body)}
+
+            # Another process is still working on the first request
+            if asyncio.get_running_loop().time() >= deadline:
+                raise HTTPException(
+                    status_code=409,
+                    detail=f"A request with this {IDEMPOTENCY_HEADER} is still in progress"
+                )
+            await asyncio.sleep(IDEMPOTENCY_POLL_SECONDS)
+
+    async def _complete(self, scope: str, key: str, claimed_at: datetime, body: Any):
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(update(IdempotencyKey).filter(
+                IdempotencyKey.scope == scope,
+                IdempotencyKey.key == key,
+                IdempotencyKey.created_at == claimed_at,
+                IdempotencyKey.response_body.is_(None)
+            ).values(
+                response_body=json.dumps(body),
+                expires_at=datetime.utcnow() + timedelta(seconds=self.ttl)
+            ))
+            await db.commit()
+        if result.rowcount == 0:
+            logger.warning(f"{IDEMPOTENCY_HEADER} {scope}/{key} outlived its "
+                           f"{IDEMPOTENCY_LEASE_SECONDS}s lease; the response was not stored")
+
+    async def _release(self, scope: str, key: str, claimed_at: datetime):
+        """Failed requests aren't cached - free the key so the client can retry"""
+        async with AsyncSessionLocal() as db:
+            await db.execute(delete(IdempotencyKey).filter(
+                IdempotencyKey.scope == scope,
+                IdempotencyKey.key == key,
+                IdempotencyKey.created_at == claimed_at,
+                IdempotencyKey.response_body.is_(None)
+            ))
+            await db.commit()
+
+    async def purge_expired(self) -> int:
+        """Delete expired keys; returns the number removed"""
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(delete(IdempotencyKey).filter(
+                IdempotencyKey.expires_at <= datetime.utcnow()
+            ))
+            await db.commit()
+            return result.rowcount
+
+idempotency_store = IdempotencyStore()
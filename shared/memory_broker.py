@@ -0,0 +1,468 @@
+"""
+In-process stand-in for RabbitMQ
+
+Implements the part of aio_pika's connection / channel / exchange / queue
+API that MessageBroker uses, so the broker, outbox relay, retry tiers and
+dead-letter queue run unchanged without a RabbitMQ server. Select it with
+``MESSAGE_BROKER_BACKEND=memory``, or construct ``MessageBroker("memory://")``.
+
+What it models:
+
+- topic, direct and fanout exchanges plus the default exchange; topic
+  bindings use the same ``*`` / ``#`` matching as RabbitMQ
+- consistent-hash exchanges hashing the ``hash-header`` header (bound
+  queues are weighted equally), and exchange-to-exchange bindings
+- queues that live for the whole process, keeping their messages while
+  nobody consumes them and across reconnects (until ``reset()``)
+- per-channel prefetch, ack (including ``multiple``), nack / reject with or
+  without requeue, and redelivery of unacked messages when a channel closes
+- ``x-message-ttl`` and ``x-dead-letter-exchange`` /
+  ``x-dead-letter-routing-key``, which the retry tiers are built on
+- ``x-single-active-consumer``: only the earliest consumer gets messages
+- ``x-max-priority`` (higher-priority messages go first) and
+  ``x-max-length`` with ``drop-head`` overflow, which dead-letters the oldest
+
+Everything stays in one process: services running in separate processes
+don't share it. Consumers are called one message at a time in queue order.
+
+In tests, the ``broker`` fixture in tests/conftest.py gives a connected
+``MessageBroker("memory://", "test-service")`` on a freshly reset broker,
+and ``await memory_broker.join()`` waits until every published event has
+been handled and acked.
+"""
+from collections import deque, OrderedDict
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+from aio_pika import ExchangeType
+from aio_pika.exceptions import QueueEmpty
+from shared.message_broker import topic_matches
+import asyncio
+import logging
+import zlib
+
+logger = logging.getLogger(__name__)
+
+MEMORY_URL = "memory://"
+
+class MemoryMessage:
+    """A delivered message; mirrors aio_pika's IncomingMessage"""
+
+    def __init__(self, message, exchange: str, routing_key: str):
+        self.body = message.body
+        self.headers = dict(message.headers or {})
+        self.content_type = message.content_type
+        self.content_encoding = message.content_encoding
+        self.delivery_mode = message.delivery_mode
+        self.priority = message.priority
+        self.message_id = message.message_id
+        self.correlation_id = message.correlation_id
+        self.app_id = message.app_id
+        self.timestamp = message.timestamp
+        self.exchange = exchange
+        self.routing_key = routing_key
+        self.delivery_tag: Optional[int] = None
+        self.redelivered = False
+        self.processed = False
+        self._channel: Optional["MemoryChannel"] = None
+        self._queue: Optional["MemoryQueue"] = None
+
+    async def ack(self, multiple: bool = False):
+        self._channel._settle(self, multiple, requeue=None)
+
+    async def nack(self, multiple: bool = False, requeue: bool = True):
+        self._channel._settle(self, multiple, requeue=requeue)
+
+    async def reject(self, requeue: bool = False):
+        self._channel._settle(self, False, requeue=requeue)
+
+class MemoryQueue:
+    """Messages and consumers of one named queue"""
+
+    def __init__(self, broker: "MemoryBroker", name: str, arguments: Dict[str, Any]):
+        self.broker = broker
+        self.name = name
+        self.arguments = arguments
+        self.ttl = arguments.get("x-message-ttl")
+        self.max_priority = arguments.get("x-max-priority")
+        self.max_length = arguments.get("x-max-length")
+        self._ready: Deque[Tuple[MemoryMessage, float]] = deque()
+        self._consumers: List[Tuple["MemoryChannel", Callable, str]] = []
+        self._next_consumer = 0
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def message_count(self) -> int:
+        return len(self._ready)
+
+    def put(self, message: MemoryMessage, front: bool = False):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.ttl / 1000 if self.ttl is not None else None
+        if front:
+            self._ready.appendleft((message, deadline))
+        else:
+            self._ready.insert(self._position(message), (message, deadline))
+            if deadline is not None:
+                loop.call_later(self.ttl / 1000, self._expire)
+            if self.max_length is not None and len(self._ready) > self.max_length:
+                dropped, _ = self._ready.popleft()
+                self.broker.dead_letter(self, dropped)
+        self._wakeup.set()
+
+    def _position(self, message: MemoryMessage) -> int:
+        """Behind every ready message of the same or higher priority"""
+        index = len(self._ready)
+        if not self.max_priority:
+            return index
+        priority = min(message.priority or 0, self.max_priority)
+        while index and min(self._ready[index - 1][0].priority or 0, self.max_priority) < priority:
+            index -= 1
+        return index
+
+    def _expire(self):
+        """Dead-letter messages at the head of the queue whose TTL has passed, like RabbitMQ"""
+        now = asyncio.get_running_loop().time()
+        while self._ready and self._ready[0][1] is not None and self._ready[0][1] <= now:
+            message, _ = self._ready.popleft()
+            self.broker.dead_letter(self, message)
+
+    def add_consumer(self, channel: "MemoryChannel", callback: Callable, consumer_tag: str):
+        self._consumers.append((channel, callback, consumer_tag))
+        if self._task is None:
+            self._task = asyncio.create_task(self._deliver())
+        self._wakeup.set()
+
+    def remove_consumers(self, channel: "MemoryChannel" = None, consumer_tag: str = None):
+        self._consumers = [
+            consumer for consumer in self._consumers
+            if not (consumer[0] is channel or consumer[2] == consumer_tag)
+        ]
+
+    def _pick_consumer(self):
+        """Round-robin over consumers whose channel is below its prefetch limit"""
+        if self.arguments.get("x-single-active-consumer"):
+            # The others are standbys until the active one goes away
+            if self._consumers and self._consumers[0][0].has_capacity():
+                return self._consumers[0][:2]
+            return None
+        for offset in range(len(self._consumers)):
+            index = (self._next_consumer + offset) % len(self._consumers)
+            channel, callback, _ = self._consumers[index]
+            if channel.has_capacity():
+                self._next_consumer = index + 1
+                return channel, callback
+        return None
+
+    async def _deliver(self):
+        while True:
+            consumer = self._pick_consumer() if self._ready else None
+            if consumer is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            message, _ = self._ready.popleft()
+            channel, callback = consumer
+            channel.track(message, self)
+            try:
+                await callback(message)
+            except Exception as e:
+                # aio_pika leaves the message unacked when the callback raises
+                logger.error(f"Consumer of {self.name} failed: {e}")
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+class MemoryExchange:
+    def __init__(self, channel: "MemoryChannel", name: str, type: str):
+        self.channel = channel
+        self.name = name
+        self.type = type
+
+    async def publish(self, message, routing_key: str, **kwargs):
+        # Routed synchronously, so the "confirm" is immediate
+        self.channel.broker.route(self.name, routing_key, message)
+
+    async def bind(self, exchange, routing_key: str = None, **kwargs):
+        """Route messages from ``exchange`` into this exchange"""
+        source = getattr(exchange, "name", exchange)
+        self.channel.broker.bind_exchange(source, routing_key or "", self.name)
+
+    async def unbind(self, exchange, routing_key: str = None, **kwargs):
+        source = getattr(exchange, "name", exchange)
+        self.channel.broker.unbind_exchange(source, routing_key or "", self.name)
+
+class MemoryQueueHandle:
+    """What declare_queue returns: a queue as seen from one channel"""
+
+    def __init__(self, channel: "MemoryChannel", queue: MemoryQueue):
+        self.channel = channel
+        self.queue = queue
+        self.name = queue.name
+
+    async def bind(self, exchange, routing_key: str = None, **kwargs):
+        exchange_name = getattr(exchange, "name", exchange)
+        self.channel.broker.bind(exchange_name, routing_key or "", self.name)
+
+    async def unbind(self, exchange, routing_key: str = None, **kwargs):
+        exchange_name = getattr(exchange, "name", exchange)
+        self.channel.broker.unbind(exchange_name, routing_key or "", self.name)
+
+    async def consume(self, callback: Callable, no_ack: bool = False, **kwargs) -> str:
+        consumer_tag = f"ctag.{id(self.channel)}.{len(self.queue._consumers)}"
+        if no_ack:
+            async def auto_ack(message):
+                await message.ack()
+                await callback(message)
+            self.queue.add_consumer(self.channel, auto_ack, consumer_tag)
+        else:
+            self.queue.add_consumer(self.channel, callback, consumer_tag)
+        self.channel.consuming.add(self.queue)
+        return consumer_tag
+
+    async def cancel(self, consumer_tag: str, **kwargs):
+        self.queue.remove_consumers(consumer_tag=consumer_tag)
+
+    async def get(self, no_ack: bool = False, fail: bool = True, **kwargs) -> Optional[MemoryMessage]:
+        if not self.queue._ready:
+            if fail:
+                raise QueueEmpty()
+            return None
+        message, _ = self.queue._ready.popleft()
+        self.channel.track(message, self.queue)
+        if no_ack:
+            await message.ack()
+        return message
+
+class MemoryChannel:
+    def __init__(self, broker: "MemoryBroker"):
+        self.broker = broker
+        self.is_closed = False
+        self.prefetch_count = 0
+        self.consuming = set()
+        self.default_exchange = MemoryExchange(self, "", ExchangeType.DIRECT.value)
+        self._unacked: "OrderedDict[int, MemoryMessage]" = OrderedDict()
+        self._next_tag = 1
+
+    async def set_qos(self, prefetch_count: int = 0, **kwargs):
+        self.prefetch_count = prefetch_count
+
+    async def declare_exchange(
+        self, name: str, type=ExchangeType.DIRECT, durable: bool = False, arguments: Dict[str, Any] = None, **kwargs
+    ) -> MemoryExchange:
+        type = type.value if isinstance(type, ExchangeType) else type
+        self.broker.exchanges.setdefault(name, type)
+        self.broker.exchange_arguments.setdefault(name, arguments or {})
+        return MemoryExchange(self, name, self.broker.exchanges[name])
+
+    async def get_exchange(self, name: str, ensure: bool = True) -> MemoryExchange:
+        if name not in self.broker.exchanges:
+            if ensure:
+                raise LookupError(f"Exchange {name!r} is not declared")
+            # Publishing to an undeclared exchange just drops the message
+            return MemoryExchange(self, name, ExchangeType.DIRECT.value)
+        return MemoryExchange(self, name, self.broker.exchanges[name])
+
+    async def declare_queue(self, name: str = None, durable: bool = False, arguments: Dict[str, Any] = None, **kwargs) -> MemoryQueueHandle:
+        return MemoryQueueHandle(self, self.broker.declare_queue(name, arguments or {}))
+
+    def has_capacity(self) -> bool:
+        return not self.is_closed and (not self.prefetch_count or len(self._unacked) < self.prefetch_count)
+
+    def track(self, message: MemoryMessage, queue: MemoryQueue):
+        message.delivery_tag = self._next_tag
+        message._channel = self
+        message._queue = queue
+        self._next_tag += 1
+        self._unacked[message.delivery_tag] = message
+
+    def _settle(self, message: MemoryMessage, multiple: bool, requeue: Optional[bool]):
+        """requeue None acks; True puts the message back; False dead-letters or drops it"""
+        if message.delivery_tag not in self._unacked:
+            raise RuntimeError(f"Message {message.delivery_tag} was already acknowledged")
+        if multiple:
+            settled = [tag for tag in self._unacked if tag <= message.delivery_tag]
+        else:
+            settled = [message.delivery_tag]
+
+        # Requeued messages go back to the head in their original order
+        for tag in (reversed(settled) if requeue is True else settled):
+            settled_message = self._unacked.pop(tag)
+            if requeue is True:
+                settled_message.redelivered = True
+                settled_message._queue.put(settled_message, front=True)
+                continue
+            settled_message.processed = True
+            if requeue is False:
+                self.broker.dead_letter(settled_message._queue, settled_message)
+
+        # Freed prefetch slots may let a queue deliver again
+        for queue in self.consuming:
+            queue._wakeup.set()
+
+    async def close(self):
+        if self.is_closed:
+            return
+        self.is_closed = True
+        for queue in self.consuming:
+            queue.remove_consumers(channel=self)
+        # Unacked messages go back to their queues in their original order
+        for message in reversed(list(self._unacked.values())):
+            message.redelivered = True
+            message._queue.put(message, front=True)
+        self._unacked.clear()
+        self.broker.channels.discard(self)
+
+class MemoryConnection:
+    def __init__(self, broker: "MemoryBroker"):
+        self.broker = broker
+        self.is_closed = False
+        self._channels: List[MemoryChannel] = []
+
+    async def channel(self, publisher_confirms: bool = True, **kwargs) -> MemoryChannel:
+        channel = MemoryChannel(self.broker)
+        self._channels.append(channel)
+        self.broker.channels.add(channel)
+        return channel
+
+    async def close(self):
+        for channel in self._channels:
+            await channel.close()
+        self._channels = []
+        self.is_closed = True
+
+class MemoryBroker:
+    """Exchanges, bindings and queues for the whole process"""
+
+    def __init__(self):
+        self.exchanges: Dict[str, str] = {}
+        self.exchange_arguments: Dict[str, Dict[str, Any]] = {}
+        self.queues: Dict[str, MemoryQueue] = {}
+        self.bindings: Dict[str, List[Tuple[str, str]]] = {}
+        self.exchange_bindings: Dict[str, List[Tuple[str, str]]] = {}
+        self.channels = set()
+        self.stats = {"published": 0, "routed": 0, "unroutable": 0, "dead_lettered": 0}
+
+    def reset(self):
+        """Forget every exchange, queue and message"""
+        for queue in self.queues.values():
+            queue.stop()
+        for channel in self.channels:
+            channel.is_closed = True
+        self.exchanges.clear()
+        self.exchange_arguments.clear()
+        self.queues.clear()
+        self.bindings.clear()
+        self.exchange_bindings.clear()
+        self.channels.clear()
+        for key in self.stats:
+            self.stats[key] = 0
+
+    def declare_queue(self, name: str, arguments: Dict[str, Any]) -> MemoryQueue:
+        if not name:
+            name = f"amq.gen-{len(self.queues)}"
+        queue = self.queues.get(name)
+        if queue is None:
+            queue = self.queues[name] = MemoryQueue(self, name, arguments)
+        return queue
+
+    def bind(self, exchange: str, routing_key: str, queue: str):
+        bindings = self.bindings.setdefault(exchange, [])
+        if (routing_key, queue) not in bindings:
+            bindings.append((routing_key, queue))
+
+    def unbind(self, exchange: str, routing_key: str, queue: str):
+        bindings = self.bindings.get(exchange, [])
+        if (routing_key, queue) in bindings:
+            bindings.remove((routing_key, queue))
+
+    def bind_exchange(self, source: str, routing_key: str, destination: str):
+        bindings = self.exchange_bindings.setdefault(source, [])
+        if (routing_key, destination) not in bindings:
+            bindings.append((routing_key, destination))
+
+    def unbind_exchange(self, source: str, routing_key: str, destination: str):
+        bindings = self.exchange_bindings.get(source, [])
+        if (routing_key, destination) in bindings:
+            bindings.remove((routing_key, destination))
+
+    def _matches(self, exchange: str, pattern: str, routing_key: str) -> bool:
+        exchange_type = self.exchanges.get(exchange)
+        if exchange_type == ExchangeType.FANOUT.value:
+            return True
+        if exchange_type == ExchangeType.TOPIC.value:
+            return topic_matches(pattern, routing_key)
+        return pattern == routing_key
+
+    def _targets(self, exchange: str, routing_key: str, message, seen: set) -> List[str]:
+        """Queues ``message`` ends up in, following exchange-to-exchange bindings"""
+        if exchange == "":
+            return [routing_key] if routing_key in self.queues else []
+        if exchange in seen:
+            return []
+        seen.add(exchange)
+
+        bindings = self.bindings.get(exchange, [])
+        if self.exchanges.get(exchange) == ExchangeType.X_CONSISTENT_HASH.value:
+            if not bindings:
+                return []
+            header = self.exchange_arguments.get(exchange, {}).get("hash-header")
+            hash_key = (message.headers or {}).get(header) if header else routing_key
+            return [bindings[zlib.crc32(str(hash_key).encode()) % len(bindings)][1]]
+
+        targets = []
+        for pattern, queue in bindings:
+            if self._matches(exchange, pattern, routing_key) and queue not in targets:
+                targets.append(queue)
+        for pattern, destination in self.exchange_bindings.get(exchange, []):
+            if self._matches(exchange, pattern, routing_key):
+                for queue in self._targets(destination, routing_key, message, seen):
+                    if queue not in targets:
+                        targets.append(queue)
+        return targets
+
+    def route(self, exchange: str, routing_key: str, message) -> int:
+        """Copy ``message`` to every queue bound to ``exchange`` for ``routing_key``"""
+        self.stats["published"] += 1
+        targets = self._targets(exchange, routing_key, message, set())
+
+        if not targets:
+            self.stats["unroutable"] += 1
+        for queue in targets:
+            self.queues[queue].put(MemoryMessage(message, exchange, routing_key))
+        self.stats["routed"] += len(targets)
+        return len(targets)
+
+    def dead_letter(self, queue: MemoryQueue, message: MemoryMessage):
+        """Rejected or expired: republish through the queue's dead-letter exchange, if it has one"""
+        exchange = queue.arguments.get("x-dead-letter-exchange")
+        if exchange is None:
+            return
+        self.stats["dead_lettered"] += 1
+        routing_key = queue.arguments.get("x-dead-letter-routing-key", message.routing_key)
+        self.route(exchange, routing_key, message)
+
+    def idle(self) -> bool:
+        """
+        No consumed queue has messages waiting and nothing is unacked.
+        Messages sitting in retry tiers (queues nobody consumes) don't count.
+        """
+        if any(channel._unacked for channel in self.channels):
+            return False
+        return not any(queue._ready for queue in self.queues.values() if queue._consumers)
+
+    async def join(self, timeout: float = 10.0):
+        """Wait until every delivered message has been handled and acked"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while not self.idle():
+            if loop.time() >= deadline:
+                raise asyncio.TimeoutError("In-memory broker still has unhandled messages")
+            await asyncio.sleep(0.001)
+
+# Process-wide broker shared by every MemoryConnection
+memory_broker = MemoryBroker()
+
+async def connect(url: str = MEMORY_URL) -> MemoryConnection:
+    return MemoryConnection(memory_broker)
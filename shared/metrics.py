@@ -0,0 +1,77 @@
+"""
+In-process latency histograms for the health endpoints
+
+Fixed buckets keep observe() cheap and memory flat however many events go
+through. Percentiles are read off the buckets, so they're accurate to the
+bucket boundaries (the max is exact).
+"""
+from bisect import bisect_left
+from typing import Dict, Iterable, Tuple
+import threading
+
+# Upper bounds in seconds; anything slower lands in the overflow bucket
+LATENCY_BUCKETS: Tuple[float, ...] = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0
+)
+
+class Histogram:
+    """Counts of observed durations per bucket, plus count, sum and max"""
+
+    def __init__(self, buckets: Iterable[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        seconds = max(seconds, 0.0)
+        self.counts[bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-th quantile, capped at the max"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                return min(self.buckets[i], self.max) if i < len(self.buckets) else self.max
+        return self.max
+
+    def snapshot(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total / self.count * 1000, 3) if self.count else 0.0,
+            "p50_ms": round(self.percentile(0.50) * 1000, 3),
+            "p95_ms": round(self.percentile(0.95) * 1000, 3),
+            "p99_ms": round(self.percentile(0.99) * 1000, 3),
+            "max_ms": round(self.max * 1000, 3)
+        }
+
+class HistogramSet:
+    """One histogram per (label, metric), e.g. (event type, "lag")"""
+
+    def __init__(self, buckets: Iterable[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._histograms: Dict[Tuple[str, str], Histogram] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label: str, metric: str, seconds: float):
+        key = (label, metric)
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(key, Histogram(self.buckets))
+        histogram.observe(seconds)
+
+    def snapshot(self) -> Dict[str, Dict[str, Dict[str, float]]]:
+        """{label: {metric: summary}}"""
+        result: Dict[str, Dict[str, Dict[str, float]]] = {}
+        for (label, metric), histogram in sorted(self._histograms.items()):
+            result.setdefault(label, {})[metric] = histogram.snapshot()
+        return result
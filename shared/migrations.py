@@ -0,0 +1,92 @@
+"""
+Versioned SQL migrations for schema changes create_all can't make
+
+create_all only creates missing tables, so indexes added to existing tables
+ship as numbered SQL files in each service's ``migrations/`` directory:
+
+    order-service/migrations/0001_hot_path_indexes.sql
+
+Files run in name order, once per service, and are recorded in the
+``schema_migrations`` table. Statements are separated by ``;`` at the end
+of a line (outside ``$$`` quoting) and run in autocommit mode so
+``CREATE INDEX CONCURRENTLY`` doesn't block writes on a live table.
+"""
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from typing import List
+import zlib
+import os
+
+def _lock_key(service_name: str) -> int:
+    # pg_advisory_lock takes a signed bigint; crc32 is stable across processes
+    return zlib.crc32(f"schema_migrations:{service_name}".encode())
+
+def split_statements(sql: str) -> List[str]:
+    """Split a migration file into statements, dropping comment-only lines"""
+    statements = []
+    current = []
+    quoted = False
+    for line in sql.splitlines():
+        if not quoted and line.strip().startswith("--"):
+            continue
+        current.append(line)
+        # A $$-quoted body (DO blocks, functions) ends its inner lines with ; too
+        if line.count("$$") % 2:
+            quoted = not quoted
+        if not quoted and line.rstrip().endswith(";"):
+            statement = "\n".join(current).strip().rstrip(";").strip()
+            if statement:
+                statements.append(statement)
+            current = []
+    remainder = "\n".join(current).strip()
+    if remainder:
+        statements.append(remainder)
+    return statements
+
+def run_migrations(engine: Engine, service_name: str, migrations_dir: str) -> List[str]:
+    """
+    Apply pending migrations for a service and return the versions applied.
+    Only runs on PostgreSQL; other databases get their indexes from the models.
+    """
+    if engine.dialect.name != "postgresql" or not os.path.isdir(migrations_dir):
+        return []
+
+    files = sorted(f for f in os.listdir(migrations_dir) if f.endswith(".sql"))
+    applied_now = []
+
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        # Several replicas of a service may start at once - only one migrates
+        conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": _lock_key(service_name)})
+        try:
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    service VARCHAR NOT NULL,
+                    version VARCHAR NOT NULL,
+                    applied_at TIMESTAMP NOT NULL DEFAULT now(),
+                    PRIMARY KEY (service, version)
+                )
+            """))
+            applied = set(conn.execute(
+                text("SELECT version FROM schema_migrations WHERE service = :service"),
+                {"service": service_name}
+            ).scalars())
+
+            for filename in files:
+                version = filename[:-len(".sql")]
+                if version in applied:
+                    continue
+
+                with open(os.path.join(migrations_dir, filename)) as f:
+                    statements = split_statements(f.read())
+                for statement in statements:
+                    conn.exec_driver_sql(statement)
+
+                conn.execute(
+                    text("INSERT INTO schema_migrations (service, version) VALUES (:service, :version)"),
+                    {"service": service_name, "version": version}
+                )
+                applied_now.append(version)
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": _lock_key(service_name)})
+
+    return applied_now
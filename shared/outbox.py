@@ -0,0 +1,270 @@
+"""
+Transactional outbox for domain events
+
+Services don't publish to RabbitMQ inside a request any more. ``add_event``
+adds an ``outbox_events`` row to the caller's session, so the event commits
+or rolls back together with the state change it describes. A background
+``OutboxRelay`` in each producing service reads unpublished rows in batches
+and publishes them with publisher confirms. A row is marked published only
+after the broker has acknowledged it.
+
+Events for the same aggregate (usually an order) are published strictly in
+insert order. Different aggregates in a batch are published concurrently.
+Delivery is at-least-once: a crash between the broker ack and the
+``published_at`` update republishes the row with the same event id
+(``<producer>:<row id>``), which consumers use to drop the duplicate.
+The row's ``created_at`` becomes the envelope's ``occurred_at``.
+"""
+from sqlalchemy import Column, String, Integer, Text, DateTime, Index, event, select, update, delete, func, text
+from sqlalchemy.orm import Session
+from datetime import datetime, timedelta
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+from shared.database import Base, AsyncSessionLocal
+from shared.message_broker import get_message_broker
+from shared.events import current_correlation_id
+import asyncio
+import json
+import logging
+import os
+import zlib
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_PRODUCER = os.getenv("SERVICE_NAME", "unknown")
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "100"))
+# Upper bound on publish latency when no commit in this process woke the relay
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "1.0"))
+OUTBOX_MAX_BACKOFF = float(os.getenv("OUTBOX_MAX_BACKOFF", "30"))
+OUTBOX_RETENTION_HOURS = int(os.getenv("OUTBOX_RETENTION_HOURS", "24"))
+OUTBOX_PURGE_EVERY = 600
+
+class OutboxEvent(Base):
+    __tablename__ = "outbox_events"
+    __table_args__ = (
+        # Relay scan: unpublished rows for one producer in insert order
+        Index("ix_outbox_events_producer_published_at_id", "producer", "published_at", "id"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    producer = Column(String, nullable=False)
+    aggregate_type = Column(String, nullable=False)
+    aggregate_id = Column(String, nullable=False)
+    event_type = Column(String, nullable=False)
+    routing_key = Column(String, nullable=False)
+    payload = Column(Text, nullable=False)
+    correlation_id = Column(String)
+    attempts = Column(Integer, default=0, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    published_at = Column(DateTime)
+
+def add_event(
+    db,
+    event_type: str,
+    data: Dict[str, Any],
+    aggregate_id: Any = None,
+    aggregate_type: str = "order",
+    routing_key: Optional[str] = None
+) -> OutboxEvent:
+    """
+    Stage an event in the caller's transaction. Nothing is published until
+    the session commits. ``aggregate_id`` defaults to ``data["order_id"]``.
+    The event inherits the correlation id of the request or event being handled.
+    """
+    if aggregate_id is None:
+        aggregate_id = data.get("order_id")
+
+    outbox_event = OutboxEvent(
+        producer=OUTBOX_PRODUCER,
+        aggregate_type=aggregate_type,
+        aggregate_id=str(aggregate_id),
+        event_type=event_type,
+        routing_key=routing_key or event_type,
+        payload=json.dumps(data, default=str),
+        correlation_id=current_correlation_id.get()
+    )
+    db.add(outbox_event)
+    # AsyncSession keeps its sync Session's info dict, so the commit hook sees this
+    db.info["outbox_pending"] = True
+    return outbox_event
+
+@event.listens_for(Session, "after_commit")
+def _wake_relay_after_commit(session):
+    """Publish right after a commit that staged events instead of waiting for the next poll"""
+    if session.info.pop("outbox_pending", False) and outbox_relay is not None:
+        outbox_relay.wake()
+
+@event.listens_for(Session, "after_rollback")
+def _clear_pending_after_rollback(session):
+    session.info.pop("outbox_pending", None)
+
+class OutboxRelay:
+    """Drains one producer's outbox rows to RabbitMQ"""
+
+    def __init__(
+        self,
+        producer: str = OUTBOX_PRODUCER,
+        batch_size: int = OUTBOX_BATCH_SIZE,
+        poll_interval: float = OUTBOX_POLL_INTERVAL
+    ):
+        self.producer = producer
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        # One drainer per producer across replicas keeps per-aggregate order
+        self.lock_key = zlib.crc32(f"outbox:{producer}".encode())
+        self.stats = {"published": 0, "failed": 0, "batches": 0}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._failures = 0
+        self._last_purge = 0.0
+
+    def wake(self):
+        self._wakeup.set()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                published, failed = await self.drain_once()
+                self._failures = self._failures + 1 if failed else 0
+                if loop.time() - self._last_purge >= OUTBOX_PURGE_EVERY:
+                    self._last_purge = loop.time()
+                    await self.purge_published()
+                # A full batch means there's probably more waiting
+                if published == self.batch_size:
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._failures += 1
+                logger.warning(f"Outbox relay error: {e}")
+
+            delay = self.poll_interval
+            if self._failures:
+                delay = min(self.poll_interval * 2 ** self._failures, OUTBOX_MAX_BACKOFF)
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    async def drain_once(self) -> tuple:
+        """Publish one batch; returns (published, failed) counts"""
+        async with AsyncSessionLocal() as db:
+            if db.get_bind().dialect.name == "postgresql":
+                locked = await db.scalar(text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": self.lock_key})
+                if not locked:
+                    return 0, 0
+
+            rows = (await db.execute(
+                select(OutboxEvent)
+                .filter(OutboxEvent.producer == self.producer, OutboxEvent.published_at.is_(None))
+                .order_by(OutboxEvent.id)
+                .limit(self.batch_size)
+            )).scalars().all()
+            if not rows:
+                return 0, 0
+
+            groups: "OrderedDict[tuple, List[OutboxEvent]]" = OrderedDict()
+            for row in rows:
+                groups.setdefault((row.aggregate_type, row.aggregate_id), []).append(row)
+
+            message_broker = await get_message_broker()
+            published_ids: List[int] = []
+            failed_ids: List[int] = []
+
+            async def publish_group(events: List[OutboxEvent]):
+                for outbox_event in events:
+                    try:
+                        await message_broker.publish_confirmed(
+                            outbox_event.event_type,
+                            json.loads(outbox_event.payload),
+                            outbox_event.routing_key,
+                            event_id=f"{outbox_event.producer}:{outbox_event.id}",
+                            occurred_at=outbox_event.created_at,
+                            correlation_id=outbox_event.correlation_id
+                        )
+                    except Exception as e:
+                        logger.warning(f"Outbox publish of {outbox_event.event_type} #{outbox_event.id} failed: {e}")
+                        # Later events for this aggregate wait so they can't overtake it
+                        failed_ids.append(outbox_event.id)
+                        return
+                    published_ids.append(outbox_event.id)
+
+            await asyncio.gather(*(publish_group(events) for events in groups.values()))
+
+            if published_ids:
+                await db.execute(
+                    update(OutboxEvent)
+                    .where(OutboxEvent.id.in_(published_ids))
+                    .values(published_at=datetime.utcnow())
+                )
+            if failed_ids:
+                await db.execute(
+                    update(OutboxEvent)
+                    .where(OutboxEvent.id.in_(failed_ids))
+                    .values(attempts=OutboxEvent.attempts + 1)
+                )
+            await db.commit()
+
+        self.stats["published"] += len(published_ids)
+        self.stats["failed"] += len(failed_ids)
+        self.stats["batches"] += 1
+        return len(published_ids), len(failed_ids)
+
+    async def purge_published(self) -> int:
+        """Delete published rows older than OUTBOX_RETENTION_HOURS"""
+        cutoff = datetime.utcnow() - timedelta(hours=OUTBOX_RETENTION_HOURS)
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(delete(OutboxEvent).filter(
+                OutboxEvent.producer == self.producer,
+                OutboxEvent.published_at.is_not(None),
+                OutboxEvent.published_at < cutoff
+            ))
+            await db.commit()
+            return result.rowcount
+
+    async def pending(self) -> int:
+        """Rows still waiting to be published"""
+        async with AsyncSessionLocal() as db:
+            return await db.scalar(
+                select(func.count(OutboxEvent.id))
+                .filter(OutboxEvent.producer == self.producer, OutboxEvent.published_at.is_(None))
+            )
+
+# Global relay instance, started by each producing service
+outbox_relay: Optional[OutboxRelay] = None
+
+def start_outbox_relay(producer: str = OUTBOX_PRODUCER) -> OutboxRelay:
+    global outbox_relay
+    if outbox_relay is None:
+        outbox_relay = OutboxRelay(producer)
+    outbox_relay.start()
+    return outbox_relay
+
+async def stop_outbox_relay():
+    if outbox_relay is not None:
+        await outbox_relay.stop()
+
+async def get_outbox_metrics() -> Dict[str, Any]:
+    """Relay counters and backlog for the health endpoint"""
+    if outbox_relay is None:
+        return {"running": False}
+    return {
+        "running": outbox_relay._task is not None,
+        "pending": await outbox_relay.pending(),
+        **outbox_relay.stats
+    }
@@ -0,0 +1,113 @@
+"""
+Keyset (cursor) pagination shared by the list endpoints
+
+Lists are ordered newest first by (created_at, id). A page returns an opaque
+cursor for the last row; passing it back as ``cursor`` continues strictly
+after that row, so every page costs one index range scan no matter how deep.
+``skip`` still works for old clients but falls back to OFFSET.
+Nearest-first lists page the same way on (distance, id).
+"""
+from sqlalchemy import select, func, tuple_
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql import Select
+from sqlalchemy.sql.expression import ClauseElement, Executable
+from datetime import datetime
+from typing import Any, List, Optional, Tuple
+from enum import Enum
+import base64
+import json
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+class TotalMode(str, Enum):
+    EXACT = "exact"
+    APPROXIMATE = "approximate"
+    NONE = "none"
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    """Opaque cursor for the row a page ended on"""
+    payload = json.dumps({"c": created_at.isoformat(), "i": row_id}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Decode a cursor produced by encode_cursor; raises ValueError if it's malformed"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(payload["c"]), int(payload["i"])
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError("Invalid pagination cursor") from e
+
+def encode_distance_cursor(distance: float, row_id: int) -> str:
+    """Opaque cursor for the row a nearest-first page ended on"""
+    payload = json.dumps({"d": distance, "i": row_id}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+def decode_distance_cursor(cursor: str) -> Tuple[float, int]:
+    """Decode a cursor produced by encode_distance_cursor; raises ValueError if it's malformed"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return float(payload["d"]), int(payload["i"])
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError("Invalid pagination cursor") from e
+
+def keyset_query(
+    query: Select,
+    created_column,
+    id_column,
+    cursor: Optional[str] = None,
+    skip: int = 0,
+    limit: int = 100
+) -> Select:
+    """
+    Order a query newest first and restrict it to the page after ``cursor``.
+    Fetches one extra row so split_page can tell whether another page exists.
+    """
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        query = query.filter(tuple_(created_column, id_column) < tuple_(created_at, row_id))
+    elif skip:
+        query = query.offset(skip)
+
+    return query.order_by(created_column.desc(), id_column.desc()).limit(limit + 1)
+
+def split_page(rows: List[Any], limit: int) -> Tuple[List[Any], Optional[str]]:
+    """Trim the extra row fetched by keyset_query and build the next cursor"""
+    rows = list(rows)
+    if len(rows) <= limit:
+        return rows, None
+
+    page = rows[:limit]
+    last = page[-1]
+    return page, encode_cursor(last.created_at, last.id)
+
+class Explain(Executable, ClauseElement):
+    """``EXPLAIN (FORMAT JSON)`` of a select, whose parameters stay bound"""
+    inherit_cache = False
+
+    def __init__(self, statement: Select):
+        self.statement = statement
+
+@compiles(Explain, "postgresql")
+def _compile_explain(element, compiler, **kw):
+    return "EXPLAIN (FORMAT JSON) " + compiler.process(element.statement, **kw)
+
+async def count_rows(db, query: Select, mode: TotalMode = TotalMode.EXACT) -> Optional[int]:
+    """
+    Total rows matched by ``query`` (ignoring ordering and paging).
+    APPROXIMATE reads the planner's row estimate on PostgreSQL instead of counting.
+    """
+    if mode == TotalMode.NONE:
+        return None
+
+    query = query.order_by(None).limit(None).offset(None)
+
+    dialect = db.get_bind().dialect
+    if mode == TotalMode.APPROXIMATE and dialect.name == "postgresql":
+        plan = (await db.execute(Explain(query))).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]["Plan"]["Plan Rows"])
+
+    return await db.scalar(select(func.count()).select_from(query.subquery()))
@@ -0,0 +1,217 @@
+"""
+Partition ownership for horizontally scaled consumers
+
+A partitioned service's events are spread over N queues by a hash of the
+order id (see MessageBroker.subscribe). Each partition queue must be
+consumed by one replica at a time, or events for one order could be handled
+out of order or concurrently. The replicas agree on who consumes what through
+two tables in the shared database:
+
+- ``queue_consumers``: one heartbeat row per live replica
+- ``queue_partition_leases``: one row per partition, naming its owner until
+  ``expires_at``
+
+Every heartbeat a replica renews its leases and works out its fair share,
+ceil(N / live replicas). It hands back partitions above its share and
+claims free or expired ones below it. A partition is only released after
+its consumer is cancelled and its in-flight events are finished. A replica
+that dies stops renewing, and its partitions are claimed once its leases
+expire. The partition queues also use RabbitMQ's single-active-consumer,
+which guards the overlap if a stalled replica wakes up after losing its lease.
+"""
+from sqlalchemy import Column, String, Integer, DateTime, select, update, delete, func, or_
+from sqlalchemy.exc import IntegrityError
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Optional, Set
+from shared.database import Base, AsyncSessionLocal
+import asyncio
+import logging
+import math
+import os
+import socket
+import uuid
+
+logger = logging.getLogger(__name__)
+
+PARTITION_HEARTBEAT = float(os.getenv("PARTITION_HEARTBEAT_SECONDS", "5"))
+# A replica (and its leases) counts as gone after this long without a heartbeat
+PARTITION_LEASE_TTL = float(os.getenv("PARTITION_LEASE_SECONDS", "20"))
+
+class ConsumerMember(Base):
+    __tablename__ = "queue_consumers"
+
+    service = Column(String, primary_key=True)
+    member = Column(String, primary_key=True)
+    last_seen = Column(DateTime, nullable=False)
+
+class PartitionLease(Base):
+    __tablename__ = "queue_partition_leases"
+
+    service = Column(String, primary_key=True)
+    partition = Column(Integer, primary_key=True)
+    owner = Column(String)
+    expires_at = Column(DateTime)
+
+def member_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+class PartitionCoordinator:
+    """
+    Claims and releases a fair share of a service's partitions for this
+    replica. ``on_assign(partition)`` starts consuming a partition and
+    ``on_revoke(partition)`` stops and drains it.
+    """
+
+    def __init__(
+        self,
+        service: str,
+        partitions: int,
+        on_assign: Callable[[int], Awaitable[None]],
+        on_revoke: Callable[[int], Awaitable[None]],
+        heartbeat: float = PARTITION_HEARTBEAT,
+        lease_ttl: float = PARTITION_LEASE_TTL
+    ):
+        self.service = service
+        self.partitions = partitions
+        self.on_assign = on_assign
+        self.on_revoke = on_revoke
+        self.heartbeat = heartbeat
+        self.lease_ttl = lease_ttl
+        self.member = member_id()
+        self.owned: Set[int] = set()
+        self.live_members = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop heartbeating and hand every partition back right away"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for partition in sorted(self.owned):
+            await self._release(partition)
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(delete(ConsumerMember).filter(
+                    ConsumerMember.service == self.service, ConsumerMember.member == self.member
+                ))
+                await db.commit()
+        except Exception as e:
+            logger.warning(f"Could not deregister {self.member}: {e}")
+
+    async def _run(self):
+        while True:
+            try:
+                await self.rebalance_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Partition rebalance failed: {e}")
+            await asyncio.sleep(self.heartbeat)
+
+    async def rebalance_once(self):
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=self.lease_ttl)
+        async with AsyncSessionLocal() as db:
+            await self._heartbeat(db, now)
+            await db.commit()
+            await self._ensure_leases(db)
+
+            self.live_members = await db.scalar(select(func.count()).select_from(ConsumerMember).filter(
+                ConsumerMember.service == self.service,
+                ConsumerMember.last_seen >= now - timedelta(seconds=self.lease_ttl)
+            )) or 1
+
+            # Renew what we hold; anything we thought we held but don't was taken after we stalled
+            await db.execute(update(PartitionLease).filter(
+                PartitionLease.service == self.service, PartitionLease.owner == self.member
+            ).values(expires_at=expires_at))
+            held = set((await db.execute(select(PartitionLease.partition).filter(
+                PartitionLease.service == self.service, PartitionLease.owner == self.member
+            ))).scalars())
+            await db.commit()
+
+        for partition in sorted(self.owned - held):
+            logger.warning(f"Lost the lease on partition {partition}")
+            self.owned.discard(partition)
+            await self.on_revoke(partition)
+
+        target = math.ceil(self.partitions / self.live_members)
+        for partition in sorted(self.owned, reverse=True)[:max(len(self.owned) - target, 0)]:
+            await self._release(partition)
+
+        if len(self.owned) < target:
+            await self._claim(target - len(self.owned), now, expires_at)
+
+    async def _heartbeat(self, db, now: datetime):
+        result = await db.execute(update(ConsumerMember).filter(
+            ConsumerMember.service == self.service, ConsumerMember.member == self.member
+        ).values(last_seen=now))
+        if result.rowcount == 0:
+            db.add(ConsumerMember(service=self.service, member=self.member, last_seen=now))
+        # Forget replicas that have been gone for a while
+        await db.execute(delete(ConsumerMember).filter(
+            ConsumerMember.service == self.service,
+            ConsumerMember.last_seen < now - timedelta(seconds=self.lease_ttl * 10)
+        ))
+
+    async def _ensure_leases(self, db):
+        existing = set((await db.execute(select(PartitionLease.partition).filter(
+            PartitionLease.service == self.service
+        ))).scalars())
+        missing = [partition for partition in range(self.partitions) if partition not in existing]
+        if not missing:
+            return
+        db.add_all([PartitionLease(service=self.service, partition=partition) for partition in missing])
+        try:
+            await db.commit()
+        except IntegrityError:
+            # Another replica created them at the same time
+            await db.rollback()
+
+    async def _claim(self, wanted: int, now: datetime, expires_at: datetime):
+        async with AsyncSessionLocal() as db:
+            free = (await db.execute(select(PartitionLease.partition).filter(
+                PartitionLease.service == self.service,
+                PartitionLease.partition < self.partitions,
+                or_(PartitionLease.owner.is_(None), PartitionLease.expires_at < now)
+            ).order_by(PartitionLease.partition))).scalars().all()
+
+            for partition in free[:wanted]:
+                # Conditional update: only one replica can win a free partition
+                result = await db.execute(update(PartitionLease).filter(
+                    PartitionLease.service == self.service,
+                    PartitionLease.partition == partition,
+                    or_(PartitionLease.owner.is_(None), PartitionLease.expires_at < now)
+                ).values(owner=self.member, expires_at=expires_at))
+                await db.commit()
+                if result.rowcount != 1:
+                    continue
+
+                self.owned.add(partition)
+                try:
+                    await self.on_assign(partition)
+                except Exception as e:
+                    logger.warning(f"Could not start partition {partition}: {e}")
+                    await self._release(partition)
+
+    async def _release(self, partition: int):
+        """Drain the partition, then free its lease for another replica"""
+        self.owned.discard(partition)
+        try:
+            await self.on_revoke(partition)
+        finally:
+            async with AsyncSessionLocal() as db:
+                await db.execute(update(PartitionLease).filter(
+                    PartitionLease.service == self.service,
+                    PartitionLease.partition == partition,
+                    PartitionLease.owner == self.member
+                ).values(owner=None, expires_at=None))
+                await db.commit()
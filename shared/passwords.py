@@ -0,0 +1,122 @@
+"""
+Password hashing off the event loop
+
+pbkdf2_sha256 costs tens of milliseconds of CPU per hash or verify. Run
+inline in an ``async def`` route, a burst of logins stalls every other
+request on the worker. ``PasswordHasher`` sends that work to a bounded
+process pool and awaits the result, so the loop keeps serving ``/me`` and
+``/health`` while logins are hashed in parallel on other cores.
+
+Admission control: once ``max_pending`` hashes are queued or running, new
+requests fail fast with ``HasherBusyError`` (the routes answer 503 with
+Retry-After). Under a login storm that bounds both latency and memory
+instead of letting the queue grow without limit.
+
+``PASSWORD_HASH_ROUNDS`` sets the pbkdf2 work factor for new hashes.
+Hashes made with other rounds still verify, and ``verify`` returns a
+replacement hash for them so the caller can store it - users move to the
+new setting as they log in.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Tuple
+from passlib.context import CryptContext
+import asyncio
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+# pbkdf2_sha256 rounds for new hashes; passlib's default is 29000
+PASSWORD_HASH_ROUNDS = int(os.getenv("PASSWORD_HASH_ROUNDS", "29000"))
+# Hashing processes; 0 hashes in a thread of the default executor instead
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(os.cpu_count() or 1, 4))))
+# Hashes queued or running before new ones are refused
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", str(max(PASSWORD_HASH_WORKERS, 1) * 16)))
+
+class HasherBusyError(Exception):
+    """Too many hashes pending; the caller should retry later"""
+
+_contexts = {}
+
+def _context(rounds: int) -> CryptContext:
+    # Built once per process: pool workers receive only the rounds
+    context = _contexts.get(rounds)
+    if context is None:
+        context = _contexts[rounds] = CryptContext(schemes=["pbkdf2_sha256"], pbkdf2_sha256__rounds=rounds)
+    return context
+
+def hash_password(password: str, rounds: int = PASSWORD_HASH_ROUNDS) -> str:
+    return _context(rounds).hash(password)
+
+def verify_password(password: str, hashed_password: str, rounds: int = PASSWORD_HASH_ROUNDS) -> Tuple[bool, Optional[str]]:
+    """(matches, replacement hash if the stored one uses other parameters)"""
+    try:
+        return _context(rounds).verify_and_update(password, hashed_password)
+    except (ValueError, TypeError):
+        # Not a hash we recognise
+        return False, None
+
+class PasswordHasher:
+    def __init__(
+        self,
+        workers: int = PASSWORD_HASH_WORKERS,
+        max_pending: int = PASSWORD_HASH_MAX_PENDING,
+        rounds: int = PASSWORD_HASH_ROUNDS
+    ):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.rounds = rounds
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.stats = {"hashed": 0, "verified": 0, "rehashed": 0, "rejected": 0}
+
+    def _get_executor(self) -> Optional[ProcessPoolExecutor]:
+        if self.workers <= 0:
+            return None
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            return self._executor
+
+    async def _run(self, func, *args):
+        if self._pending >= self.max_pending:
+            self.stats["rejected"] += 1
+            raise HasherBusyError(f"{self._pending} password hashes pending")
+        self._pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._get_executor(), func, *args)
+        finally:
+            self._pending -= 1
+
+    async def hash(self, password: str) -> str:
+        hashed = await self._run(hash_password, password, self.rounds)
+        self.stats["hashed"] += 1
+        return hashed
+
+    async def verify(self, password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        """(matches, new hash to store or None); see verify_password"""
+        ok, new_hash = await self._run(verify_password, password, hashed_password, self.rounds)
+        self.stats["verified"] += 1
+        if new_hash:
+            self.stats["rehashed"] += 1
+        return ok, new_hash
+
+    def metrics(self) -> dict:
+        return {
+            "workers": self.workers,
+            "rounds": self.rounds,
+            "pending": self._pending,
+            "max_pending": self.max_pending,
+            **self.stats
+        }
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+# Shared by the auth routes; the pool starts on first use
+password_hasher = PasswordHasher()
@@ -0,0 +1,100 @@
+"""
+Cached lookups of users from the auth service
+
+Services that show names or contact details (reports, notifications,
+support tools) ask the auth service instead of reading the ``users`` table
+themselves:
+
+    users = await user_directory.get_users(customer_ids)
+    name = users[customer_id]["name"] if users.get(customer_id) else None
+
+Ids not cached in this process are fetched with ``POST /users/batch``, in
+chunks of at most ``USER_BATCH_MAX_IDS``, authenticated with ``SERVICE_TOKEN``. Results, including ids that don't
+exist, are cached for ``USER_DIRECTORY_CACHE_TTL`` seconds and evicted early
+when the auth service publishes ``user.updated`` / ``user.deactivated``
+(see shared.auth.start_principal_invalidation).
+"""
+from typing import Any, Dict, Iterable, Optional
+from shared.auth import SERVICE_TOKEN, SERVICE_TOKEN_HEADER, user_change_listeners
+from shared.cache import TTLCache
+import httpx
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+AUTH_SERVICE_URL = os.getenv("AUTH_SERVICE_URL", "http://auth-service:8000")
+USER_DIRECTORY_CACHE_SIZE = int(os.getenv("USER_DIRECTORY_CACHE_SIZE", "10000"))
+USER_DIRECTORY_CACHE_TTL = float(os.getenv("USER_DIRECTORY_CACHE_TTL", "300"))
+# Must not exceed the auth service's own USER_BATCH_MAX_IDS
+USER_BATCH_MAX_IDS = int(os.getenv("USER_BATCH_MAX_IDS", "1000"))
+
+_MISSING = object()
+
+class UserDirectory:
+    def __init__(
+        self,
+        base_url: str = AUTH_SERVICE_URL,
+        batch_size: int = USER_BATCH_MAX_IDS,
+        timeout: float = 5.0
+    ):
+        self.base_url = base_url
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self._cache = TTLCache(maxsize=USER_DIRECTORY_CACHE_SIZE, ttl=USER_DIRECTORY_CACHE_TTL)
+        self._client: Optional[httpx.AsyncClient] = None
+        self.stats = {"hits": 0, "misses": 0, "requests": 0}
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=self.timeout,
+                headers={SERVICE_TOKEN_HEADER: SERVICE_TOKEN}
+            )
+        return self._client
+
+    async def get_users(self, ids: Iterable[int]) -> Dict[int, Optional[Dict[str, Any]]]:
+        """
+        ``{id: user}`` for every id asked for; the user is None if it
+        doesn't exist. Raises httpx errors if the auth service can't be
+        reached for ids that aren't cached.
+        """
+        users = {}
+        wanted = []
+        for user_id in dict.fromkeys(ids):
+            cached = self._cache.get(user_id, _MISSING)
+            if cached is _MISSING:
+                wanted.append(user_id)
+            else:
+                users[user_id] = cached
+        self.stats["hits"] += len(users)
+        self.stats["misses"] += len(wanted)
+
+        for start in range(0, len(wanted), self.batch_size):
+            chunk = wanted[start:start + self.batch_size]
+            self.stats["requests"] += 1
+            response = await self._get_client().post("/users/batch", json={"ids": chunk})
+            response.raise_for_status()
+            body = response.json()
+            for user in body["users"]:
+                self._cache.set(user["id"], user)
+                users[user["id"]] = user
+            for user_id in body["missing"]:
+                self._cache.set(user_id, None)
+                users[user_id] = None
+        return users
+
+    async def get_user(self, user_id: int) -> Optional[Dict[str, Any]]:
+        return (await self.get_users([user_id])).get(user_id)
+
+    def invalidate(self, user_id: int):
+        self._cache.pop(user_id)
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+user_directory = UserDirectory()
+user_change_listeners.append(user_directory.invalidate)
@@ -0,0 +1,54 @@
+"""
+Fixtures for the shared library tests
+
+The broker runs on the in-process backend (shared/memory_broker.py) and
+the tables (processed events, idempotency keys, outbox, orders) live in a
+throwaway SQLite file, so no RabbitMQ or Postgres is needed. Retry tiers are shortened to keep the
+retry and dead-letter tests fast.
+"""
+import os
+import sys
+import tempfile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(ROOT)
+
+_database = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+os.environ["DATABASE_URL"] = f"sqlite:///{_database.name}"
+os.environ["RABBITMQ_RETRY_DELAYS"] = "0.01,0.02"
+
+import pytest
+
+from shared.database import Base, engine, async_engine
+from shared.memory_broker import memory_broker
+from shared.message_broker import MessageBroker
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+@pytest.fixture(scope="session", autouse=True)
+def database():
+    Base.metadata.create_all(bind=engine)
+    yield
+    engine.dispose()
+    os.unlink(_database.name)
+
+@pytest.fixture(autouse=True)
+async def async_database():
+    # Each test runs on its own event loop, so it gets a fresh pool. Its first
+    # connection is opened alone: aiosqlite's connect hook awaits while
+    # SQLAlchemy holds the new pool's first-connect lock, and a second
+    # connection racing it would deadlock.
+    async with async_engine.connect():
+        pass
+    yield
+    await async_engine.dispose()
+
+@pytest.fixture
+async def broker():
+    memory_broker.reset()
+    broker = MessageBroker("memory://", "test-service", partitions=0)
+    await broker.connect()
+    yield broker
+    await broker.disconnect()
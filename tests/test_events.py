@@ -0,0 +1,30 @@
+"""EventDeduplicator claims against the processed_events table"""
+import pytest
+
+from shared.events import EventDeduplicator
+
+pytestmark = pytest.mark.anyio
+
+async def test_second_claim_is_a_duplicate():
+    assert await EventDeduplicator("dedupe-single").claim("evt-1")
+    # A fresh instance has an empty cache, so this one is answered by the insert
+    assert not await EventDeduplicator("dedupe-single").claim("evt-1")
+    assert await EventDeduplicator("dedupe-other").claim("evt-1")
+
+async def test_batch_claims_only_new_ids():
+    first = EventDeduplicator("dedupe-batch")
+    assert await first.claim_many(["a", "b"]) == {"a", "b"}
+
+    second = EventDeduplicator("dedupe-batch")
+    assert await second.claim_many(["a", "b", "c", "c"]) == {"c"}
+    assert second.stats["duplicates"] == 3
+
+async def test_released_claim_can_be_claimed_again():
+    deduplicator = EventDeduplicator("dedupe-release")
+    assert await deduplicator.claim("evt-2")
+    await deduplicator.release("evt-2")
+    assert await EventDeduplicator("dedupe-release").claim("evt-2")
+
+async def test_redelivered_event_is_reclaimed():
+    assert await EventDeduplicator("dedupe-reclaim").claim("evt-3")
+    assert await EventDeduplicator("dedupe-reclaim").claim("evt-3", reclaim=True)
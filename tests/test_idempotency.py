@@ -0,0 +1,74 @@
+"""IdempotencyStore: stored responses, and taking over keys whose request died"""
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import select
+
+from shared import idempotency
+from shared.database import AsyncSessionLocal
+from shared.idempotency import IdempotencyKey, IdempotencyStore
+
+pytestmark = pytest.mark.anyio
+
+@pytest.fixture
+def store():
+    return IdempotencyStore()
+
+async def abandon_claim(scope: str, key: str, lease_left: float):
+    """A pending row, as left by a request that crashed before storing its response"""
+    now = datetime.utcnow()
+    async with AsyncSessionLocal() as db:
+        db.add(IdempotencyKey(
+            scope=scope, key=key, request_hash="h", created_at=now,
+            expires_at=now + timedelta(seconds=lease_left)
+        ))
+        await db.commit()
+
+async def test_retry_gets_the_stored_response(store):
+    calls = []
+
+    async def work():
+        calls.append(1)
+        return {"order_id": len(calls)}
+
+    assert await store.run("orders:1", "stored", "h", work) == {"order_id": 1}
+    # A fresh store has no LRU entry, so this reads the table
+    assert await IdempotencyStore().run("orders:1", "stored", "h", work) == {"order_id": 1}
+    assert calls == [1]
+
+    async with AsyncSessionLocal() as db:
+        row = (await db.execute(select(IdempotencyKey).filter(IdempotencyKey.key == "stored"))).scalars().one()
+    assert row.expires_at > datetime.utcnow() + timedelta(seconds=store.ttl - 60)
+
+async def test_pending_claim_is_only_leased(store):
+    leases = []
+
+    async def work():
+        async with AsyncSessionLocal() as db:
+            row = (await db.execute(select(IdempotencyKey).filter(IdempotencyKey.key == "leased"))).scalars().one()
+        leases.append(row.expires_at - datetime.utcnow())
+        return {"order_id": 1}
+
+    await store.run("orders:1", "leased", "h", work)
+    assert leases[0] <= timedelta(seconds=idempotency.IDEMPOTENCY_LEASE_SECONDS)
+
+async def test_live_claim_makes_a_retry_wait(store, monkeypatch):
+    monkeypatch.setattr(idempotency, "IDEMPOTENCY_WAIT_SECONDS", 0.2)
+    await abandon_claim("orders:1", "live", lease_left=60)
+
+    async def work():
+        return {"order_id": 1}
+
+    with pytest.raises(HTTPException) as error:
+        await store.run("orders:1", "live", "h", work)
+    assert error.value.status_code == 409
+
+async def test_abandoned_claim_is_taken_over(store):
+    await abandon_claim("orders:1", "abandoned", lease_left=-1)
+
+    async def work():
+        return {"order_id": 2}
+
+    assert await store.run("orders:1", "abandoned", "h", work) == {"order_id": 2}
+    assert await IdempotencyStore().run("orders:1", "abandoned", "h", work) == {"order_id": 2}
@@ -0,0 +1,149 @@
+"""MessageBroker on the in-process backend: routing, retries, dead letters and overflow"""
+import asyncio
+
+import pytest
+from aio_pika import Message
+
+from shared import message_broker
+from shared.memory_broker import memory_broker
+from shared.message_broker import EventRouter, MessageBroker, dead_letter_queue_name
+
+pytestmark = pytest.mark.anyio
+
+async def test_routes_by_topic_pattern(broker):
+    created, payments = [], []
+    await broker.subscribe(EventRouter({
+        "order.created": lambda event: created.append(event["data"]["order_id"]),
+        "payment.*": lambda event: payments.append(event["event_type"])
+    }))
+
+    await broker.publish_event("order.created", {"order_id": 1})
+    await broker.publish_event("payment.succeeded", {"order_id": 1})
+    await broker.publish_event("payment.failed", {"order_id": 2})
+    await broker.publish_event("driver.assigned", {"order_id": 1})
+    await memory_broker.join()
+
+    assert created == [1]
+    assert sorted(payments) == ["payment.failed", "payment.succeeded"]
+
+async def test_failed_event_is_retried(broker):
+    attempts = []
+
+    async def flaky(event):
+        attempts.append(event["event_id"])
+        if len(attempts) < 2:
+            raise RuntimeError("transient")
+
+    await broker.subscribe(EventRouter({"order.created": flaky}))
+    await broker.publish_event("order.created", {"order_id": 7})
+    await memory_broker.join()
+    # The retry waits out its tier in a queue nobody consumes
+    await asyncio.sleep(0.1)
+    await memory_broker.join()
+
+    assert len(attempts) == 2
+    assert attempts[0] == attempts[1]
+    assert await broker.peek_dead_letters() == []
+
+async def test_exhausted_event_is_dead_lettered_and_replayed(broker):
+    attempts = []
+    fail = True
+
+    async def handler(event):
+        attempts.append(event["data"]["order_id"])
+        if fail:
+            raise RuntimeError("broken")
+
+    await broker.subscribe(EventRouter({"order.created": handler}))
+    await broker.publish_event("order.created", {"order_id": 3})
+    for _ in range(3):
+        await asyncio.sleep(0.1)
+        await memory_broker.join()
+
+    dead = await broker.peek_dead_letters()
+    assert [entry["routing_key"] for entry in dead] == ["order.created"]
+    assert dead[0]["attempts"] == 3
+    assert "RuntimeError: broken" in dead[0]["last_error"]
+    assert len(attempts) == 3
+
+    fail = False
+    assert await broker.replay_dead_letters() == 1
+    await memory_broker.join()
+
+    assert attempts == [3, 3, 3, 3]
+    assert memory_broker.queues[dead_letter_queue_name(broker.queue_name)].message_count == 0
+
+async def test_replay_is_not_redelivered_to_other_services(broker):
+    # Another service's queue on the same key, left unconsumed so it counts every copy
+    memory_broker.declare_queue("other-service", {})
+    memory_broker.bind(message_broker.EXCHANGE_NAME, "order.created", "other-service")
+    attempts = []
+    fail = True
+
+    async def handler(event):
+        attempts.append(event["data"]["order_id"])
+        if fail:
+            raise RuntimeError("broken")
+
+    await broker.subscribe(EventRouter({"order.created": handler}))
+    await broker.publish_event("order.created", {"order_id": 5})
+    for _ in range(3):
+        await asyncio.sleep(0.1)
+        await memory_broker.join()
+
+    fail = False
+    assert await broker.replay_dead_letters() == 1
+    await memory_broker.join()
+
+    assert attempts == [5, 5, 5, 5]
+    assert memory_broker.queues["other-service"].message_count == 1
+
+async def test_bulk_overflow_is_replayed_under_original_key(monkeypatch):
+    monkeypatch.setattr(message_broker, "BULK_MAX_LENGTH", 1)
+    memory_broker.reset()
+    broker = MessageBroker("memory://", "bulk-service", partitions=0, priority_class=message_broker.PRIORITY_BULK)
+    await broker.connect()
+    release = asyncio.Event()
+    handled = []
+
+    async def slow(event):
+        await release.wait()
+        handled.append(event["data"]["order_id"])
+
+    try:
+        await broker.subscribe(EventRouter({"order.created": slow}), prefetch=1, workers=1)
+        for order_id in range(6):
+            await broker.publish_event("order.created", {"order_id": order_id})
+        dead_queue = memory_broker.queues[dead_letter_queue_name(broker.queue_name)]
+        # At most one in flight and one ready; the oldest of the rest were pushed out
+        overflowed = dead_queue.message_count
+        assert overflowed >= 4
+        assert [entry["routing_key"] for entry in await broker.peek_dead_letters()] == ["order.created"] * overflowed
+
+        release.set()
+        await memory_broker.join()
+        unroutable = memory_broker.stats["unroutable"]
+        # Replays faster than the consumer drains overflow again; repeat until the queue is empty
+        replayed = 0
+        for _ in range(20):
+            if not dead_queue.message_count:
+                break
+            replayed += await broker.replay_dead_letters()
+            await memory_broker.join()
+        assert replayed >= overflowed
+
+        assert sorted(handled) == list(range(6))
+        assert dead_queue.message_count == 0
+        assert memory_broker.stats["unroutable"] == unroutable
+    finally:
+        await broker.disconnect()
+
+async def test_replay_keeps_dead_letters_it_cannot_route(broker):
+    await broker.subscribe(EventRouter({"order.created": lambda event: None}))
+    channel = await broker.connection.channel()
+    dead_letters = await channel.get_exchange(message_broker.DEAD_LETTER_EXCHANGE)
+    # No original routing key header and a body without an envelope
+    await dead_letters.publish(Message(b"not an event"), routing_key=broker.queue_name)
+
+    assert await broker.replay_dead_letters() == 0
+    assert memory_broker.queues[dead_letter_queue_name(broker.queue_name)].message_count == 1
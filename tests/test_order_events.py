@@ -0,0 +1,45 @@
+"""order-service status changes and the outbox"""
+import os
+import sys
+
+import pytest
+from sqlalchemy import select
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'order-service'))
+
+from models.order import Order
+from services.event_handlers import handle_order_accepted
+from services.order_service import OrderService
+from shared.database import AsyncSessionLocal
+from shared.models import OrderStatus
+from shared.outbox import OutboxEvent
+
+pytestmark = pytest.mark.anyio
+
+async def new_order() -> int:
+    async with AsyncSessionLocal() as db:
+        order = Order(customer_id=1, restaurant_id=2, total_amount=10.0, status=OrderStatus.CONFIRMED.value)
+        db.add(order)
+        await db.commit()
+        return order.id
+
+async def outbox_event_types(order_id: int):
+    async with AsyncSessionLocal() as db:
+        return (await db.execute(select(OutboxEvent.event_type).filter(
+            OutboxEvent.aggregate_id == str(order_id)
+        ))).scalars().all()
+
+async def test_route_status_change_writes_an_event():
+    order_id = await new_order()
+    async with AsyncSessionLocal() as db:
+        await OrderService().update_order_status(db, order_id, OrderStatus.ACCEPTED)
+
+    assert await outbox_event_types(order_id) == ["order.accepted"]
+
+async def test_handler_status_change_writes_no_event():
+    order_id = await new_order()
+    await handle_order_accepted({"event_type": "order.accepted", "data": {"order_id": order_id}})
+
+    async with AsyncSessionLocal() as db:
+        assert (await db.get(Order, order_id)).status == OrderStatus.ACCEPTED.value
+    assert await outbox_event_types(order_id) == []
@@ -0,0 +1,18 @@
+"""count_rows' planner-estimate query keeps the select's parameters bound"""
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.dialects.postgresql import asyncpg
+
+from shared.database import User
+from shared.pagination import Explain
+
+def test_explain_keeps_parameters_bound():
+    name = "o'clock :not_a_param"
+    query = select(User).filter(User.name == name, User.id > 5)
+
+    compiled = Explain(query).compile(dialect=postgresql.dialect())
+    assert str(compiled).startswith("EXPLAIN (FORMAT JSON) SELECT")
+    assert name not in str(compiled)
+    assert sorted(compiled.params.values(), key=str) == [5, name]
+
+    assert "users.name = $1::VARCHAR" in str(Explain(query).compile(dialect=asyncpg.dialect()))